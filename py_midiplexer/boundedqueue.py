@@ -0,0 +1,101 @@
+from py_midiplexer import exceptions
+import multiprocessing
+import queue
+
+POLICIES = ('drop_oldest', 'drop_newest', 'coalesce')
+
+def identity(item):
+    return item
+
+def signal_key(item):
+    """
+    coalesce signal_queue items by (controller, signal).
+    """
+    return item[:2]
+
+def event_key(item):
+    """
+    coalesce event_queue items by (tracklist, desired_state, quantize).
+    """
+    tracklist, desired_state, quantize = item
+    # a single label stays a string, so it never matches a list of its characters.
+    return (tracklist if tracklist is None or isinstance(tracklist, str) else tuple(tracklist), desired_state, quantize)
+
+class BoundedQueue(object):
+    """
+    multiprocessing.Queue with a size limit and a policy for what to do when it's full, so a stalled consumer can't
+    grow memory without bound or have stale triggers replayed seconds later.
+      drop_oldest: throw away the oldest pending item to make room.
+      drop_newest: throw away the item being put.
+      coalesce: collapse pending items with the same key, keeping the newest of each, in the order they first
+                appeared.
+    Every overflow is counted in the shared overflows value regardless of policy. Without a key, coalesced items
+    must be hashable.
+    """
+    def __init__(self, maxsize=1024, policy='drop_oldest', key=None):
+        if policy not in POLICIES:
+            raise exceptions.InvalidQueuePolicy(policy)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key if key is not None else identity
+        self.queue = multiprocessing.Queue(maxsize)
+        self.overflows = multiprocessing.Value('L', 0)
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+        with self.overflows.get_lock():
+            self.overflows.value += 1
+        if self.policy == 'drop_newest':
+            return
+        if self.policy == 'coalesce':
+            self.coalesce(item)
+            return
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            # the consumer got there first.
+            pass
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            pass
+
+    def coalesce(self, item):
+        pending = []
+        while True:
+            try:
+                pending.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        pending.append(item)
+        latest = {}
+        for p in pending:
+            # re-assigning an existing key keeps its original position.
+            latest[self.key(p)] = p
+        for p in latest.values():
+            try:
+                self.queue.put_nowait(p)
+            except queue.Full:
+                break
+
+    def get(self, *args, **kwargs):
+        return self.queue.get(*args, **kwargs)
+
+    def get_nowait(self):
+        return self.queue.get_nowait()
+
+    def empty(self):
+        return self.queue.empty()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def close(self):
+        self.queue.close()
+
+    def get_config_dict(self):
+        return {"maxsize": self.maxsize, "policy": self.policy}
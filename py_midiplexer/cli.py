@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+
+def use_fork():
+    """
+    Every process gets its queues, shared memory and config by inheriting them across fork(); nothing is pickled. Pin
+    the fork start method before any of them are made, so a platform that defaults to spawn or forkserver can't break
+    that, and stop right away where there's no fork.
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise SystemExit("py_midiplexer needs the fork start method, which this platform doesn't have.")
+    multiprocessing.set_start_method('fork', force=True)
+
+def add_options(parser):
+    """
+    the command line options for running a midiplexer, shared by the shell and headless mode.
+    """
+    parser.add_argument(
+        "--config", "-c", default=os.environ['HOME']+"/.config/py-midiplexer/config.json", type=str, help="Configuration File"
+    )
+    parser.add_argument(
+        "--metrics", "-m", default=os.environ['HOME']+"/.cache/py-midiplexer/metrics.prom", type=str,
+        help="Prometheus text file the metrics process writes to"
+    )
+    add_realtime_options(parser)
+
+def add_realtime_options(parser):
+    """
+    the scheduling options, also used by the node.
+    """
+    parser.add_argument(
+        "--cpus", default=None, type=str,
+        help="Comma-separated cpus to pin the midiplexer, controller and client processes to"
+    )
+    parser.add_argument(
+        "--rt-policy", default=None, choices=["other", "fifo", "rr"],
+        help="Scheduling policy for the midiplexer, controller and client processes"
+    )
+    parser.add_argument(
+        "--rt-priority", default=None, type=int, help="Priority for the fifo and rr policies, 1-99"
+    )
+    parser.add_argument(
+        "--mlock", action="store_true", help="Lock the memory of the midiplexer, controller and client processes"
+    )
+    parser.add_argument(
+        "--gc-disable", action="store_true",
+        help="Turn off the cyclic garbage collector in the midiplexer, controller and client processes"
+    )
+
+def realtime_defaults(args):
+    """
+    realtime options from the command line. the config file's "realtime" section can refine them per process.
+    """
+    options = {}
+    if args.cpus:
+        options['cpus'] = [int(cpu) for cpu in args.cpus.split(',')]
+    if args.rt_policy is not None:
+        options['policy'] = args.rt_policy
+    if args.rt_priority is not None:
+        options['priority'] = args.rt_priority
+    if args.mlock:
+        options['mlock'] = True
+    if args.gc_disable:
+        options['gc_disable'] = True
+    return options
@@ -1,29 +1,81 @@
 import multiprocessing
-from py_midiplexer.track import MidiTrack
+from py_midiplexer.track import MidiTrack, ClockTrack, OscTrack
+from py_midiplexer.osc import OscPort
+from py_midiplexer.node import NodeLink, NodeOutputPort, LinkStats
+from py_midiplexer.profiling import Profiler
+from py_midiplexer import metrics
+from py_midiplexer.tracing import Tracer, TracedPort
+from py_midiplexer.recording import RecordingPort
+from py_midiplexer.boundedqueue import BoundedQueue, event_key
+from py_midiplexer import curves
+from py_midiplexer.output import PacedPort
+from py_midiplexer import realtime
 from py_midiplexer import exceptions
 import logging
+import heapq
+import gc
 import queue
 import time
 
+def continuous_key(item):
+    return item[0]
+
 class Client(multiprocessing.Process):
     """
     A client represents one of the programs we're controlling. All clients have a name and a list of tracks.
     Name is a string.
     Each track is a Track object.
     """
-    def __init__(self, shutdown_callback, stdout_queue, name: str, tracks: list, toggle_record=False):
+    # a release later than this counts as missed.
+    RELEASE_LATE_NS = 1000000
+    # tracks past this many aren't published, so their state isn't restored after a crash.
+    TRACKSTATE_SIZE = 256
+
+    def __init__(self, shutdown_callback, stdout_queue, name: str, tracks: list, toggle_record=False, trace_trigger=None,
+                 record_queue=None, event_queue_options={}, output_options=None, timebase=None, realtime_options=None,
+                 trackstate=None):
         self.stdout_queue = stdout_queue
         self.shutdown_callback = shutdown_callback
         self.command_queue = multiprocessing.Queue()
-        self.event_queue = multiprocessing.Queue()
+        self.event_queue = BoundedQueue(key=event_key, **event_queue_options)
+        # (mapping label, raw value) from continuous mappings. coalescing keeps only the newest value per mapping if
+        # we fall behind.
+        self.continuous_queue = BoundedQueue(policy='coalesce', key=continuous_key)
         self.config_queue = multiprocessing.Queue()
-        self.trackstate_queue = multiprocessing.Queue()
         self.tracks = {}
         self.toggle_record=toggle_record
         super().__init__()
         self.type = None
         self.name = name
         self.logger = logging.getLogger(f'{self.__class__.__name__}:{self.name}')
+        self.profiler = Profiler('client', self.name)
+        self.counters = metrics.Counters()
+        self.tracer = Tracer(self.__class__.__name__, self.name, trigger=trace_trigger)
+        self.record_queue = record_queue
+        self.recording = False
+        # PacedPort settings, or None to send straight to the port.
+        self.output_options = output_options
+        self.paced_port = None
+        # see realtime.apply(). applied once the process is set up.
+        self.realtime_options = realtime_options if realtime_options is not None else {}
+        self.continuous_map = {}
+        self.continuous_routes = {}
+        self.pending_continuous = {}
+        # quantised events wait here for their boundary on the shared timebase. heap of (release ns, sequence,
+        # tracklist, desired_state); the sequence keeps events due at the same time in the order they arrived.
+        self.timebase = timebase
+        self.schedule = []
+        self.schedule_seq = 0
+        self.release_jitter = metrics.JitterStats('release')
+        # set every loop. see Supervisor.
+        self.heartbeat = multiprocessing.RawValue('d', 0)
+        # the last published state of each track, in self.tracks order: 0 if never published, otherwise 1 | playing << 1
+        # | toggle_record << 2. A replacement process restores from it. see adopt(). The MidiPlexer passes in a slot of
+        # its TrackStates so the shell can show it.
+        self.trackstate = trackstate if trackstate is not None else multiprocessing.RawArray('b', self.TRACKSTATE_SIZE)
+        self.trackstate_dirty = True
+        # set by the 'exit' command, when the client is removed on its own rather than at shutdown.
+        self.stopped = False
         for label, data in tracks.items():
             self.create_track(label, data)
 
@@ -33,6 +85,142 @@ class Client(multiprocessing.Process):
         """
         pass
 
+    def rename_track(self, old, new):
+        """
+        relabel a track, keeping its place in self.tracks so the published track state still lines up.
+        """
+        self.tracks = {new if label == old else label: track for label, track in self.tracks.items()}
+        self.tracks[new].label = new
+        self.trackstate_dirty = True
+
+    def publish_trackstate(self):
+        board = self.trackstate
+        for i, track in enumerate(self.tracks.values()):
+            if i == len(board):
+                break
+            board[i] = 1 | track.playing << 1 | track.toggle_record << 2
+        self.trackstate_dirty = False
+
+    def restore_trackstate(self):
+        board = self.trackstate
+        for i, track in enumerate(self.tracks.values()):
+            if i == len(board):
+                break
+            if board[i]:
+                track.playing = bool(board[i] & 2)
+                track.toggle_record = bool(board[i] & 4)
+
+    def playing_tracks(self):
+        """
+        labels of the tracks last published as playing. Reads only the trackstate board, so the MidiPlexer can ask its
+        copy of a client without waiting on the client process. Tracks that were never published count as stopped.
+        """
+        board = self.trackstate
+        return [label for i, label in enumerate(self.tracks) if i < len(board) and board[i] & 2]
+
+    def adopt(self, old):
+        """
+        Take over the queues and shared state of a client process that died, so that everything holding references to
+        them (controllers, the metrics process) carries on with this one, and pick up its track state. Call before
+        start().
+        """
+        for attr in ('command_queue', 'event_queue', 'continuous_queue', 'config_queue', 'counters', 'release_jitter',
+                     'heartbeat', 'trackstate'):
+            setattr(self, attr, getattr(old, attr))
+        self.heartbeat.value = 0
+        self.restore_trackstate()
+
+    def update_port(self):
+        """
+        rebuild the chain of port wrappers for whichever of tracing and recording are on. process_events sends to
+        active_port, so neither costs anything while off.
+        """
+        port = self.port if self.paced_port is None else self.paced_port
+        if self.recording:
+            port = RecordingPort(port, self.record_queue, self.name)
+        if self.tracer.enabled:
+            port = TracedPort(port, self.tracer)
+        self.active_port = port
+
+    def set_continuous_map(self, continuous_map: dict):
+        """
+        continuous_map is {mapping label: {"tracks": [track labels], "curve": curve, "input_size": n}}. Precompute a
+        lookup table from raw input value to output value for each target track so that routing a value is one index.
+        """
+        self.continuous_map = continuous_map
+        routes = {}
+        for label, mapping in continuous_map.items():
+            targets = []
+            for track_label in mapping['tracks']:
+                try:
+                    track = self.tracks[track_label]
+                except KeyError:
+                    self.logger.error("Continuous mapping %s: no track %s.", label, track_label)
+                    continue
+                size = track.value_size()
+                if size is None:
+                    self.logger.error("Continuous mapping %s: track %s has no value to set.", label, track_label)
+                    continue
+                try:
+                    lut = curves.build_lut(mapping['curve'], mapping['input_size'], size)
+                except exceptions.NoSuchCurve as e:
+                    self.logger.error(e.msg)
+                    continue
+                targets.append((track, lut))
+            routes[label] = tuple(targets)
+        self.continuous_routes = routes
+
+    def schedule_event(self, tracklist, desired_state, quantize):
+        """
+        hold an event until the next multiple of quantize beats. Returns False if there's no running clock to quantise
+        to, in which case the event should go out now.
+        """
+        if self.timebase is None:
+            return False
+        release_ns = self.timebase.next_boundary(time.monotonic_ns(), quantize)
+        if release_ns is None:
+            return False
+        heapq.heappush(self.schedule, (release_ns, self.schedule_seq, tracklist, desired_state))
+        self.schedule_seq += 1
+        self.counters.incr(metrics.EVENTS_SCHEDULED)
+        return True
+
+    def release_due(self):
+        """
+        apply every scheduled event whose time has come. Called every loop, so a release is at most one loop late.
+        """
+        schedule = self.schedule
+        if not schedule or schedule[0][0] > time.monotonic_ns():
+            return
+        port = self.active_port
+        while schedule and schedule[0][0] <= time.monotonic_ns():
+            release_ns, _, tracklist, desired_state = heapq.heappop(schedule)
+            late = time.monotonic_ns() - release_ns
+            self.release_jitter.record(late)
+            if late > self.RELEASE_LATE_NS:
+                self.release_jitter.miss()
+            self.apply_event(port, tracklist, desired_state)
+
+    def process_continuous(self):
+        """
+        drain the continuous queue, keeping only the newest value per mapping, then send once per mapping. Called once
+        per loop, so that's the output tick.
+        """
+        while True:
+            try:
+                label, value = self.continuous_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.pending_continuous[label] = value
+        if not self.pending_continuous:
+            return
+        port = self.active_port
+        for label, value in self.pending_continuous.items():
+            for track, lut in self.continuous_routes.get(label, ()):
+                track.send_value(port, lut[value])
+                self.counters.incr(metrics.MESSAGES_SENT)
+        self.pending_continuous.clear()
+
     def shutdown(self):
         try:
             self.port.close()
@@ -42,91 +230,98 @@ class Client(multiprocessing.Process):
         self.logger.info(f"Exiting.")
         
     def queue_config_dict(self):
-        self.config_queue.put({"name": self.name,
-                               "type": self.type,
-                               "tracks": {label: track.get_config_dict() for label, track in self.tracks.items()}})
+        self.config_queue.put(self.get_config_dict())
 
-    def queue_trackstate_playing(self):
-        """
-        puts a list of playing tracks on the trackstate_queue
-        """
-        self.trackstate_queue.put([label for label, track in self.tracks.items() if track.playing])
+    def get_config_dict(self):
+        conf = {"name": self.name,
+                "type": self.type,
+                "toggle_record": self.toggle_record,
+                "tracks": {label: track.get_config_dict() for label, track in self.tracks.items()}}
+        if self.output_options is not None:
+            conf.update({"output": self.output_options})
+        return conf
 
-class MidiClient(Client):
-    """
-    MidiClient defines an interface for jack midi clients.
-    """
-    def __init__(self,
-                 shutdown_callback,
-                 stdout_queue,
-                 name,
-                 tracks={},
-                 toggle_record=False,
-                 backend='mido.backends.rtmidi/UNIX_JACK'):
-        super().__init__(shutdown_callback, stdout_queue, name, tracks=tracks, toggle_record=toggle_record)
-        self.backend = backend
-        self.type = 'midi'
+    def get_metrics_source(self):
+        return metrics.MetricsSource(self.__class__.__name__, self.name, self.pid, self.counters,
+                                     {'event_queue': self.event_queue, 'continuous_queue': self.continuous_queue,
+                                      'command_queue': self.command_queue}, gauges=self.get_gauges)
 
-    def create_track(self, label, attrs):
-        attrs['toggle_record'] = self.toggle_record
-        self.logger.debug(f"Creating track {label}: {attrs}")
-        self.tracks.update({label: MidiTrack(label, attrs)})
-    
-    def trigger_track(self, label, scenemode):
-        # maybe this is deprecated
-        self.tracks[track].trigger(self.port, scenemode)
-        for l, track in self.tracks.items():
-            if l == label:
-                print(track.__dict__())
+    def get_gauges(self):
+        return self.release_jitter.get_dict()
 
     def list_tracks(self):
         self.stdout_queue.put(self.__dict__()["tracks"])
                 
+    def trigger(self, port, track, desired_state):
+        """
+        trigger a single track, counting and tracing the send.
+        """
+        t0 = self.tracer.begin()
+        if track.trigger(port, desired_state):
+            self.counters.incr(metrics.MESSAGES_SENT)
+        self.tracer.end('MidiTrack.trigger', t0)
+
+    def apply_event(self, port, tracklist, desired_state):
+        """
+        tracklist is None for all tracks, a list of track labels, or a single label. With a list, desired_state True
+        or False is a scene: every track not in the list gets the opposite. A single label is set (or toggled, with
+        None) on its own, and the other tracks are left as they are.
+        """
+        self.trackstate_dirty = True
+        # Queued tracklist of None is equivalent to "all"
+        tracks = self.tracks
+        if isinstance(tracklist, str):
+            try:
+                track = tracks[tracklist]
+            except KeyError:
+                raise exceptions.NoSuchTrack(self.name, tracklist)
+            self.logger.debug('Track %s desired state is %s.', tracklist, desired_state)
+            self.trigger(port, track, desired_state)
+            return
+        if tracklist is None:
+            self.logger.debug('All tracks desired state is off.')
+            for track in tracks.values():
+                self.trigger(port, track, False)
+            return
+        for label in tracklist:
+            if label not in tracks:
+                raise exceptions.NoSuchTrack(self.name, label)
+
+        self.logger.debug('Track %s desired state is %s.', tracklist, desired_state)
+        if desired_state is None:
+            # trigger mode
+            for label in tracklist:
+                self.trigger(port, tracks[label], desired_state)
+        else:
+            # trigger the tracks that are not playing whose desired state is on/playing.
+            # careful. desired_state=False implies all tracks not in the list should be on.
+            for label in tracklist:
+                tracks[label].in_event = True
+            try:
+                for label in tracklist:
+                    self.trigger(port, tracks[label], desired_state)
+                # opposite case. turn off the tracks that shouldn't be on.
+                for track in tracks.values():
+                    if not track.in_event:
+                        self.trigger(port, track, not desired_state)
+            finally:
+                # a send that raises mustn't leave tracks marked for the next event.
+                for label in tracklist:
+                    tracks[label].in_event = False
+
     def process_events(self):
+        port = self.active_port
         while True:
             try:
-                (tracklist, desired_state) = self.event_queue.get_nowait()
+                t0 = self.tracer.begin()
+                (tracklist, desired_state, quantize) = self.event_queue.get_nowait()
+                self.tracer.end('queue get', t0)
                 self.logger.debug('Received event.')
-
-                # list of track instances for event. Queued tracklist of None is equivalent to "all"
-                desired_state = False if tracklist is None else desired_state
-                try:
-                  tracklist = self.tracks.values() if tracklist is None else [self.tracks[track] for track in tracklist]
-                except KeyError as e:
-                    track_label, = e.args
-                    raise exceptions.NoSuchTrack(self.name, track_label)
-
-                self.logger.debug('Track '
-                                  f'{tracklist} desired state is '
-                                  f'{"on" if desired_state else "off"}'
-                                  f'{None if desired_state is None else ""}')
-                if desired_state is None:
-                    # trigger mode
-                    [track.trigger(self.port, desired_state) for track in tracklist]
-                else:
-                    # trigger the tracks that are not playing whose desired state is on/playing.
-                    # careful. desired_state=False implies all tracks not in the list should be on.
-                    [track.trigger(self.port, desired_state) for track in tracklist]
-                    # opposite case. turn off the tracks that shouldn't be on.
-                    [track.trigger(self.port, not desired_state)
-                     for track in self.tracks.values() if not track in tracklist]
-                    
-                continue
-                #don't do this stuff. let track.trigger() handle desired_state
-                if desired_state is None:
-                    # trigger mode
-                    [track.trigger(self.port, desired_state) for track in tracklist]
-                elif desired_state:
-                    # trigger the tracks that are not playing whose desired state is on/playing.
-                    [track.trigger(self.port, desired_state) for track in tracklist if track.playing is False]
-                    # opposite case. turn off the tracks that shouldn't be on.
-                    [track.trigger(self.port, desired_state)
-                     for track in self.tracks
-                     if not track in tracklist and track.playing is True]
-                else:
-                    # trigger tracks that are playing whose desired state is off.
-                    [track.trigger(self.port, desired_state) for track in tracklist if track.playing is True]
-                    
+                self.counters.incr(metrics.EVENTS_PROCESSED)
+                # quantize is a number of beats to wait for the next multiple of, or 0 to go out now.
+                if quantize and self.schedule_event(tracklist, desired_state, quantize):
+                    continue
+                self.apply_event(port, tracklist, desired_state)
 
             except queue.Empty:
                 break
@@ -139,37 +334,427 @@ class MidiClient(Client):
                     if c == 'create_track':
                         label, attrs = command['create_track']
                         self.create_track(label, attrs)
+                        self.trackstate_dirty = True
+                        # a continuous mapping may have been waiting for this track.
+                        self.set_continuous_map(self.continuous_map)
+                    if c == 'create_tracks':
+                        tracks, = command[c]
+                        for label, attrs in tracks.items():
+                            self.create_track(label, attrs)
+                        self.trackstate_dirty = True
+                        self.set_continuous_map(self.continuous_map)
+                    if c == 'rename_track':
+                        old, new = command[c]
+                        if old in self.tracks:
+                            self.rename_track(old, new)
+                    if c == 'exit':
+                        self.stopped = True
                     if c == 'list_tracks':
                         self.list_tracks()
                     if c == 'queue_config_dict':
                         self.queue_config_dict()
-                    if c == 'queue_trackstate_playing':
-                        self.queue_trackstate_playing()
                     if c == 'toggle_record':
                         track, = command[c]
                         try:
                             self.tracks[track].toggle_record = True
                             self.tracks[track].playing = False
+                            self.trackstate_dirty = True
                         except KeyError:
                             pass
+                    if c == 'profile':
+                        seconds, outdir = command[c]
+                        self.profiler.start(seconds, outdir)
+                    if c == 'trace':
+                        enabled, threshold_ms = command[c]
+                        self.tracer.configure(enabled, threshold_ms)
+                        self.update_port()
+                    if c == 'trace_dump':
+                        outdir, = command[c]
+                        self.tracer.dump(outdir)
+                    if c == 'record':
+                        self.recording, = command[c]
+                        self.update_port()
+                    if c == 'continuous_map':
+                        continuous_map, = command[c]
+                        self.set_continuous_map(continuous_map)
                         
             except queue.Empty:
                 break
 
-        
+    def open_ports(self):
+        """
+        open this client's ports and set self.port. Called in the client process before the loop starts.
+        """
+        pass
+
+    def process_input(self):
+        """
+        read whatever the program we're controlling has sent back since the last loop.
+        """
+        pass
+
+    def flush_output(self):
+        if self.paced_port is not None:
+            self.paced_port.flush()
+
     def run(self):
+        self.open_ports()
+        self.update_port()
+        gc.freeze()
+        realtime.apply(self.realtime_options, self.logger)
+        self.logger.debug(f"Starting.")
+        while not (self.shutdown_callback.is_set() or self.stopped):
+            self.heartbeat.value = time.monotonic()
+            self.process_commands()
+            # before events, so they're applied to the state the client last reported.
+            self.process_input()
+            try:
+                self.process_events()
+                self.release_due()
+            except exceptions.NoSuchTrack as e:
+                self.logger.error(f"Track not found: {e.track_label}.")
+            self.process_continuous()
+            self.flush_output()
+            if self.trackstate_dirty:
+                self.publish_trackstate()
+            self.profiler.check()
+
+        self.shutdown()
+
+class MidiClient(Client):
+    """
+    MidiClient defines an interface for jack midi clients.
+    With feedback_options, the client also opens an input port (named by 'port', default "<name> feedback") for the
+    program to report track state on, e.g. Luppp's grid state output. Tracks list the messages that mean they're
+    playing or stopped, and track state follows them, so scene changes only send what's actually needed.
+    """
+    def __init__(self,
+                 shutdown_callback,
+                 stdout_queue,
+                 name,
+                 tracks={},
+                 toggle_record=False,
+                 backend='mido.backends.rtmidi/UNIX_JACK',
+                 trace_trigger=None,
+                 record_queue=None,
+                 event_queue_options={},
+                 output_options=None,
+                 timebase=None,
+                 feedback_options=None,
+                 realtime_options=None,
+                 trackstate=None):
+        # {feedback message hex: (track, playing)}. filled in by create_track().
+        self.feedback_map = {}
+        self.feedback_options = feedback_options
+        self.feedback_port = None
+        super().__init__(shutdown_callback, stdout_queue, name, tracks=tracks, toggle_record=toggle_record,
+                         trace_trigger=trace_trigger, record_queue=record_queue, event_queue_options=event_queue_options,
+                         output_options=output_options, timebase=timebase, realtime_options=realtime_options,
+                         trackstate=trackstate)
+        self.backend = backend
+        self.type = 'midi'
+
+    def create_track(self, label, attrs):
+        attrs['toggle_record'] = self.toggle_record
+        self.logger.debug(f"Creating track {label}: {attrs}")
+        track = MidiTrack(label, attrs)
+        self.tracks.update({label: track})
+        # a replaced track takes its feedback with it.
+        self.feedback_map = {key: v for key, v in self.feedback_map.items() if v[0].label != label}
+        for state, keys in track.feedback.items():
+            for key in keys:
+                self.feedback_map[key.upper()] = (track, state == 'playing')
+
+    def get_config_dict(self):
+        conf = super().get_config_dict()
+        if self.feedback_options is not None:
+            conf.update({"feedback": self.feedback_options})
+        return conf
+
+    def process_feedback(self):
+        """
+        apply whatever state the client has reported since the last loop. Unknown messages are ignored.
+        """
+        for msg in self.feedback_port.iter_pending():
+            key = msg.hex()
+            self.counters.incr(metrics.FEEDBACK_RECEIVED)
+            try:
+                track, playing = self.feedback_map[key]
+            except KeyError:
+                continue
+            if track.playing is not playing:
+                self.logger.debug('Feedback "%s": track %s is %s.', key, track.label,
+                                  'playing' if playing else 'not playing')
+                self.counters.incr(metrics.FEEDBACK_CORRECTIONS)
+                track.playing = playing
+                self.trackstate_dirty = True
+
+    def shutdown(self):
+        if self.feedback_port is not None:
+            self.feedback_port.close()
+        super().shutdown()
+    
+    def trigger_track(self, label, scenemode):
+        # maybe this is deprecated
+        self.tracks[track].trigger(self.port, scenemode)
+        for l, track in self.tracks.items():
+            if l == label:
+                print(track.__dict__())
+
+    def open_ports(self):
         #late import mido.
         import mido
         mido.set_backend(self.backend)
         
         self.port = mido.open_output(self.name, client_name="py_midiplexer")
+        if self.feedback_options is not None:
+            self.feedback_port = mido.open_input(self.feedback_options.get('port', f'{self.name} feedback'),
+                                                 client_name="py_midiplexer", virtual=True)
+        if self.output_options is not None:
+            self.paced_port = PacedPort(self.port, counters=self.counters, **self.output_options)
+
+    def process_input(self):
+        if self.feedback_port is not None:
+            self.process_feedback()
+
+class OscClient(Client):
+    """
+    A client for programs that take OSC over UDP, e.g. Luppp, Carla or Ardour. Tracks are OscTracks.
+    osc options: host (default 127.0.0.1), port.
+    Everything one event sends goes out as a single bundle, so a scene change is one packet instead of one per track,
+    and the program gets it all at once. Continuous values are bundled per loop the same way.
+    """
+    def __init__(self, shutdown_callback, stdout_queue, name, osc=None, **kwargs):
+        self.osc_options = osc if osc is not None else {}
+        self.osc_port = None
+        super().__init__(shutdown_callback, stdout_queue, name, **kwargs)
+        self.type = 'osc'
+
+    def create_track(self, label, attrs):
+        attrs['toggle_record'] = self.toggle_record
+        self.logger.debug(f"Creating track {label}: {attrs}")
+        self.tracks.update({label: OscTrack(label, attrs)})
+
+    def get_config_dict(self):
+        conf = super().get_config_dict()
+        conf.update({"osc": self.osc_options})
+        return conf
+
+    def open_ports(self):
+        self.port = self.osc_port = OscPort(self.osc_options.get('host', '127.0.0.1'), self.osc_options['port'],
+                                            counters=self.counters)
+        if self.output_options is not None:
+            # PacedPort paces a midi wire. UDP has nothing like it to protect.
+            self.logger.warning("output options are for midi clients; ignoring them.")
+
+    def apply_event(self, port, tracklist, desired_state):
+        self.osc_port.begin_bundle()
+        try:
+            super().apply_event(port, tracklist, desired_state)
+        finally:
+            self.osc_port.end_bundle()
+
+    def process_continuous(self):
+        self.osc_port.begin_bundle()
+        try:
+            super().process_continuous()
+        finally:
+            self.osc_port.end_bundle()
+
+class NodeClient(MidiClient):
+    """
+    A midi client whose port is on another machine, hosted by py-midiplexer-node. Routing, scheduling and track state
+    all stay here; the node only gets the messages to send. Everything one event sends reaches the node as one
+    record. Continuous values and paced output are bundled per loop the same way.
+    node options: host, port (the node's udp port for this output).
+    """
+    def __init__(self, shutdown_callback, stdout_queue, name, node=None, **kwargs):
+        self.node_options = node if node is not None else {}
+        self.node_port = None
+        self.link_stats = LinkStats()
+        super().__init__(shutdown_callback, stdout_queue, name, **kwargs)
+        self.type = 'node'
+
+    def get_config_dict(self):
+        conf = super().get_config_dict()
+        conf.update({"node": self.node_options})
+        return conf
+
+    def adopt(self, old):
+        super().adopt(old)
+        self.link_stats = old.link_stats
+
+    def get_gauges(self):
+        gauges = super().get_gauges()
+        gauges.update(self.link_stats.get_dict())
+        return gauges
+
+    def open_ports(self):
+        link = NodeLink(self.node_options.get('host', '127.0.0.1'), self.node_options['port'], self.link_stats,
+                        self.logger)
+        self.port = self.node_port = NodeOutputPort(link)
+        if self.output_options is not None:
+            self.paced_port = PacedPort(self.port, counters=self.counters, **self.output_options)
+
+    def process_input(self):
+        self.node_port.service()
+
+    def apply_event(self, port, tracklist, desired_state):
+        self.node_port.begin_bundle()
+        try:
+            super().apply_event(port, tracklist, desired_state)
+        finally:
+            self.node_port.end_bundle()
+
+    def process_continuous(self):
+        self.node_port.begin_bundle()
+        try:
+            super().process_continuous()
+        finally:
+            self.node_port.end_bundle()
+
+    def flush_output(self):
+        self.node_port.begin_bundle()
+        try:
+            super().flush_output()
+        finally:
+            self.node_port.end_bundle()
+
+class MidiClockClient(MidiClient):
+    """
+    Generates a steady midi clock on its own port. The run loop is the timing loop: it sleeps to an absolute deadline
+    for each tick, busy-waits the last spin_us microseconds, and only handles commands and events when there's slack
+    before the next tick. Tracks are ClockTracks: a 'run' track starts and stops the clock, 'tempo' tracks change
+    the tempo.
+    clock options: bpm, ppqn (default 24), spin_us (default 300; 0 to never busy-wait), timebase (default true;
+    whether quantised triggers follow this clock. Only one clock should).
+    """
+    # don't start housekeeping with less than this much time before the spin window.
+    SLACK_NS = 2000000
+
+    def __init__(self, shutdown_callback, stdout_queue, name, clock=None, **kwargs):
+        clock = clock if clock is not None else {}
+        self.bpm = clock.get('bpm', 120)
+        self.ppqn = clock.get('ppqn', 24)
+        self.spin_us = clock.get('spin_us', 300)
+        self.drive_timebase = clock.get('timebase', True)
+        self.running = False
+        self.next_tick = 0
+        self.ticks = 0
+        self.jitter = metrics.JitterStats()
+        import mido
+        # built here rather than in run(), so the clock works on any port it's given, e.g. replay's MemoryPort.
+        self.clock_msg = mido.Message('clock')
+        self.start_msg = mido.Message('start')
+        self.stop_msg = mido.Message('stop')
+        super().__init__(shutdown_callback, stdout_queue, name, **kwargs)
+        self.type = 'clock'
+        if self.output_options is not None:
+            # a pacer would hold start and stop back behind the ticks they belong in front of.
+            self.logger.warning("Clock clients don't pace their output. Ignoring output options.")
+            self.output_options = None
+        self.set_tempo(self.bpm)
+
+    def create_track(self, label, attrs):
+        self.logger.debug(f"Creating track {label}: {attrs}")
+        self.tracks.update({label: ClockTrack(label, attrs, self)})
+
+    def get_config_dict(self):
+        conf = super().get_config_dict()
+        conf.update({"clock": {"bpm": self.bpm, "ppqn": self.ppqn, "spin_us": self.spin_us,
+                               "timebase": self.drive_timebase}})
+        return conf
+
+    def get_gauges(self):
+        gauges = super().get_gauges()
+        gauges.update(self.jitter.get_dict())
+        return gauges
+
+    def adopt(self, old):
+        super().adopt(old)
+        self.jitter = old.jitter
+
+    def set_tempo(self, bpm):
+        # keep it to something a synth will follow.
+        self.bpm = min(300, max(20, bpm))
+        self.interval_ns = round(60e9 / (self.bpm * self.ppqn))
+        self.logger.info("Tempo %s bpm.", self.bpm)
+
+    def start_clock(self):
+        self.active_port.send(self.start_msg)
+        self.running = True
+        # the first clock after start is the downbeat.
+        self.next_tick = time.monotonic_ns()
+        self.ticks = 0
+
+    def stop_clock(self):
+        self.running = False
+        self.active_port.send(self.stop_msg)
+        if self.drive_timebase and self.timebase is not None:
+            self.timebase.stop()
+        self.logger.info("Clock stopped. %s", self.jitter.get_dict())
+
+    def tick(self):
+        now = time.monotonic_ns()
+        # straight to the port, not active_port: ticks aren't recorded, since replay doesn't run the timing loop and
+        # could never match them, and aren't traced, which would cost a span per tick. There's no pacer to bypass.
+        self.port.send(self.clock_msg)
+        self.jitter.record(now - self.next_tick)
+        if self.drive_timebase and self.timebase is not None:
+            # publish the ideal tick time, not when we got round to it, so the grid doesn't pick up our jitter.
+            self.timebase.update(self.next_tick, self.ticks / self.ppqn, self.interval_ns * self.ppqn)
+        self.ticks += 1
+        self.next_tick += self.interval_ns
+        if now - self.next_tick > self.interval_ns:
+            # more than a tick behind. skip ahead instead of bursting clocks to catch up.
+            self.jitter.miss()
+            self.next_tick = now + self.interval_ns
+
+    def housekeeping(self):
+        self.heartbeat.value = time.monotonic()
+        self.process_commands()
+        try:
+            self.process_events()
+            self.release_due()
+        except exceptions.NoSuchTrack as e:
+            self.logger.error(f"Track not found: {e.track_label}.")
+        if self.trackstate_dirty:
+            self.publish_trackstate()
+        self.profiler.check()
+
+    def run(self):
+        import mido
+        mido.set_backend(self.backend)
+
+        self.port = mido.open_output(self.name, client_name="py_midiplexer")
+        self.update_port()
+        gc.freeze()
+        realtime.apply(self.realtime_options, self.logger)
+        spin_ns = int(self.spin_us * 1000)
         self.logger.debug(f"Starting.")
-        while not self.shutdown_callback.is_set():
-            self.process_commands()
+        # a replacement for a clock that died while running picks up where it left off.
+        if any(track.typ == 'run' and track.playing for track in self.tracks.values()):
+            self.start_clock()
+        while not (self.shutdown_callback.is_set() or self.stopped):
+            if not self.running:
+                self.housekeeping()
+                time.sleep(0.001)
+                continue
+            if self.next_tick - time.monotonic_ns() > spin_ns + self.SLACK_NS:
+                self.housekeeping()
+                remaining = self.next_tick - time.monotonic_ns() - spin_ns
+                if remaining > 0:
+                    time.sleep(remaining / 1e9)
+                # housekeeping may have stopped the clock.
+                if not self.running:
+                    continue
+            while time.monotonic_ns() < self.next_tick:
+                pass
+            self.tick()
+            # quantised events land on ticks. send them right behind the tick rather than at the next housekeeping.
             try:
-                self.process_events()
+                self.release_due()
             except exceptions.NoSuchTrack as e:
                 self.logger.error(f"Track not found: {e.track_label}.")
-                
 
         self.shutdown()
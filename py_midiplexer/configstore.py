@@ -0,0 +1,69 @@
+import multiprocessing
+import logging
+import json
+
+class ConfigStore(object):
+    """
+    A dict in shared memory, so any process can read it without a round trip through the MidiPlexer: its config, as
+    get_config_dict() would return it, and its status. The MidiPlexer process is the only writer. Each publish writes
+    a whole new snapshot and bumps the generation; readers never see a snapshot change under them, and only parse one
+    when the generation has moved on. Reads and writes go through a sequence counter like Timebase's.
+    Create it before anything that reads it is forked.
+    """
+    SEQ = 0
+    GENERATION = 1
+    LENGTH = 2
+    CAPACITY = 4 * 1024 * 1024
+    # how many times read() looks for a stable snapshot before giving up on a writer that died mid-publish.
+    RETRIES = 100000
+
+    def __init__(self, capacity=CAPACITY):
+        self.header = multiprocessing.RawArray('q', 3)
+        self.data = multiprocessing.RawArray('c', capacity)
+        # each process's last parsed snapshot and its generation.
+        self.cached = None
+        self.cached_generation = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def generation(self) -> int:
+        return self.header[self.GENERATION]
+
+    def publish(self, conf: dict) -> bool:
+        blob = json.dumps(conf).encode()
+        if len(blob) > len(self.data):
+            self.logger.error("Config is %d bytes; the store only holds %d. Readers keep generation %d.",
+                              len(blob), len(self.data), self.generation)
+            return False
+        h = self.header
+        h[self.SEQ] += 1
+        self.data[:len(blob)] = blob
+        h[self.LENGTH] = len(blob)
+        h[self.GENERATION] += 1
+        h[self.SEQ] += 1
+        return True
+
+    def read(self) -> dict:
+        """
+        the latest snapshot, or None if nothing has been published yet. Shared between callers in this process until
+        the next generation, so don't modify it. If no stable snapshot turns up in RETRIES tries, this process's last
+        one is returned.
+        """
+        h = self.header
+        for _ in range(self.RETRIES):
+            seq = h[self.SEQ]
+            if seq % 2:
+                continue
+            generation = h[self.GENERATION]
+            if generation == self.cached_generation:
+                return self.cached
+            blob = self.data[:h[self.LENGTH]]
+            if h[self.SEQ] == seq:
+                break
+        else:
+            self.logger.warning("No stable snapshot after %d tries. Keeping generation %d.", self.RETRIES,
+                                self.cached_generation)
+            return self.cached
+        self.cached = json.loads(blob)
+        self.cached_generation = generation
+        return self.cached
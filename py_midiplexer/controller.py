@@ -1,21 +1,48 @@
 import multiprocessing
+from py_midiplexer.profiling import Profiler
+from py_midiplexer import metrics
+from py_midiplexer.tracing import Tracer
+from py_midiplexer.mode import Mode
+from py_midiplexer.timebase import ClockFollower
+from py_midiplexer.gestures import GestureEngine
+from py_midiplexer.debounce import Debouncer
+from py_midiplexer import realtime
+from py_midiplexer import osc
+from py_midiplexer.node import NodeLink, NodeInputPort, LinkStats
 import queue
+import collections
+import socket
+import struct
 import logging
+import gc
 import time
 
+def continuous_input_key(typ, channel, control=0):
+    """
+    what a continuous mapping listens for: a cc number on a channel, or a channel's pitchwheel.
+    """
+    return (typ, channel, control if typ == 'control_change' else 0)
+
 class Controller(multiprocessing.Process):
     """
-    Generic controller superclass. Only midi is implemented for now, but who knows? Maybe there will be something else.
+    Generic controller superclass. There are midi and OSC controllers; who knows what else there will be.
     All controllers can register new signal mappings, and modify or delete existing ones.
     Subclasses will establish their communication mechanism, e.g. jack midi, osc, REST, et c. and therefore will define the
     behavior for the listen method.
     All controllers have a name and a signal list. The signal's list index should be returned when a signal is 
     """
-    def __init__(self, shutdown_callback, signal_queue, stdout_queue, name: str, signal_map: dict={}):
+    def __init__(self, shutdown_callback, signal_queue, stdout_queue, name: str, signal_map: dict={}, trace_trigger=None,
+                 event_queues=None, shared_mode=None, continuous_queues=None, timebase=None, clock_source=False,
+                 realtime_options=None, gestures=None, debounce=None):
         self.signal_queue = signal_queue
         self.stdout_queue = stdout_queue
         self.command_queue = multiprocessing.Queue()
         self.config_queue = multiprocessing.Queue()
+        # changes this process makes to its own config, e.g. a newly registered signal, so the MidiPlexer's copy stays
+        # current for a restart.
+        self.state_queue = multiprocessing.Queue()
+        # set every loop. see Supervisor.
+        self.heartbeat = multiprocessing.RawValue('d', 0)
         self.shutdown_callback = shutdown_callback
         self.check_lock = multiprocessing.Lock()
         self.type = None
@@ -23,6 +50,32 @@ class Controller(multiprocessing.Process):
         super().__init__()
         self.name = name
         self.logger = logging.getLogger(f'{self.__class__.__name__}:{self.name}')
+        self.profiler = Profiler('controller', self.name)
+        self.counters = metrics.Counters()
+        self.tracer = Tracer(self.__class__.__name__, self.name, trigger=trace_trigger)
+        # fast path. event_queues is {client name: event_queue} for the clients that existed when this controller was
+        # created, shared_mode is the MidiPlexer's multiprocessing.Value holding the current Mode value. Without both,
+        # every signal goes through the MidiPlexer.
+        self.event_queues = event_queues if event_queues is not None else {}
+        self.shared_mode = shared_mode
+        self.fast_routes = {}
+        self.fast_mode_switch = ()
+        # continuous mappings always go straight to the clients. {client name: continuous_queue}
+        self.continuous_queues = continuous_queues if continuous_queues is not None else {}
+        self.continuous_routes = {}
+        self.pending_continuous = {}
+        # a clock source controller drives the shared timebase from the midi clock it receives.
+        self.clock_source = clock_source
+        self.clock_follower = ClockFollower(timebase) if clock_source and timebase is not None else None
+        # see realtime.apply(). applied once the process is set up.
+        self.realtime_options = realtime_options if realtime_options is not None else {}
+        # tap, double tap, hold and chord signals derived from the raw ones. see GestureEngine.
+        self.gesture_options = gestures
+        self.tap_latency = metrics.JitterStats('tap')
+        self.gestures = GestureEngine(gestures, self.tap_latency, name) if gestures else None
+        # see Debouncer. applied in check(), before a message becomes a signal.
+        self.debounce_options = debounce
+        self.debouncer = Debouncer(**debounce) if debounce else None
 
     def listen(self):
         """
@@ -37,9 +90,6 @@ class Controller(multiprocessing.Process):
     def register(self):
         pass
 
-    def run(self):
-        pass
-    
     def shutdown(self):
         try:
             self.port.close()
@@ -49,7 +99,239 @@ class Controller(multiprocessing.Process):
         self.logger.info(f"Exiting.")
         
     def queue_config_dict(self):
-        self.config_queue.put({"name": self.name, "type": self.type, "signal_map": self.signal_map})
+        self.config_queue.put(self.get_config_dict())
+
+    def get_config_dict(self):
+        conf = {"name": self.name, "type": self.type, "signal_map": self.signal_map}
+        if self.clock_source:
+            conf.update({"clock_source": True})
+        if self.gesture_options:
+            conf.update({"gestures": self.gesture_options})
+        if self.debounce_options:
+            conf.update({"debounce": self.debounce_options})
+        return conf
+
+    def signal_labels(self) -> set:
+        """
+        every signal this controller can send: the signal map's, plus any derived by gestures.
+        """
+        labels = set(self.signal_map.values())
+        if self.gestures is not None:
+            labels |= self.gestures.signals()
+        return labels
+
+    def adopt(self, old):
+        """
+        Take over the queues and shared state of a controller process that died. Call before start().
+        """
+        for attr in ('command_queue', 'config_queue', 'state_queue', 'counters', 'heartbeat', 'tap_latency'):
+            setattr(self, attr, getattr(old, attr))
+        self.heartbeat.value = 0
+
+    def set_routes(self, trigger_map: dict, mode_switch, quantize=0):
+        """
+        Compile this controller's slice of the trigger map into prebuilt (event_queue, event) pairs. A signal is only
+        routed here if every client it maps to is one we hold an event queue for; anything else is left to the
+        MidiPlexer. quantize is baked into the events, so it's pushed again whenever it changes.
+        """
+        routes = {}
+        for signal, clients in trigger_map.items():
+            events = []
+            for client, tracks in clients.items():
+                if client not in self.event_queues:
+                    break
+                for track in tracks:
+                    # same event MidiPlexer.trigger_track() would put.
+                    events.append((self.event_queues[client], ([track], None, quantize)))
+            else:
+                routes[signal] = tuple(events)
+        self.fast_routes = routes
+        self.fast_mode_switch = tuple(mode_switch)
+        self.logger.debug("Routing %d of %d trigger signals directly.", len(routes), len(trigger_map))
+
+    def set_continuous_routes(self, continuous_map: dict):
+        """
+        continuous_map holds the continuous mappings whose controller is this one, as stored by the MidiPlexer.
+        Compiles them to {input key: ((continuous_queue, mapping label), ...)}.
+        """
+        routes = {}
+        for label, mapping in continuous_map.items():
+            inp = mapping['input']
+            key = continuous_input_key(inp['type'], inp.get('channel', 0), inp.get('control', 0))
+            targets = routes.setdefault(key, [])
+            for client in {target['client'] for target in mapping['targets']}:
+                try:
+                    target = (self.continuous_queues[client], label)
+                except KeyError:
+                    self.logger.warning("Continuous mapping %s: client %s was added after this controller. Skipping.",
+                                        label, client)
+                    continue
+                targets.append(target)
+        self.continuous_routes = {key: tuple(targets) for key, targets in routes.items()}
+
+    def queue_continuous(self, msg):
+        """
+        If msg belongs to a continuous mapping, remember its value until the end of this tick and return True.
+        Only the last value per input in a tick gets sent.
+        """
+        if msg.type == 'control_change':
+            key = ('control_change', msg.channel, msg.control)
+            value = msg.value
+        elif msg.type == 'pitchwheel':
+            key = ('pitchwheel', msg.channel, 0)
+            value = msg.pitch + 8192
+        else:
+            return False
+        if key not in self.continuous_routes:
+            return False
+        self.pending_continuous[key] = value
+        return True
+
+    def flush_continuous(self):
+        if not self.pending_continuous:
+            return
+        for key, value in self.pending_continuous.items():
+            for continuous_queue, label in self.continuous_routes[key]:
+                continuous_queue.put((label, value))
+        self.pending_continuous.clear()
+
+    def fast_route(self, signal):
+        """
+        Route a signal without the MidiPlexer hop if we can. Returns True if the signal was fully handled here. Mode
+        switches are applied here too, so a trigger right after a mode switch always sees the new mode.
+        """
+        if self.shared_mode is None:
+            return False
+        if signal in self.fast_mode_switch:
+            with self.shared_mode.get_lock():
+                self.shared_mode.value = Mode.SCENE.value if self.shared_mode.value == Mode.TRIGGER.value else Mode.TRIGGER.value
+            return True
+        if self.shared_mode.value != Mode.TRIGGER.value:
+            return False
+        try:
+            events = self.fast_routes[signal]
+        except KeyError:
+            return False
+        for event_queue, event in events:
+            event_queue.put(event)
+        return True
+
+    def lookup(self, key, transport='midi'):
+        """
+        count a received message and turn its key into a signal label through the debouncer and the signal map.
+        returns None if it's dropped or not mapped.
+        """
+        t0 = self.tracer.begin()
+        self.counters.incr(metrics.SIGNALS_RECEIVED)
+        debouncer = self.debouncer
+        if debouncer is not None:
+            now = time.monotonic_ns()
+            if debouncer.duplicate(key, now):
+                self.counters.incr(metrics.SIGNALS_DUPLICATE)
+                self.logger.debug('Dropped duplicate %s message "%s".', transport, key)
+                return None
+        try:
+            signal = self.signal_map[key]
+            if debouncer is not None and debouncer.bounce(signal, now):
+                self.counters.incr(metrics.SIGNALS_DEBOUNCED)
+                self.logger.debug('Dropped bounce of signal %s.', signal)
+                return None
+            self.logger.info('Received %s message "%s"; sending signal %s.', transport, key, signal)
+            self.tracer.end('controller receive', t0)
+            return signal
+        except KeyError:
+            self.counters.incr(metrics.SIGNALS_DROPPED)
+            self.logger.debug('Received %s message "%s". No entry in signal map.', transport, key)
+            return None
+
+    def process_commands(self):
+        """
+        Commands are passed to the controller daemon proccess by the PyMidiPlexer class after receiving events from the 
+        Cli (future api server? midi meta-controller? who knows?) via the command queue processed my this method.
+        All commands in the queue are processed before polling for midi signals by the run thread can resume.
+        """
+        while True: #eh? always process all the commands? Careful. This blocks signals.
+            try:
+                command = self.command_queue.get_nowait()
+                self.logger.debug(f"Received command {command}.")
+                for c, args in command.items():
+                    if c == 'register':
+                        self.register(args)
+                    if c == 'add_signals':
+                        signal_map, = args
+                        self.signal_map.update(signal_map)
+                    if c == 'queue_config_dict':
+                        self.queue_config_dict()
+                    if c == 'profile':
+                        seconds, outdir = args
+                        self.profiler.start(seconds, outdir)
+                    if c == 'trace':
+                        enabled, threshold_ms = args
+                        self.tracer.configure(enabled, threshold_ms)
+                    if c == 'trace_dump':
+                        outdir, = args
+                        self.tracer.dump(outdir)
+                    if c == 'routes':
+                        trigger_map, mode_switch, quantize = args
+                        self.set_routes(trigger_map, mode_switch, quantize)
+                    if c == 'continuous_routes':
+                        continuous_map, = args
+                        self.set_continuous_routes(continuous_map)
+                if self.command_queue.empty():
+                    break
+            except queue.Empty:
+                break
+
+    def process_signals(self):
+        signal = self.check()
+        self.flush_continuous()
+        if self.gestures is None:
+            if signal is not None:
+                self.send_signal(signal)
+            return
+        now = time.monotonic_ns()
+        # timers first, so a hold or tap that came due before this signal goes out before it.
+        for derived in self.gestures.poll(now):
+            self.send_signal(derived)
+        if signal is not None:
+            for derived in self.gestures.feed(signal, now):
+                self.send_signal(derived)
+
+    def send_signal(self, signal):
+        t0 = self.tracer.begin()
+        handled = self.fast_route(signal)
+        # the MidiPlexer hears about every signal. handled ones are only recorded and counted there.
+        self.signal_queue.put((self.name, signal, handled))
+        self.tracer.end('queue put', t0)
+
+    def open_port(self):
+        """
+        open this controller's input and set self.port. Called in the controller process before the loop starts.
+        """
+        pass
+
+    def run(self):
+        """
+        This is the entry point for the controller when running in daemon mode.
+        """
+        self.open_port()
+        gc.freeze()
+        realtime.apply(self.realtime_options, self.logger)
+        self.logger.debug(f"Starting.")
+        while not self.shutdown_callback.is_set():
+            self.heartbeat.value = time.monotonic()
+            self.process_commands()
+            self.process_signals()
+            self.profiler.check()
+        # after shutdown callback is set.
+        self.shutdown()
+
+    def get_metrics_source(self):
+        return metrics.MetricsSource(self.__class__.__name__, self.name, self.pid, self.counters,
+                                     {'command_queue': self.command_queue}, gauges=self.get_gauges)
+
+    def get_gauges(self):
+        return self.tap_latency.get_dict() if self.gestures is not None else {}
 
 class MidiController(Controller):
     def __init__(self,
@@ -58,8 +340,20 @@ class MidiController(Controller):
                  stdout_queue,
                  name: str,
                  signal_map: dict={},
-                 backend='mido.backends.rtmidi/UNIX_JACK'):
-        super().__init__(shutdown_callback, signal_queue, stdout_queue, name, signal_map)
+                 backend='mido.backends.rtmidi/UNIX_JACK',
+                 trace_trigger=None,
+                 event_queues=None,
+                 shared_mode=None,
+                 continuous_queues=None,
+                 timebase=None,
+                 clock_source=False,
+                 realtime_options=None,
+                 gestures=None,
+                 debounce=None):
+        super().__init__(shutdown_callback, signal_queue, stdout_queue, name, signal_map, trace_trigger=trace_trigger,
+                         event_queues=event_queues, shared_mode=shared_mode, continuous_queues=continuous_queues,
+                         timebase=timebase, clock_source=clock_source, realtime_options=realtime_options,
+                         gestures=gestures, debounce=debounce)
         self.type="midi"
         self.backend = backend
 
@@ -80,68 +374,140 @@ class MidiController(Controller):
         returns a signal label if a signal was received, or None otherwise.
         """
         time.sleep(0.008) #rate-limit polling. just a little faster than midi..
-        self.check_lock.acquire()
-        msg = self.port.poll()
-        self.check_lock.release()
+        while True:
+            self.check_lock.acquire()
+            msg = self.port.poll()
+            self.check_lock.release()
+            if msg is None:
+                break
+            # midi clock from a clock source feeds the timebase and is never a signal.
+            if self.clock_follower is not None and msg.type in ('clock', 'start', 'stop'):
+                self.clock_follower.handle(msg, time.monotonic_ns())
+                continue
+            # continuous streams are drained here and coalesced for flush_continuous(); they never become signals.
+            if not self.continuous_routes or not self.queue_continuous(msg):
+                break
 
         if msg is None:
             return None
-        else:
-            try:
-                signal = self.signal_map[msg.hex()]
-                self.logger.info(f'Received midi message "{msg.hex()}"; sending signal {signal}.')
-                return self.signal_map[msg.hex()]
-            except KeyError:
-                self.logger.debug(f'Received midi message "{msg.hex()}". No entry in signal map.')
-                return None
-    
+        return self.lookup(msg.hex())
 
     def register(self, signal=None):
         if signal is None:
             signal = len(self.signal_map)
         self.logger.warn(f'Pausing input to register signal {signal}.')
+        # waiting on the user, not hung.
+        self.heartbeat.value = 0
         self.check_lock.acquire()
         msg = self.port.receive()
         self.check_lock.release()
         self.logger.info(f'Registered midi signal "{msg.hex()}" with label {signal}.')
         self.signal_map.update({msg.hex(): signal})
+        self.state_queue.put({'signal_map': dict(self.signal_map)})
 
-    def process_commands(self):
-        """
-        Commands are passed to the controller daemon proccess by the PyMidiPlexer class after receiving events from the 
-        Cli (future api server? midi meta-controller? who knows?) via the command queue processed my this method.
-        All commands in the queue are processed before polling for midi signals by the run thread can resume.
-        """
-        while True: #eh? always process all the commands? Careful. This blocks signals.
-            try:
-                command = self.command_queue.get_nowait()
-                self.logger.debug(f"Received command {command}.")
-                for c, args in command.items():
-                    if c == 'register':
-                        self.register(args)
-                    if c == 'queue_config_dict':
-                        self.queue_config_dict()
-                if self.command_queue.empty():
-                    break
-            except queue.Empty:
-                break
-    def process_signals(self):
-        signal = self.check()
-        if signal is not None:
-            self.signal_queue.put((self.name, signal))
-        
-    def run(self):
-        """
-        This is the entry point for the controller when running in daemon mode.
-        """
+    def open_port(self):
         #late import. make sure everything related to the port is in this process.
         import mido
 
         mido.set_backend(self.backend)
         self.port = mido.open_input(self.name, client_name="py_midiplexer", virtual=True)
-        self.logger.debug(f"Starting.")
-        while not self.shutdown_callback.is_set():
-            self.process_commands()
-            self.process_signals()
-        # after shutdown callback is set.
-        self.shutdown()
+
+class NodeController(MidiController):
+    """
+    A midi controller whose port is on another machine, hosted by py-midiplexer-node. The node forwards the raw midi,
+    so signal maps, debouncing, gestures, continuous mappings and clock source all work as they do locally.
+    node options: host, port (the node's udp port for this input).
+    """
+    def __init__(self, shutdown_callback, signal_queue, stdout_queue, name: str, signal_map: dict={}, node=None,
+                 **kwargs):
+        self.node_options = node if node is not None else {}
+        self.link_stats = LinkStats()
+        super().__init__(shutdown_callback, signal_queue, stdout_queue, name, signal_map, **kwargs)
+        self.type = "node"
+
+    def get_config_dict(self):
+        conf = super().get_config_dict()
+        conf.update({"node": self.node_options})
+        return conf
+
+    def adopt(self, old):
+        super().adopt(old)
+        self.link_stats = old.link_stats
+
+    def get_gauges(self):
+        gauges = super().get_gauges()
+        gauges.update(self.link_stats.get_dict())
+        return gauges
+
+    def open_port(self):
+        link = NodeLink(self.node_options.get('host', '127.0.0.1'), self.node_options['port'], self.link_stats,
+                        self.logger)
+        self.port = NodeInputPort(link)
+
+class OscController(Controller):
+    """
+    Listens for OSC over UDP, e.g. from TouchOSC or Open Stage Control. Signal map keys are the address and args,
+    space-separated, see osc.message_key(): {"/fcb/switch 1": "0"}. Bundles are taken apart in order.
+    osc options: host (default 0.0.0.0), port.
+    Continuous mappings and clock source are midi only.
+    """
+    def __init__(self, shutdown_callback, signal_queue, stdout_queue, name: str, signal_map: dict={}, osc=None,
+                 **kwargs):
+        super().__init__(shutdown_callback, signal_queue, stdout_queue, name, signal_map, **kwargs)
+        self.type = "osc"
+        self.osc_options = osc if osc is not None else {}
+        # decoded messages from the last packet that haven't been checked yet.
+        self.pending = collections.deque()
+
+    def get_config_dict(self):
+        conf = super().get_config_dict()
+        conf.update({"osc": self.osc_options})
+        return conf
+
+    def open_port(self):
+        self.port = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.port.bind((self.osc_options.get('host', '0.0.0.0'), self.osc_options['port']))
+        # waiting on the socket rate-limits polling like the midi controller's sleep, without the added latency.
+        self.port.settimeout(0.008)
+
+    def receive(self):
+        """
+        decode the next packet into pending. Returns False on timeout.
+        """
+        try:
+            packet = self.port.recv(65536)
+        except socket.timeout:
+            return False
+        try:
+            self.pending.extend(osc.decode(packet))
+        except (ValueError, IndexError, struct.error, UnicodeDecodeError):
+            self.counters.incr(metrics.SIGNALS_DROPPED)
+            self.logger.debug("Dropped a malformed OSC packet.")
+        return True
+
+    def check(self):
+        """
+        returns a signal label if a signal was received, or None otherwise.
+        """
+        if not self.pending:
+            with self.check_lock:
+                self.receive()
+            if not self.pending:
+                return None
+        return self.lookup(osc.message_key(*self.pending.popleft()), 'osc')
+
+    def register(self, signal=None):
+        if signal is None:
+            signal = len(self.signal_map)
+        self.logger.warn(f'Pausing input to register signal {signal}.')
+        # waiting on the user, not hung.
+        self.heartbeat.value = 0
+        with self.check_lock:
+            self.port.settimeout(None)
+            while not self.pending:
+                self.receive()
+            self.port.settimeout(0.008)
+        key = osc.message_key(*self.pending.popleft())
+        self.logger.info(f'Registered OSC signal "{key}" with label {signal}.')
+        self.signal_map.update({key: signal})
+        self.state_queue.put({'signal_map': dict(self.signal_map)})
@@ -0,0 +1,56 @@
+from py_midiplexer import exceptions
+import math
+
+# input and output resolutions. 7 bit for cc/aftertouch values, 14 bit for pitchwheel.
+SEVEN_BIT = 128
+FOURTEEN_BIT = 16384
+
+def linear(x):
+    return x
+
+def inverted(x):
+    return 1 - x
+
+def log(x):
+    # audio taper. rises fast then flattens.
+    return math.log10(1 + 9 * x)
+
+def exp(x):
+    # inverse of log. slow start, fast finish.
+    return (10 ** x - 1) / 9
+
+CURVES = {
+    'linear': linear,
+    'inverted': inverted,
+    'log': log,
+    'exp': exp,
+}
+
+def custom(points):
+    """
+    piecewise-linear curve through a list of [x, y] points, both normalized to 0-1.
+    """
+    points = sorted(points)
+    def curve(x):
+        if x <= points[0][0]:
+            return points[0][1]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            if x <= x1:
+                return y0 if x1 == x0 else y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+        return points[-1][1]
+    return curve
+
+def build_lut(curve, in_size: int, out_size: int) -> list:
+    """
+    Precompute curve for every possible input value. curve is the name of one of CURVES or a list of [x, y] points
+    for a custom curve. Returns a list of in_size output values in range(out_size).
+    """
+    if isinstance(curve, list):
+        f = custom(curve)
+    else:
+        try:
+            f = CURVES[curve]
+        except KeyError:
+            raise exceptions.NoSuchCurve(curve)
+    top = out_size - 1
+    return [min(top, max(0, round(f(i / (in_size - 1)) * top))) for i in range(in_size)]
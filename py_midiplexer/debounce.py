@@ -0,0 +1,34 @@
+class Debouncer(object):
+    """
+    Drops bounces and duplicates at a controller's input, before they cost any routing. Times are when the controller
+    polls the message, in monotonic nanoseconds. Both checks are a dict lookup and a compare.
+      duplicate_ms: the exact same message as the last one let through, within this long of it, is a duplicate.
+      window_ms: a signal within this long of the last time the same signal got through is a bounce.
+      signals: {signal label: window_ms} for signals that need a different window. 0 turns it off for that signal.
+    Anything left at 0 isn't checked.
+    """
+    def __init__(self, duplicate_ms=0, window_ms=0, signals=None):
+        self.duplicate_ns = int(duplicate_ms * 1000000)
+        self.window_ns = int(window_ms * 1000000)
+        self.windows = {label: int(ms * 1000000) for label, ms in (signals or {}).items()}
+        self.last_key = None
+        self.last_key_ns = 0
+        # signal: when it last got through
+        self.last_accepted = {}
+
+    def duplicate(self, key, now_ns) -> bool:
+        if key == self.last_key and now_ns - self.last_key_ns < self.duplicate_ns:
+            return True
+        self.last_key = key
+        self.last_key_ns = now_ns
+        return False
+
+    def bounce(self, signal, now_ns) -> bool:
+        window = self.windows.get(signal, self.window_ns)
+        if not window:
+            return False
+        last = self.last_accepted.get(signal)
+        if last is not None and now_ns - last < window:
+            return True
+        self.last_accepted[signal] = now_ns
+        return False
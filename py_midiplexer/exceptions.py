@@ -15,5 +15,30 @@ class NoSuchSignal(PyMidiPlexerException):
         self.msg = f"No signal matching label '{signal}' for controller '{controller}'."
         super().__init__()
         
+class NoSuchClient(PyMidiPlexerException):
+    def __init__(self, client):
+        self.msg = f"No client named '{client}'."
+        super().__init__()
+
+class NoSuchScene(PyMidiPlexerException):
+    def __init__(self, scene):
+        self.msg = f"No scene named '{scene}'."
+        super().__init__()
+
 class NothingToDo(PyMidiPlexerException):
     msg = "Nothing to do."
+
+class InvalidQueuePolicy(PyMidiPlexerException):
+    def __init__(self, policy):
+        self.msg = f"Unknown queue overflow policy '{policy}'."
+        super().__init__()
+
+class NoSuchCurve(PyMidiPlexerException):
+    def __init__(self, curve):
+        self.msg = f"No response curve named '{curve}'."
+        super().__init__()
+
+class InvalidQueuedEventPolicy(PyMidiPlexerException):
+    def __init__(self, policy):
+        self.msg = f"Unknown queued event policy '{policy}'. Use 'replay' or 'drop'."
+        super().__init__()
@@ -0,0 +1,211 @@
+import logging
+
+# switch states
+IDLE = 0
+PRESSED = 1
+HELD = 2
+# released once, waiting to see if a second press makes it a double tap.
+RELEASED = 3
+PRESSED_AGAIN = 4
+# pressed as part of a chord. the release is swallowed.
+CHORDED = 5
+
+class Switch(object):
+    """
+    One footswitch or pad, described by its press signal and, optionally, its release signal. Emits:
+      down: on every press, right away.
+      up: on every release, right away.
+      tap: a press and release that wasn't a hold or half of a double tap.
+      double_tap: a second press within double_tap_ms of the first release.
+      hold: still pressed hold_ms after the press. Needs a release signal.
+    Anything left out isn't emitted. A tap goes out as soon as it can't turn into anything else: on the press if
+    there's no hold or double tap, on the release if there's a hold, and double_tap_ms after the release if there's a
+    double tap.
+    """
+    def __init__(self, press, spec: dict):
+        self.press = press
+        self.release = spec.get('release')
+        self.down = spec.get('down')
+        self.up = spec.get('up')
+        self.tap = spec.get('tap')
+        self.double_tap = spec.get('double_tap')
+        self.hold = spec.get('hold') if self.release is not None else None
+        self.hold_ns = int(spec.get('hold_ms', 500) * 1000000)
+        self.double_tap_ns = int(spec.get('double_tap_ms', 250) * 1000000)
+        self.state = IDLE
+        self.press_ns = 0
+        # when the pending hold or double tap window runs out, or None.
+        self.deadline = None
+
+    def signals(self):
+        return {s for s in (self.down, self.up, self.tap, self.double_tap, self.hold) if s is not None}
+
+    def tapped(self, now_ns, out):
+        if self.double_tap is not None:
+            self.state = RELEASED
+            self.deadline = now_ns + self.double_tap_ns
+        else:
+            self.state = IDLE
+            self.emit_tap(out)
+
+    def emit_tap(self, out):
+        if self.tap is not None:
+            out.append((self.tap, self.press_ns))
+
+    def on_press(self, now_ns, out):
+        if self.state == RELEASED:
+            self.deadline = None
+            if self.down is not None:
+                out.append((self.down, None))
+            out.append((self.double_tap, None))
+            self.state = PRESSED_AGAIN if self.release is not None else IDLE
+            return
+        # a press while already pressed means the release got lost. start over.
+        self.press_ns = now_ns
+        if self.down is not None:
+            out.append((self.down, None))
+        if self.release is None or (self.hold is None and self.double_tap is None):
+            # nothing to wait for.
+            self.state = PRESSED if self.release is not None else IDLE
+            if self.double_tap is None:
+                self.emit_tap(out)
+            else:
+                self.tapped(now_ns, out)
+            return
+        self.state = PRESSED
+        self.deadline = now_ns + self.hold_ns if self.hold is not None else None
+
+    def on_release(self, now_ns, out):
+        state = self.state
+        if state == IDLE or state == RELEASED:
+            # a release we never saw the press for.
+            return
+        self.deadline = None
+        if state == CHORDED:
+            self.state = IDLE
+            return
+        if self.up is not None:
+            out.append((self.up, None))
+        if state == PRESSED and (self.hold is not None or self.double_tap is not None):
+            self.tapped(now_ns, out)
+        else:
+            self.state = IDLE
+
+    def expire(self, out):
+        self.deadline = None
+        if self.state == PRESSED:
+            self.state = HELD
+            out.append((self.hold, None))
+        elif self.state == RELEASED:
+            self.state = IDLE
+            self.emit_tap(out)
+
+class Chord(object):
+    """
+    Two or more press signals within window_ms of each other emit one signal instead.
+    """
+    def __init__(self, spec: dict):
+        self.signals = tuple(spec['signals'])
+        self.emit = spec['emit']
+        self.window_ns = int(spec.get('window_ms', 50) * 1000000)
+
+class GestureEngine(object):
+    """
+    Turns a controller's raw signals into derived ones. options is the controller's "gestures" config:
+    {"switches": {press signal: switch spec}, "chords": [chord spec]}. See Switch and Chord.
+    Signals that aren't part of any gesture pass straight through. A press that's part of a chord waits up to the
+    chord's window for the rest of the chord before it's handled on its own.
+    feed() and poll() return the signals to send, in order. Everything runs off the caller's clock, in monotonic
+    nanoseconds; poll() should be called every loop to fire timers. latency, if given, is a JitterStats that records
+    how long taps were held back.
+    """
+    def __init__(self, options: dict, latency=None, name=''):
+        self.switches = {press: Switch(press, spec) for press, spec in options.get('switches', {}).items()}
+        self.releases = {s.release: s for s in self.switches.values() if s.release is not None}
+        self.chords = [Chord(spec) for spec in options.get('chords', [])]
+        # press signal -> chords it's part of
+        self.chord_members = {}
+        for chord in self.chords:
+            for signal in chord.signals:
+                self.chord_members.setdefault(signal, []).append(chord)
+        # chord members pressed and waiting for the rest: {signal: press ns}, in press order.
+        self.pending = {}
+        self.pending_deadline = None
+        self.latency = latency
+        self.logger = logging.getLogger(f'{self.__class__.__name__}:{name}')
+
+    def signals(self) -> set:
+        """
+        every signal this engine can emit that isn't a raw one.
+        """
+        derived = {chord.emit for chord in self.chords}
+        for s in self.switches.values():
+            derived |= s.signals()
+        return derived
+
+    def feed(self, signal, now_ns) -> list:
+        out = []
+        if signal in self.chord_members:
+            self.pending[signal] = now_ns
+            chord = self.match_chord()
+            if chord is not None:
+                for member in chord.signals:
+                    del self.pending[member]
+                    if member in self.switches:
+                        self.switches[member].state = CHORDED
+                self.logger.debug("Chord %s.", chord.emit)
+                out.append((chord.emit, None))
+            self.pending_deadline = self.next_pending_deadline()
+            return self.finish(out, now_ns)
+        if signal in self.releases:
+            switch = self.releases[signal]
+            if switch.press in self.pending:
+                # released before the chord window ran out. it was a press on its own after all.
+                self.flush_pending(switch.press, out)
+            switch.on_release(now_ns, out)
+            return self.finish(out, now_ns)
+        self.handle_press(signal, now_ns, out, False)
+        return self.finish(out, now_ns)
+
+    def handle_press(self, signal, press_ns, out, delayed):
+        switch = self.switches.get(signal)
+        if switch is None:
+            out.append((signal, press_ns if delayed else None))
+        else:
+            switch.on_press(press_ns, out)
+
+    def match_chord(self):
+        for chord in self.chords:
+            if all(s in self.pending for s in chord.signals):
+                return chord
+        return None
+
+    def next_pending_deadline(self):
+        deadlines = [press_ns + max(c.window_ns for c in self.chord_members[s]) for s, press_ns in self.pending.items()]
+        return min(deadlines) if deadlines else None
+
+    def flush_pending(self, signal, out):
+        self.handle_press(signal, self.pending.pop(signal), out, True)
+        self.pending_deadline = self.next_pending_deadline()
+
+    def poll(self, now_ns) -> list:
+        out = []
+        if self.pending_deadline is not None and now_ns >= self.pending_deadline:
+            for signal, press_ns in list(self.pending.items()):
+                if now_ns >= press_ns + max(c.window_ns for c in self.chord_members[signal]):
+                    self.flush_pending(signal, out)
+        for switch in self.switches.values():
+            if switch.deadline is not None and now_ns >= switch.deadline:
+                switch.expire(out)
+        return self.finish(out, now_ns)
+
+    def finish(self, out, now_ns) -> list:
+        """
+        record how long held-back signals waited and drop the timestamps.
+        """
+        signals = []
+        for signal, press_ns in out:
+            if press_ns is not None and self.latency is not None:
+                self.latency.record(now_ns - press_ns)
+            signals.append(signal)
+        return signals
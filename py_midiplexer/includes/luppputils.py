@@ -1,28 +1,88 @@
 import json
 import os
-def genconfig():
+
+def grid_bindings(tracks, scenes, channel=0):
+    """
+    Luppp input bindings for a tracks x scenes grid, one control change per clip. Clip (track, scene) is number
+    scene * tracks + track; its control is that number mod 128 on channel + number // 128. Tracks and scenes count from
+    0 like Luppp's.
+    """
+    bindings = []
+    for scene in range(scenes):
+        for track in range(tracks):
+            n = scene * tracks + track
+            bindings.append({"action": "grid:event",
+                             "status": 176 + channel + n // 128,
+                             "track": track,
+                             "data": n % 128,
+                             "scene": scene,
+                             "active": 1})
+    return bindings
+
+def grid(client, tracks=8, scenes=8, channel=0, controller=None, controller_channel=0):
     """
-    Generates basic luppp config for use with pymidiplexer.
+    Generate a MidiPlexer.apply_batch() batch for a Luppp grid, and the Luppp input bindings that go with it.
+    Each clip becomes a track labelled "<track>:<scene>" on client that presses the clip, and each grid row becomes a
+    scene "<client>:scene<n>" of its clips. With a controller, clip i gets the signal "<client>:<track>:<scene>" for
+    note i on controller_channel (+ i // 128), and each row's scene the note after the last clip's, as from a pad
+    grid controller. Returns (batch, bindings).
+    """
+    if tracks * scenes > (16 - channel) * 128:
+        raise ValueError(f"{tracks} x {scenes} clips don't fit in the channels left from {channel}.")
+    if controller is not None and (tracks + 1) * scenes > (16 - controller_channel) * 128:
+        raise ValueError(f"{tracks} x {scenes} pads don't fit in the channels left from {controller_channel}.")
+    batch = {"tracks": {client: {}}, "scenes": {}, "signals": {}, "triggers": [], "scene_triggers": []}
+    signal_map = {}
+
+    def signal(n, label):
+        note_channel = controller_channel + n // 128
+        signal_map[f"{0x90 + note_channel:02X} {n % 128:02X} 7F"] = label
+        return label
+
+    for scene in range(scenes):
+        row = []
+        for track in range(tracks):
+            n = scene * tracks + track
+            label = f"{track}:{scene}"
+            # a press toggles the clip in Luppp, so on and off send the same thing.
+            batch["tracks"][client][label] = {"type": "control_change",
+                                              "data": {"channel": channel + n // 128, "control": n % 128},
+                                              "on_data": {"value": 127},
+                                              "off_data": {"value": 127}}
+            row.append(label)
+            if controller is not None:
+                batch["triggers"].append([controller, signal(n, f"{client}:{label}"), client, label])
+        scene_label = f"{client}:scene{scene}"
+        batch["scenes"][scene_label] = {client: row}
+        if controller is not None:
+            batch["scene_triggers"].append([controller, signal(tracks * scenes + scene, scene_label), scene_label])
+    if controller is not None:
+        batch["signals"][controller] = signal_map
+    return batch, grid_bindings(tracks, scenes, channel)
+
+def genconfig(input_bindings=None):
+    """
+    Generates basic luppp config for use with pymidiplexer. Pass the bindings from grid() to match a generated grid.
     """
     #luppp config dict
     lcd = {"name": "py-midiplexer",
            "author": os.environ["USER"]}
-    
-    input_bindings = []
-    status_states = {176: 1, 0: 0}
-    for track in range(1,10):
-        for status, active_state in status_states.items():
-            input_bindings.append({"action": "grid:event",
-                                   "status": status,
-                                   "track": track,
-                                   "data": track,
-                                   "scene": 0,
-                                   "active": active_state})
-            
-                               
+
+    if input_bindings is None:
+        input_bindings = []
+        status_states = {176: 1, 0: 0}
+        for track in range(1,10):
+            for status, active_state in status_states.items():
+                input_bindings.append({"action": "grid:event",
+                                       "status": status,
+                                       "track": track,
+                                       "data": track,
+                                       "scene": 0,
+                                       "active": active_state})
+
+
     lcd.update({"inputBindings": input_bindings})
     return json.dumps(lcd, indent=2)
 
 if __name__ == "__main__":
     print(genconfig())
-
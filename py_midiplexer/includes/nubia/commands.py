@@ -1,10 +1,21 @@
 from nubia import command, argument, context
-from termcolor import cprint
+from termcolor import cprint, colored
 from py_midiplexer import exceptions
+from py_midiplexer import metrics
+from py_midiplexer.includes import luppputils
+from prettytable import PrettyTable
 import multiprocessing
 import logging
+import queue
+import json
 import time
 
+def current_config() -> dict:
+    """
+    the MidiPlexer's config as of its last loop, read straight from shared memory. see ConfigStore.
+    """
+    return context.get_context().midiplexer.config_store.read() or {}
+
 def print_exceptions(func):
     #nubia autocommand error trying to load '_wrapped' when I use this wrapper.. hm...
     def _wrapped(*args, **kwargs):
@@ -53,10 +64,7 @@ class SceneCommands(object):
         """
         List all scenes.
         """
-        #todo: stdout queue
-        self.midiplexer.command_queue.put({"get_scenes_stdout":()})
-        
-        cprint(self.midiplexer.stdout_queue.get().__str__())
+        cprint(current_config().get('scenes', {}).__str__())
 
     @command
     def create_scene_from_current(self):
@@ -65,6 +73,13 @@ class SceneCommands(object):
         """
         self.midiplexer.command_queue.put({"create_scene_from_current":(self._label,)})
 
+    @command
+    def rename(self, new_label: str):
+        """
+        Rename the scene. Signals mapped to it follow.
+        """
+        self.midiplexer.command_queue.put({"rename_scene": (self._label, new_label)})
+
 
 @command("controller")
 class ControllerCommands(object):
@@ -79,19 +94,24 @@ class ControllerCommands(object):
             self._label = ctlrlabel
 
     @command
-    def add(self, type='midi'):
+    def add(self, type='midi', host=None, port=None):
         """
-        add the specified controller
+        add the specified controller. OSC controllers listen for UDP on host (default 0.0.0.0) and port. Node
+        controllers take their input from the py-midiplexer-node at host, on its udp port for that input.
         """
-        self.context.midiplexer.command_queue.put({'add_controller': (self._label, type)})
+        transport = {}
+        if type == 'osc':
+            transport = {'osc': {'host': host or '0.0.0.0', 'port': port}}
+        if type == 'node':
+            transport = {'node': {'host': host, 'port': port}}
+        self.context.midiplexer.command_queue.put({'add_controller': (self._label, type, transport)})
 
     @command
     def list(self):
         """
         list all controllers
         """
-        #todo: use stdout_queue.
-        cprint([ctlr.__dict__() for ctlr in self.context.midiplexer.controllers].__str__())
+        cprint(current_config().get('controllers', []).__str__())
 
     @command
     def register_signal(self, signal_label=None):
@@ -118,12 +138,36 @@ class ClientCommands(object):
         self.logger = logging.getLogger(self.__class__.__name__)
             
     @command
-    def add(self, toggle_record=False, type='midi'):
+    def add(self, toggle_record=False, type='midi', host='127.0.0.1', port=None):
+        """
+        Create the named client. In midi mode, Creates an output jack port. In osc mode, sends UDP to host and port.
+        In node mode, sends to the py-midiplexer-node at host, on its udp port for that output.
+
+        """
+        transport = {type: {'host': host, 'port': port}} if type in ('osc', 'node') else {}
+        client = self.midiplexer.command_queue.put({'add_client': (self.name, toggle_record, type, transport)})
+
+    @command
+    def remove(self):
+        """
+        Stop the client and delete it along with every trigger, scene entry and continuous mapping that uses it.
+        """
+        self.midiplexer.command_queue.put({'remove_client': (self.name,)})
+
+    @command
+    def rename_track(self, tracklabel, new_label):
+        """
+        Rename a track. Trigger mappings, scenes and continuous mappings that use it follow.
         """
-        Create the named client. In midi mode, Creates an output jack port. 
+        self.midiplexer.command_queue.put({'rename_track': (self.name, tracklabel, new_label)})
 
+    @command
+    def where_used(self, tracklabel):
         """
-        client = self.midiplexer.command_queue.put({'add_client': (self.name, toggle_record, type)})
+        Show the signals, scenes and continuous mappings that use a track.
+        """
+        self.midiplexer.command_queue.put({'where_used': (self.name, tracklabel)})
+        cprint(self.midiplexer.stdout_queue.get().__str__())
 
     @command
     def clear(self, tracklabel):
@@ -215,12 +259,7 @@ class ClientCommands(object):
         """
         Lists all clients regardless of arguments specified.
         """
-        out = []
-        for client in self.context.midiplexer.clients:
-#            for name, client in c.items():
-                out.append(client.__dict__())
-                
-        cprint(out.__str__())
+        cprint(current_config().get('clients', []).__str__())
 
     @command
     def list_tracks(self):
@@ -261,18 +300,18 @@ class TriggerMapCommands(object):
     @command
     def delete(self):
         """
-        Coming soon.
+        Delete a trigger mapping. Leave out the track to unmap the signal from every track on the client, or the client
+        as well to unmap the signal entirely.
         """
-        #todo
-        pass
+        self.midiplexer.command_queue.put({'delete_trigger': (self.controller, self.signal, self.client or None,
+                                                              self.track or None)})
     
     @command
     def show(self):
         """
         show the trigger map.
         """
-        self.midiplexer.command_queue.put({"get_trigger_map_stdout":()})
-        cprint(self.midiplexer.stdout_queue.get().__str__())
+        cprint(current_config().get('controller_signal_trigger_map', {}).__str__())
         
 @command("scene-map")
 class SceneMapCommands(object):
@@ -296,19 +335,53 @@ class SceneMapCommands(object):
     @command
     def delete(self):
         """
-        Coming soon.
+        Delete the scene mapping for a signal. The scene itself is kept.
         """
-        #todo
-        pass
+        self.midiplexer.command_queue.put({'delete_scene_trigger': (self.controller, self.signal)})
 
     @command
     def show(self):
         """
         show the scene map.
         """
-        self.midiplexer.command_queue.put({"get_scene_map_stdout":()})
-        cprint(self.midiplexer.stdout_queue.get().__str__())
+        cprint(current_config().get('controller_signal_scene_map', {}).__str__())
+
+
+@command("script-map")
+class ScriptMapCommands(object):
+    """
+    Run a script when a controller signal comes in, instead of its trigger or scene mapping.
+    """
+    def __init__(self, controller: str='', signal=''):
+        self.midiplexer = context.get_context().midiplexer
+        self.controller = controller
+        self.signal = signal
+
+    @command
+    def add(self, file: str, timeout_ms: int=0):
+        """
+        Run the python file for the signal. It gets controller, signal, mode, state, playing(client, track),
+        trigger(client, track, state=None, delay_ms=0), scene(label, delay_ms=0) and log(msg). timeout_ms overrides
+        the pool's limit.
+        """
+        entry = {"file": file}
+        if timeout_ms:
+            entry.update({"timeout_ms": timeout_ms})
+        self.midiplexer.command_queue.put({'assign_script': (self.controller, self.signal, entry)})
 
+    @command
+    def delete(self):
+        """
+        Stop running a script for the signal.
+        """
+        self.midiplexer.command_queue.put({'delete_script': (self.controller, self.signal)})
+
+    @command
+    def show(self):
+        """
+        show the script map.
+        """
+        cprint(current_config().get('controller_signal_script_map', {}).__str__())
 
 @command
 def save():
@@ -316,3 +389,237 @@ def save():
     Save the state of pymidiplexer to a file.
     """
     context.get_context().midiplexer.command_queue.put({'save':()})
+
+
+@command("continuous-map")
+class ContinuousMapCommands(object):
+    """
+    Map a controller cc or pitchwheel straight through to a client track's value, e.g. an expression pedal.
+    """
+    def __init__(self, label: str='', controller: str='', midi_type: str='control_change', channel: int=0,
+                 control: int=0, client: str='', track='', curve: str='linear'):
+        self.midiplexer = context.get_context().midiplexer
+        self.label = label
+        self.controller = controller
+        self.input = {"type": midi_type, "channel": channel, "control": control}
+        self.client = client
+        self.track = track
+        self.curve = curve
+
+    @command
+    def add(self):
+        """
+        Create a continuous mapping, or add a target track to an existing one. curve is one of linear, inverted,
+        log or exp. Custom curves can be given as [x, y] points in the config file.
+        """
+        self.midiplexer.command_queue.put({'assign_continuous':(self.label, self.controller, self.input, self.client,
+                                                                self.track, self.curve)})
+
+    @command
+    def show(self):
+        """
+        show the continuous map.
+        """
+        cprint(current_config().get('continuous_map', {}).__str__())
+
+
+@command("bulk")
+class BulkCommands(object):
+    """
+    Provision many tracks, signals, mappings and scenes in one transaction instead of one command each.
+    """
+    def __init__(self):
+        self.midiplexer = context.get_context().midiplexer
+
+    def send(self, batch):
+        self.midiplexer.command_queue.put({'apply_batch':(batch,)})
+        try:
+            result = self.midiplexer.stdout_queue.get(timeout=30)
+        except queue.Empty:
+            cprint("Timed out waiting for the batch to be applied.", color='red')
+            return
+        if 'errors' in result:
+            cprint("Nothing applied:", color='red')
+            for error in result['errors']:
+                cprint(f"  {error}", color='red')
+        else:
+            cprint(result.__str__())
+
+    @command
+    @argument("path", description="JSON file holding the batch. see MidiPlexer.apply_batch()")
+    def apply(self, path: str):
+        """
+        Apply a batch of clients, tracks, signals, trigger mappings, scenes and scene mappings from a file.
+        """
+        with open(path) as f:
+            self.send(json.load(f))
+
+    @command
+    @argument("client", description="the Luppp client")
+    @argument("controller", description="controller to map a pad per clip and per scene to. none if empty")
+    @argument("luppp_config", description="where to write the matching Luppp controller config")
+    def grid(self, client: str, tracks: int=8, scenes: int=8, channel: int=0, controller: str='',
+             controller_channel: int=0, luppp_config: str='/tmp/py-midiplexer-luppp.json'):
+        """
+        Provision a tracks x scenes Luppp grid in one go, and write the Luppp bindings that go with it.
+        """
+        try:
+            batch, bindings = luppputils.grid(client, tracks, scenes, channel=channel, controller=controller or None,
+                                              controller_channel=controller_channel)
+        except ValueError as e:
+            cprint(str(e), color='red')
+            return
+        with open(luppp_config, 'w') as f:
+            f.write(luppputils.genconfig(bindings))
+        cprint(f"Wrote Luppp bindings to {luppp_config}.")
+        self.send(batch)
+
+
+@command("trace")
+class TraceCommands(object):
+    """
+    Span tracing across every midiplexer process, exported as Chrome/Perfetto trace JSON.
+    """
+    def __init__(self, outdir: str='/tmp/py-midiplexer-trace'):
+        self.midiplexer = context.get_context().midiplexer
+        self.outdir = outdir
+
+    @command
+    def start(self, threshold_ms: float=0):
+        """
+        Start recording spans. With a threshold, any span longer than threshold_ms dumps a trace automatically.
+        """
+        self.midiplexer.command_queue.put({'trace':(True, threshold_ms or None, self.outdir)})
+
+    @command
+    def stop(self):
+        """
+        Stop recording spans and throw away the ring buffers.
+        """
+        self.midiplexer.command_queue.put({'trace':(False, None, self.outdir)})
+
+    @command
+    def dump(self):
+        """
+        Dump the current ring buffers of every process to one trace.json.
+        """
+        self.midiplexer.command_queue.put({'trace_dump':()})
+
+
+@command("record")
+class RecordCommands(object):
+    """
+    Record the controller signal stream and the resulting client sends. Replay with
+    `python -m py_midiplexer.recording <file> -c <config>`.
+    """
+    def __init__(self, path: str='/tmp/py-midiplexer.rec'):
+        self.midiplexer = context.get_context().midiplexer
+        self.path = path
+
+    @command
+    def start(self):
+        """
+        Start recording to the given path.
+        """
+        self.midiplexer.command_queue.put({'record_start':(self.path,)})
+
+    @command
+    def stop(self):
+        """
+        Stop recording and close the file.
+        """
+        self.midiplexer.command_queue.put({'record_stop':()})
+
+
+@command
+@argument("seconds", description="how long to profile for")
+@argument("outdir", description="directory for the per-process dumps and merged reports")
+def profile(seconds: float=10, outdir: str='/tmp/py-midiplexer-profile'):
+    """
+    Profile the midiplexer, every controller and every client for a while, then merge the results into one report
+    per process type.
+    """
+    context.get_context().midiplexer.command_queue.put({'profile':(seconds, outdir)})
+    cprint(f"Profiling for {seconds} seconds. Reports will be written under {outdir}.")
+
+
+@command
+@argument("beats", description="wait for the next multiple of this many beats. 1 is a beat, 4 a bar in 4/4, 0 is off")
+def quantize(beats: float=0):
+    """
+    Land track and scene triggers on the next beat or bar of the running midi clock instead of right away.
+    """
+    context.get_context().midiplexer.command_queue.put({'set_quantize':(beats,)})
+    cprint("Quantising off." if not beats else f"Quantising triggers to {beats} beats.")
+
+
+def render_grid(midiplexer) -> str:
+    """
+    one frame of the track grid: each client's tracks with their published state, then the latest signals. Reads
+    shared memory only.
+    """
+    status = midiplexer.status_store.read()
+    if status is None:
+        return "Waiting for the midiplexer to start."
+    tracks = {c['name']: list(c['tracks']) for c in current_config().get('clients', [])}
+    lines = []
+    for name, slot in status['clients'].items():
+        board = midiplexer.trackstates.view(slot)
+        cells = []
+        for i, label in enumerate(tracks.get(name, [])[:len(board)]):
+            state = board[i]
+            if not state:
+                cells.append(colored(f"?{label}", 'grey'))
+            elif state & 4:
+                cells.append(colored(f"R{label}", 'red'))
+            elif state & 2:
+                cells.append(colored(f">{label}", 'green'))
+            else:
+                cells.append(f" {label}")
+        lines.append(f"{name}: " + "  ".join(cells))
+    lines.append("")
+    now = time.time()
+    for controller, signal, t in reversed(status['recent_signals']):
+        lines.append(f"{now - t:6.1f}s  {controller}  {signal}")
+    return "\n".join(lines)
+
+@command
+@argument("fps", description="frames per second")
+@argument("seconds", description="stop after this many seconds. 0 runs until ctrl-c")
+def grid(fps: float=10, seconds: float=0):
+    """
+    Live view of every client's tracks (> playing, R waiting to record, ? not reported yet) and the latest signals,
+    redrawn fps times a second until ctrl-c, or for the given number of seconds.
+    """
+    midiplexer = context.get_context().midiplexer
+    deadline = time.monotonic() + seconds if seconds else None
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            # home the cursor and clear the screen, then draw the frame.
+            print("\x1b[H\x1b[2J" + render_grid(midiplexer), flush=True)
+            time.sleep(1 / fps)
+    except KeyboardInterrupt:
+        pass
+
+@command
+def stats():
+    """
+    Show counters, queue depths, cpu time and memory for every midiplexer process, as last sampled by the metrics
+    process.
+    """
+    path = context.get_context().midiplexer.metrics_path
+    try:
+        with open(path) as f:
+            parsed = metrics.parse_metrics(f.read())
+    except FileNotFoundError:
+        cprint(f"No metrics at {path} yet.", color='red')
+        return
+    columns = []
+    for values in parsed.values():
+        for k in values.keys():
+            if k not in columns:
+                columns.append(k)
+    table = PrettyTable(['process', 'name'] + columns)
+    for (proctype, name), values in parsed.items():
+        table.add_row([proctype, name] + [values.get(k, '') for k in columns])
+    cprint(table.get_string())
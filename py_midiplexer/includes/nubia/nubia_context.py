@@ -3,11 +3,13 @@ from nubia import exceptions
 from nubia import eventbus
 from pygments.token import Token
 from py_midiplexer.py_midiplexer import MidiPlexer
+from py_midiplexer.cli import realtime_defaults
 
 
 class NubiaContext(context.Context):
     def __init__(self, *args, **kwargs):
-        self.midiplexer = kwargs.pop('midiplexer')
+        # started in on_interactive(), with the options from the command line.
+        self.midiplexer = None
         super().__init__(*args, **kwargs)
         
     def on_connected(self, *args, **kwargs):
@@ -21,7 +23,7 @@ class NubiaContext(context.Context):
 
     def on_interactive(self, args):
         self.interactive=True
-        self.midiplexer = MidiPlexer(f=args.config)
+        self.midiplexer = MidiPlexer(f=args.config, metrics_path=args.metrics, realtime_defaults=realtime_defaults(args))
         self.midiplexer.start()
         self.verbose = args.verbose
         ret = self._registry.find_command("connect").run_cli(args)
@@ -3,21 +3,16 @@ from nubia import PluginInterface, CompletionDataSource
 from nubia.internal.cmdbase import AutoCommand
 from .nubia_context import NubiaContext
 from .nubia_statusbar import NubiaStatusBar
-from py_midiplexer.py_midiplexer import MidiPlexer
 from py_midiplexer.includes.nubia import commands, exitcmd
-import os
+from py_midiplexer import cli
 
 
 class NubiaMidiPlexerPlugin(PluginInterface):
     """
     Nubia plugin for py_midiplexer.
     """
-    def __init__(self, muxer: MidiPlexer):
-        self.muxer = muxer
-        super().__init__()
-
     def create_context(self):
-        return NubiaContext(midiplexer = self.muxer)
+        return NubiaContext()
 
     def get_commands(self):
         return [
@@ -26,7 +21,16 @@ class NubiaMidiPlexerPlugin(PluginInterface):
             AutoCommand(commands.ClientCommands),
             AutoCommand(commands.TriggerMapCommands),
             AutoCommand(commands.SceneMapCommands),
+            AutoCommand(commands.ScriptMapCommands),
+            AutoCommand(commands.ContinuousMapCommands),
+            AutoCommand(commands.BulkCommands),
+            AutoCommand(commands.TraceCommands),
+            AutoCommand(commands.RecordCommands),
             AutoCommand(commands.save),
+            AutoCommand(commands.profile),
+            AutoCommand(commands.stats),
+            AutoCommand(commands.quantize),
+            AutoCommand(commands.grid),
             exitcmd.CustomExit()
         ]
     
@@ -37,9 +41,7 @@ class NubiaMidiPlexerPlugin(PluginInterface):
             add_help=add_help,
         )
         
-        opts_parser.add_argument(
-            "--config", "-c", default=os.environ['HOME']+"/.config/py-midiplexer/config.json", type=str, help="Configuration File"
-        )
+        cli.add_options(opts_parser)
         opts_parser.add_argument(
             "--verbose",
             "-v",
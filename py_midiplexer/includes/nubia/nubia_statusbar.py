@@ -1,10 +1,9 @@
-from py_midiplexer.py_midiplexer import Mode
+from py_midiplexer.mode import Mode
 
 from pygments.token import Token
 
 from nubia import context
 from nubia import statusbar
-import queue
 
 class NubiaStatusBar(statusbar.StatusBar):
     def __init__(self, context):
@@ -22,37 +21,35 @@ class NubiaStatusBar(statusbar.StatusBar):
 
     def get_tokens(self):
         token_list = []
-        try:
-            status = context.get_context().midiplexer.status_queue.get_nowait()
+        # the latest status the MidiPlexer published. None until its first loop.
+        status = context.get_context().midiplexer.status_store.read()
 
-            spacer = (Token.Spacer, "  ")
+        spacer = (Token.Spacer, "  ")
 
-            if self._first_command:
-                token_list.append((Token.Toolbar, "Welcome to "))
+        if self._first_command:
+            token_list.append((Token.Toolbar, "Welcome to "))
 
-            token_list.append((Token.Toolbar, "py-midiplexer"))
+        token_list.append((Token.Toolbar, "py-midiplexer"))
 
-            if self._first_command:
-                token_list.append((Token.Toolbar, "!"))
+        if self._first_command:
+            token_list.append((Token.Toolbar, "!"))
 
-            token_list.append(spacer)
+        if status is None:
+            return token_list
 
-            token_list.append((Token.Toolbar, "Mode: "))
-            if status['mode'] == Mode.TRIGGER:
-                token_list.append((Token.Warn, "Trigger"))
-            elif status['mode'] == Mode.SCENE:
-                token_list.append((Token.Info, "Scene"))
+        token_list.append(spacer)
 
-            token_list.append(spacer)
+        token_list.append((Token.Toolbar, "Mode: "))
+        if status['mode'] == Mode.TRIGGER.value:
+            token_list.append((Token.Warn, "Trigger"))
+        elif status['mode'] == Mode.SCENE.value:
+            token_list.append((Token.Info, "Scene"))
 
-            token_list.append((Token.Toolbar, status['filename']))
+        token_list.append(spacer)
 
-            if not status['saved']:
-                token_list.append((Token.Toolbar, '*'))
-            
-        except queue.Empty:
-            pass
+        token_list.append((Token.Toolbar, status['filename']))
 
-        return token_list
+        if not status['saved']:
+            token_list.append((Token.Toolbar, '*'))
 
-    
+        return token_list
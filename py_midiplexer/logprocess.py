@@ -0,0 +1,72 @@
+import multiprocessing
+import logging
+import logging.handlers
+import queue
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the process doing the logging. If the log process falls behind and the queue
+    is full, the record is thrown away and counted instead.
+    """
+    def __init__(self, log_queue, dropped):
+        super().__init__(log_queue)
+        self.dropped = dropped
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.dropped.get_lock():
+                self.dropped.value += 1
+
+class LogProcess(multiprocessing.Process):
+    """
+    Owns the real log handlers (file, stderr, whatever the shell set up). Every other process hands its records to
+    this one over log_queue, so handler I/O never happens in a routing loop.
+    """
+    def __init__(self, maxsize=10000):
+        # separate from the MidiPlexer shutdown callback so that children can still log while they exit.
+        self.shutdown_callback = multiprocessing.Event()
+        self.log_queue = multiprocessing.Queue(maxsize)
+        self.dropped = multiprocessing.Value('L', 0)
+        super().__init__()
+        self.name = 'LogProcess'
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def install(self):
+        """
+        Replace the root handlers of the calling process with a DroppingQueueHandler feeding this log process.
+        Processes forked afterward inherit the handler. Has no effect in the log process itself.
+        """
+        if multiprocessing.current_process().pid == self.pid:
+            return
+        root = logging.getLogger()
+        for h in root.handlers[:]:
+            if isinstance(h, DroppingQueueHandler):
+                return
+            root.removeHandler(h)
+        root.addHandler(DroppingQueueHandler(self.log_queue, self.dropped))
+
+    def handle(self, record):
+        logger = logging.getLogger(record.name)
+        # the level was already checked in the sending process. only hand it to the handlers.
+        logger.handle(record)
+
+    def run(self):
+        while not self.shutdown_callback.is_set():
+            try:
+                self.handle(self.log_queue.get(timeout=0.1))
+            except queue.Empty:
+                continue
+        # drain whatever was queued before shutdown.
+        while True:
+            try:
+                self.handle(self.log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if self.dropped.value:
+            self.logger.warning("Dropped %d log records.", self.dropped.value)
+
+    def stop(self):
+        self.shutdown_callback.set()
+        self.join()
@@ -1,22 +1,48 @@
-import mido
-from .controller import MidiController
-from .client import MidiClient
 from .py_midiplexer import MidiPlexer
+from . import cli
 
+import argparse
+import signal
 import sys
-from nubia import Nubia, Options
-from .includes.nubia.nubia_plugin import NubiaMidiPlexerPlugin
 
 
 def main():
-    muxer = MidiPlexer()
+    cli.use_fork()
+    # the shell is the only thing that needs nubia. headless() never imports it.
+    from nubia import Nubia, Options
+    from nubia.internal import context
+    from .includes.nubia.nubia_plugin import NubiaMidiPlexerPlugin
 
-    plugin = NubiaMidiPlexerPlugin(muxer)
+    plugin = NubiaMidiPlexerPlugin()
     shell = Nubia(
         name="py_midiplexer",
         plugin=plugin,
         options=Options(persistent_history=True),
     )
     shell.run()
+    # the context starts the midiplexer once the shell goes interactive. exit stops it; this covers any other way out.
+    muxer = context.get_context().midiplexer
+    if muxer is not None and muxer.is_alive():
+        muxer.shutdown()
+        muxer.join()
+    sys.exit()
+
+def headless():
+    """
+    Run the midiplexer from its config file without the shell, until SIGINT or SIGTERM.
+    """
+    parser = argparse.ArgumentParser(
+        description="py_midiplexer without the shell.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    cli.add_options(parser)
+    args = parser.parse_args()
+    cli.use_fork()
+    muxer = MidiPlexer(f=args.config, metrics_path=args.metrics, realtime_defaults=cli.realtime_defaults(args))
+    muxer.start()
+    # blocked only after the fork, so the midiplexer doesn't inherit the mask.
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT, signal.SIGTERM})
+    signal.sigwait({signal.SIGINT, signal.SIGTERM})
     muxer.shutdown()
+    muxer.join()
     sys.exit()
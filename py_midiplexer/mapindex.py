@@ -0,0 +1,72 @@
+class MapIndex(object):
+    """
+    Reverse indexes over the MidiPlexer's trigger map, scene map and scenes, so that finding everything that refers to
+    a track, a scene or a client is a lookup instead of a walk over the nested maps. rebuild() after loading a config;
+    after that, every change to the maps goes through the matching add_/remove_ call here as well.
+    Signals are (controller, signal) pairs throughout.
+    """
+    def __init__(self):
+        # (client, track) -> {signals that trigger it}
+        self.track_signals = {}
+        # client -> {signals that trigger any of its tracks}
+        self.client_signals = {}
+        # scene -> {signals mapped to it}
+        self.scene_signals = {}
+        # (client, track) -> {scenes it's in}
+        self.track_scenes = {}
+        # client -> {scenes it has tracks in}
+        self.client_scenes = {}
+        # {(controller, signal label)} for every registered signal.
+        self.signals = set()
+
+    def rebuild(self, trigger_map: dict, scene_map: dict, scenes: dict, signal_labels: dict):
+        self.__init__()
+        for controller, signals in trigger_map.items():
+            for signal, clients in signals.items():
+                for client, tracks in clients.items():
+                    for track in tracks:
+                        self.add_trigger(controller, signal, client, track)
+        for controller, signals in scene_map.items():
+            for signal, scene in signals.items():
+                self.add_scene_trigger(controller, signal, scene)
+        for scene, clients in scenes.items():
+            for client, tracks in clients.items():
+                for track in tracks:
+                    self.add_scene_track(scene, client, track)
+        for controller, labels in signal_labels.items():
+            self.set_signals(controller, labels)
+
+    def add_trigger(self, controller, signal, client, track):
+        self.track_signals.setdefault((client, track), set()).add((controller, signal))
+        self.client_signals.setdefault(client, set()).add((controller, signal))
+
+    def remove_trigger(self, controller, signal, client, track, client_still_mapped: bool):
+        """
+        client_still_mapped says whether the signal still triggers other tracks on the client.
+        """
+        self.track_signals.get((client, track), set()).discard((controller, signal))
+        if not client_still_mapped:
+            self.client_signals.get(client, set()).discard((controller, signal))
+
+    def add_scene_trigger(self, controller, signal, scene):
+        self.scene_signals.setdefault(scene, set()).add((controller, signal))
+
+    def remove_scene_trigger(self, controller, signal, scene):
+        self.scene_signals.get(scene, set()).discard((controller, signal))
+
+    def add_scene_track(self, scene, client, track):
+        self.track_scenes.setdefault((client, track), set()).add(scene)
+        self.client_scenes.setdefault(client, set()).add(scene)
+
+    def remove_scene_track(self, scene, client, track, client_still_in_scene: bool):
+        self.track_scenes.get((client, track), set()).discard(scene)
+        if not client_still_in_scene:
+            self.client_scenes.get(client, set()).discard(scene)
+
+    def set_signals(self, controller, labels):
+        self.signals = {s for s in self.signals if s[0] != controller}
+        self.signals.update((controller, label) for label in labels)
+
+    def where_used(self, client, track) -> dict:
+        return {"signals": sorted(self.track_signals.get((client, track), ()), key=str),
+                "scenes": sorted(self.track_scenes.get((client, track), ()), key=str)}
@@ -0,0 +1,224 @@
+import multiprocessing
+import logging
+import os
+
+# counter slots. each process owns one Counters and is the only writer to it, so no locking is needed.
+SIGNALS_RECEIVED = 0
+SIGNALS_DROPPED = 1
+EVENTS_PROCESSED = 2
+MESSAGES_SENT = 3
+MESSAGES_COALESCED = 4
+EVENTS_SCHEDULED = 5
+FEEDBACK_RECEIVED = 6
+FEEDBACK_CORRECTIONS = 7
+SIGNALS_DUPLICATE = 8
+SIGNALS_DEBOUNCED = 9
+SENDS_FAILED = 10
+SCRIPTS_RUN = 11
+SCRIPTS_FAILED = 12
+SCRIPTS_KILLED = 13
+SCRIPTS_DROPPED = 14
+COUNTER_NAMES = ('signals_received', 'signals_dropped', 'events_processed', 'messages_sent', 'messages_coalesced',
+                 'events_scheduled', 'feedback_received', 'feedback_corrections', 'signals_duplicate',
+                 'signals_debounced', 'sends_failed', 'scripts_run', 'scripts_failed', 'scripts_killed',
+                 'scripts_dropped')
+
+class Counters(object):
+    """
+    Shared-memory counters for one process. Incrementing is a plain store into a RawArray; reading happens in the
+    MetricsProcess.
+    """
+    def __init__(self):
+        self.values = multiprocessing.RawArray('Q', len(COUNTER_NAMES))
+
+    def incr(self, counter, n=1):
+        self.values[counter] += n
+
+    def get_dict(self):
+        return {name: self.values[i] for i, name in enumerate(COUNTER_NAMES)}
+
+class JitterStats(object):
+    """
+    Shared-memory timing stats for a clock, or anything else that should happen at a set time. Written only by the
+    owning process. prefix names the gauges.
+    """
+    TICKS = 0
+    SUM_US = 1
+    SUM_SQ_US = 2
+    MAX_US = 3
+    MISSED = 4
+
+    def __init__(self, prefix='clock'):
+        self.prefix = prefix
+        self.values = multiprocessing.RawArray('d', 5)
+
+    def record(self, late_ns):
+        late_us = late_ns / 1000
+        v = self.values
+        v[self.TICKS] += 1
+        v[self.SUM_US] += late_us
+        v[self.SUM_SQ_US] += late_us * late_us
+        if late_us > v[self.MAX_US]:
+            v[self.MAX_US] = late_us
+
+    def miss(self):
+        self.values[self.MISSED] += 1
+
+    def get_dict(self):
+        v = self.values
+        n = v[self.TICKS]
+        mean = v[self.SUM_US] / n if n else 0
+        var = v[self.SUM_SQ_US] / n - mean * mean if n else 0
+        p = self.prefix
+        return {f"{p}_ticks": int(n),
+                f"{p}_jitter_mean_us": mean,
+                f"{p}_jitter_stddev_us": max(var, 0) ** 0.5,
+                f"{p}_jitter_max_us": v[self.MAX_US],
+                f"{p}_missed_ticks": int(v[self.MISSED])}
+
+def read_proc(pid):
+    """
+    returns (cpu seconds, rss bytes) for pid from /proc, or None if the process is gone.
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # the command name can contain spaces. everything after the closing paren is space-separated.
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/statm') as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime and stime are fields 14 and 15 of stat; fields[0] here is field 3.
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return cpu, rss_pages * os.sysconf('SC_PAGE_SIZE')
+
+def read_sched(pid):
+    """
+    returns the scheduling a process actually runs with, from /proc and sched_getaffinity, or None if it's gone:
+    {'sched_policy': n, 'rt_priority': n, 'cpus_allowed': n, 'locked_bytes': n}. Policy numbers are os.SCHED_*.
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        locked = 0
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmLck:'):
+                    locked = int(line.split()[1]) * 1024
+                    break
+        cpus = len(os.sched_getaffinity(pid))
+    except (OSError, IndexError, ValueError):
+        return None
+    # rt_priority and policy are fields 40 and 41 of stat.
+    return {'sched_policy': int(fields[38]), 'rt_priority': int(fields[37]), 'cpus_allowed': cpus,
+            'locked_bytes': locked}
+
+class MetricsSource(object):
+    """
+    What the MetricsProcess needs to know about one midiplexer process. Built in the MidiPlexer process, where the
+    queues and pids are all available, before the MetricsProcess is forked.
+    """
+    def __init__(self, proctype: str, name: str, pid, counters: Counters, queues: dict, gauges=None):
+        self.proctype = proctype
+        self.name = name
+        self.pid = pid
+        self.counters = counters
+        self.queues = queues
+        # optional callable returning {metric name: value}, read from shared memory in the MetricsProcess.
+        self.gauges = gauges
+
+class MetricsProcess(multiprocessing.Process):
+    """
+    Samples the shared counters, queue depths and /proc of every midiplexer process once per interval and writes
+    them to a Prometheus text file. Nothing here runs in a routing process.
+    """
+    def __init__(self, sources: list, path: str, interval=1.0):
+        self.shutdown_callback = multiprocessing.Event()
+        self.sources = sources
+        self.path = path
+        self.interval = interval
+        super().__init__()
+        self.name = 'MetricsProcess'
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def render(self):
+        lines = []
+        for i, name in enumerate(COUNTER_NAMES):
+            lines.append(f'# TYPE midiplexer_{name}_total counter')
+            for src in self.sources:
+                lines.append(f'midiplexer_{name}_total{{process="{src.proctype}",name="{src.name}"}} '
+                             f'{src.counters.values[i]}')
+        lines.append('# TYPE midiplexer_queue_depth gauge')
+        for src in self.sources:
+            for qname, q in src.queues.items():
+                try:
+                    depth = q.qsize()
+                except NotImplementedError:
+                    continue
+                lines.append(f'midiplexer_queue_depth{{process="{src.proctype}",name="{src.name}",queue="{qname}"}} '
+                             f'{depth}')
+        lines.append('# TYPE midiplexer_queue_overflows_total counter')
+        for src in self.sources:
+            for qname, q in src.queues.items():
+                if hasattr(q, 'overflows'):
+                    lines.append(f'midiplexer_queue_overflows_total{{process="{src.proctype}",name="{src.name}",'
+                                 f'queue="{qname}"}} {q.overflows.value}')
+        for src in self.sources:
+            if src.gauges is not None:
+                for k, v in src.gauges().items():
+                    lines.append(f'midiplexer_{k}{{process="{src.proctype}",name="{src.name}"}} {v}')
+        proc = [(src, read_proc(src.pid)) for src in self.sources if src.pid is not None]
+        lines.append('# TYPE midiplexer_cpu_seconds_total counter')
+        for src, usage in proc:
+            if usage is not None:
+                lines.append(f'midiplexer_cpu_seconds_total{{process="{src.proctype}",name="{src.name}"}} {usage[0]}')
+        lines.append('# TYPE midiplexer_rss_bytes gauge')
+        for src, usage in proc:
+            if usage is not None:
+                lines.append(f'midiplexer_rss_bytes{{process="{src.proctype}",name="{src.name}"}} {usage[1]}')
+        for src, sched in [(src, read_sched(src.pid)) for src in self.sources if src.pid is not None]:
+            if sched is not None:
+                for k, v in sched.items():
+                    lines.append(f'midiplexer_{k}{{process="{src.proctype}",name="{src.name}"}} {v}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        # write then rename so a scraper never sees a half-written file.
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, self.path)
+
+    def run(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        while not self.shutdown_callback.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                self.logger.error("Could not write metrics to %s: %s", self.path, e)
+
+    def stop(self):
+        self.shutdown_callback.set()
+        self.join()
+
+def parse_metrics(text):
+    """
+    Parse the Prometheus text written by MetricsProcess into {(process, name): {metric: value}}. Queue depths and
+    overflows become '<queue>_depth' and '<queue>_overflows' entries. Only understands the labels MetricsProcess
+    writes.
+    """
+    out = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        metric, value = line.rsplit(' ', 1)
+        name, labels = metric.split('{', 1)
+        labels = dict(kv.split('=', 1) for kv in labels.rstrip('}').split(','))
+        labels = {k: v.strip('"') for k, v in labels.items()}
+        name = name[len('midiplexer_'):]
+        if name == 'queue_depth':
+            name = f"{labels['queue']}_depth"
+        elif name == 'queue_overflows_total':
+            name = f"{labels['queue']}_overflows"
+        out.setdefault((labels['process'], labels['name']), {})[name] = value
+    return out
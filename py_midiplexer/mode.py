@@ -0,0 +1,13 @@
+from enum import Enum
+
+class Mode(Enum):
+    """
+    I think the most important distinction between trigger and scene is that trigger just fires off signals at the specified
+    client(s)/track(s), but scene tries to turn off other tracks. Clients with a feedback input tell us the real state of their
+    tracks (see MidiClient). For the rest we still blindly assume that everything will be found exactly as midiplexer left it (or
+    at least hope that the user manually returned things to the expected state). 
+    It was going to be that trigger was one-at-a-time, but it's frankly too much work to enforce that, and what's the point? It's
+    an option to do one-at-a-time, just don't screw up the config. 
+    """
+    TRIGGER = 1
+    SCENE = 2
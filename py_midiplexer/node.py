@@ -0,0 +1,505 @@
+from py_midiplexer import metrics
+from py_midiplexer import realtime
+from py_midiplexer import cli
+import argparse
+import collections
+import logging
+import multiprocessing
+import select
+import selectors
+import signal
+import socket
+import struct
+import time
+
+# record types.
+SIGNAL = 1  # node to MidiPlexer: midi a node input received.
+EVENT = 2   # MidiPlexer to node: midi for a node output to send.
+PING = 3    # MidiPlexer to node.
+PONG = 4    # node to MidiPlexer. the payload is PONG_BODY.
+# every record starts with its type, the sender's sequence number on this link, and the sender's monotonic_ns when
+# it was sent. SIGNAL and EVENT records go on with the midi messages, each prefixed with its length.
+HEADER = struct.Struct('>BIq')
+# the ping's timestamp, when the ping arrived, and how many records the node has lost on this link.
+PONG_BODY = struct.Struct('>qqI')
+LENGTH = struct.Struct('>H')
+# keeps a record in one ethernet frame.
+MAX_PAYLOAD = 1400
+SEQ_MASK = 0xffffffff
+
+def pack_messages(messages) -> bytes:
+    return b''.join(LENGTH.pack(len(data)) + data for data in messages)
+
+def unpack_messages(payload) -> list:
+    messages = []
+    i = 0
+    while i < len(payload):
+        n, = LENGTH.unpack_from(payload, i)
+        messages.append(payload[i + 2:i + 2 + n])
+        i += 2 + n
+    return messages
+
+def chunk_messages(messages) -> list:
+    """
+    split messages into payloads of at most MAX_PAYLOAD bytes, in order.
+    """
+    payloads = []
+    chunk = []
+    size = 0
+    for data in messages:
+        if chunk and size + 2 + len(data) > MAX_PAYLOAD:
+            payloads.append(pack_messages(chunk))
+            chunk = []
+            size = 0
+        chunk.append(data)
+        size += 2 + len(data)
+    if chunk:
+        payloads.append(pack_messages(chunk))
+    return payloads
+
+class Sequence(object):
+    """
+    The sequence numbers arriving on one link. A gap counts as lost. A record older than the newest one seen is late
+    and dropped, so nothing is applied out of order; it was already counted lost. A jump back of more than RESYNC
+    means the other end restarted, and we start over from it.
+    """
+    RESYNC = 1024
+
+    def __init__(self):
+        self.next = None
+        self.lost = 0
+        self.late = 0
+
+    def accept(self, seq) -> bool:
+        if self.next is not None:
+            gap = (seq - self.next) & SEQ_MASK
+            if gap > SEQ_MASK - self.RESYNC:
+                self.late += 1
+                return False
+            if gap < SEQ_MASK // 2:
+                self.lost += gap
+        self.next = (seq + 1) & SEQ_MASK
+        return True
+
+class ClockEstimate(object):
+    """
+    How far the node's monotonic clock is ahead of ours, NTP style: t0 ping sent, t1 ping received, t2 pong sent, t3
+    pong received. The offset comes from the ping with the shortest round trip of the last SAMPLES, the one least
+    skewed by queueing.
+    """
+    SAMPLES = 8
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=self.SAMPLES)
+        self.offset = None
+        self.rtt = None
+
+    def update(self, t0, t1, t2, t3):
+        self.rtt = (t3 - t0) - (t2 - t1)
+        self.samples.append((self.rtt, ((t1 - t0) + (t2 - t3)) // 2))
+        self.offset = min(self.samples)[1]
+
+class LinkStats(object):
+    """
+    Shared-memory stats for one link, written by the process using it, read by the MetricsProcess. latency is how
+    long a signal took from the node reading it to us reading it, through the clock offset estimate.
+    """
+    OFFSET_MS = 0
+    RTT_MS = 1
+    LOST = 2
+    LATE = 3
+    REMOTE_LOST = 4
+    LAST_PONG = 5
+    # no pong for this long and the node counts as down.
+    DOWN_AFTER_S = 3
+
+    def __init__(self):
+        self.values = multiprocessing.RawArray('d', 6)
+        self.latency = metrics.JitterStats('node_latency')
+
+    def get_dict(self):
+        v = self.values
+        stats = {"node_up": int(v[self.LAST_PONG] > 0 and time.monotonic() - v[self.LAST_PONG] < self.DOWN_AFTER_S),
+                 "node_offset_ms": v[self.OFFSET_MS],
+                 "node_rtt_ms": v[self.RTT_MS],
+                 "node_records_lost": int(v[self.LOST]),
+                 "node_records_late": int(v[self.LATE]),
+                 "node_remote_records_lost": int(v[self.REMOTE_LOST])}
+        stats.update(self.latency.get_dict())
+        return stats
+
+class NodeLink(object):
+    """
+    The MidiPlexer's end of the link to one node port: a connected, non-blocking UDP socket, so only that port's
+    records get through. Pings go out every PING_INTERVAL_NS from service(), which the controller or client calls as
+    part of its normal polling.
+    """
+    PING_INTERVAL_NS = 1000000000
+
+    def __init__(self, host, port, stats=None, logger=None):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(self.address)
+        self.sock.setblocking(False)
+        self.seq = 0
+        self.sequence = Sequence()
+        self.clock = ClockEstimate()
+        self.stats = stats if stats is not None else LinkStats()
+        self.logger = logger if logger is not None else logging.getLogger(f'{self.__class__.__name__}:{host}:{port}')
+        self.next_ping = 0
+        self.up = False
+
+    def send(self, typ, payload=b''):
+        try:
+            self.sock.send(HEADER.pack(typ, self.seq, time.monotonic_ns()) + payload)
+        except OSError as e:
+            # usually nothing listening on the node yet. the pongs tell us when there is.
+            self.logger.debug("Could not send to the node at %s:%s: %s", *self.address, e)
+        self.seq = (self.seq + 1) & SEQ_MASK
+
+    def service(self, now_ns):
+        if now_ns < self.next_ping:
+            return
+        self.next_ping = now_ns + self.PING_INTERVAL_NS
+        self.send(PING)
+        stats = self.stats.values
+        if self.up and time.monotonic() - stats[LinkStats.LAST_PONG] > LinkStats.DOWN_AFTER_S:
+            self.up = False
+            self.logger.warning("Node at %s:%s stopped answering.", *self.address)
+
+    def receive(self) -> list:
+        """
+        read every record waiting on the link. Returns [(node timestamp, when we read it, payload)] for its signal
+        records, in order. Pongs are handled here.
+        """
+        signals = []
+        while True:
+            try:
+                packet = self.sock.recv(65536)
+            except OSError:
+                # nothing waiting, or the node isn't up (connection refused).
+                break
+            now = time.monotonic_ns()
+            try:
+                typ, seq, ts = HEADER.unpack_from(packet)
+            except struct.error:
+                continue
+            if not self.sequence.accept(seq):
+                continue
+            if typ == SIGNAL:
+                signals.append((ts, now, packet[HEADER.size:]))
+            elif typ == PONG:
+                self.pong(ts, now, packet)
+        stats = self.stats.values
+        stats[LinkStats.LOST] = self.sequence.lost
+        stats[LinkStats.LATE] = self.sequence.late
+        return signals
+
+    def pong(self, t2, t3, packet):
+        try:
+            t0, t1, remote_lost = PONG_BODY.unpack_from(packet, HEADER.size)
+        except struct.error:
+            return
+        self.clock.update(t0, t1, t2, t3)
+        stats = self.stats.values
+        stats[LinkStats.OFFSET_MS] = self.clock.offset / 1000000
+        stats[LinkStats.RTT_MS] = self.clock.rtt / 1000000
+        stats[LinkStats.REMOTE_LOST] = remote_lost
+        stats[LinkStats.LAST_PONG] = time.monotonic()
+        if not self.up:
+            self.up = True
+            self.logger.info("Node at %s:%s is up. Round trip %.3f ms.", *self.address, self.clock.rtt / 1000000)
+
+    def close(self):
+        self.sock.close()
+
+class NodeInputPort(object):
+    """
+    A midi input on a node, as a mido input port for MidiController: poll() and receive() give the messages the node
+    forwarded, in the order it read them.
+    """
+    def __init__(self, link):
+        self.link = link
+        self.pending = collections.deque()
+
+    def fill(self):
+        #late import mido, like the ports we stand in for.
+        import mido
+
+        link = self.link
+        link.service(time.monotonic_ns())
+        for ts, now, payload in link.receive():
+            if link.clock.offset is not None:
+                link.stats.latency.record(now - (ts - link.clock.offset))
+            for data in unpack_messages(payload):
+                try:
+                    self.pending.append(mido.Message.from_bytes(data))
+                except ValueError:
+                    link.logger.debug("Dropped an invalid midi message from the node: %s", data.hex())
+
+    def poll(self):
+        if not self.pending:
+            self.fill()
+        return self.pending.popleft() if self.pending else None
+
+    def receive(self):
+        while not self.pending:
+            select.select([self.link.sock], [], [], self.link.PING_INTERVAL_NS / 1e9)
+            self.fill()
+        return self.pending.popleft()
+
+    def close(self):
+        self.link.close()
+
+class NodeOutputPort(object):
+    """
+    A midi output on a node, as a mido output port for MidiClient. Between begin_bundle() and end_bundle(), sends are
+    collected into one record, so a scene change reaches the node in one packet and goes out on its port together.
+    service() keeps the link's pings going; call it every loop.
+    """
+    def __init__(self, link):
+        self.link = link
+        self.bundle = None
+
+    def send(self, msg):
+        data = bytes(msg.bytes())
+        if self.bundle is not None:
+            self.bundle.append(data)
+        else:
+            self.link.send(EVENT, pack_messages([data]))
+
+    def begin_bundle(self):
+        self.bundle = []
+
+    def end_bundle(self):
+        messages, self.bundle = self.bundle, None
+        for payload in chunk_messages(messages):
+            self.link.send(EVENT, payload)
+
+    def service(self):
+        self.link.service(time.monotonic_ns())
+        # only pongs come back on an output link.
+        self.link.receive()
+
+    def close(self):
+        self.link.close()
+
+class NodeEnd(object):
+    """
+    The node's end of one link: a local midi port and the UDP socket the MidiPlexer talks to it on. The MidiPlexer's
+    address is whatever the last record came from, so the node needs no configuration for it.
+    """
+    def __init__(self, name, host, udp_port):
+        self.name = name
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, udp_port))
+        self.sock.setblocking(False)
+        self.peer = None
+        self.seq = 0
+        self.sequence = Sequence()
+        self.midi = None
+
+    def send(self, typ, payload=b''):
+        try:
+            self.sock.sendto(HEADER.pack(typ, self.seq, time.monotonic_ns()) + payload, self.peer)
+        except OSError:
+            pass
+        self.seq = (self.seq + 1) & SEQ_MASK
+
+class Node(multiprocessing.Process):
+    """
+    Hosts midi ports for a MidiPlexer on another machine; see py-midiplexer-node. Each input and output is a local midi
+    port and a UDP port. Routing all happens in the MidiPlexer: the node forwards what its inputs read to a
+    NodeController there, and sends what a NodeClient there sends it. It answers pings with the timestamps the
+    MidiPlexer needs to estimate clock offset and round trip, and the number of records it lost.
+    With echo, outputs open no midi port and send every event back as a signal instead, to test the link.
+    inputs and outputs are {midi port name: udp port}.
+    """
+    POLL_S = 0.001
+
+    def __init__(self, inputs={}, outputs={}, host='0.0.0.0', backend='mido.backends.rtmidi/UNIX_JACK', echo=False,
+                 realtime_options=None):
+        self.shutdown_callback = multiprocessing.Event()
+        self.input_ports = inputs
+        self.output_ports = outputs
+        self.host = host
+        self.backend = backend
+        self.echo = echo
+        self.realtime_options = realtime_options if realtime_options is not None else {}
+        super().__init__()
+        self.name = 'Node'
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def open(self):
+        self.inputs = [NodeEnd(name, self.host, udp_port) for name, udp_port in self.input_ports.items()]
+        self.outputs = [NodeEnd(name, self.host, udp_port) for name, udp_port in self.output_ports.items()]
+        if self.inputs or not self.echo:
+            #late import mido.
+            import mido
+            mido.set_backend(self.backend)
+            for end in self.inputs:
+                end.midi = mido.open_input(end.name, client_name="py_midiplexer", virtual=True)
+            if not self.echo:
+                for end in self.outputs:
+                    end.midi = mido.open_output(end.name, client_name="py_midiplexer")
+        self.selector = selectors.DefaultSelector()
+        for end in self.inputs + self.outputs:
+            self.selector.register(end.sock, selectors.EVENT_READ, end)
+            self.logger.info("Hosting %s on udp port %d.", end.name, end.sock.getsockname()[1])
+
+    def handle(self, end):
+        """
+        everything waiting on one link's socket.
+        """
+        #late import mido.
+        import mido
+
+        while True:
+            try:
+                packet, peer = end.sock.recvfrom(65536)
+            except OSError:
+                break
+            now = time.monotonic_ns()
+            try:
+                typ, seq, ts = HEADER.unpack_from(packet)
+            except struct.error:
+                continue
+            if peer != end.peer:
+                self.logger.info("%s: MidiPlexer at %s:%d.", end.name, *peer)
+                end.peer = peer
+                end.sequence = Sequence()
+            if not end.sequence.accept(seq):
+                continue
+            if typ == PING:
+                end.send(PONG, PONG_BODY.pack(ts, now, end.sequence.lost & SEQ_MASK))
+            elif typ == EVENT:
+                if end.midi is None:
+                    end.send(SIGNAL, packet[HEADER.size:])
+                    continue
+                for data in unpack_messages(packet[HEADER.size:]):
+                    try:
+                        end.midi.send(mido.Message.from_bytes(data))
+                    except ValueError:
+                        self.logger.debug("%s: dropped invalid midi message %s.", end.name, data.hex())
+
+    def forward(self, end):
+        """
+        send whatever a midi input has read since the last loop as one signal record.
+        """
+        messages = [bytes(msg.bytes()) for msg in end.midi.iter_pending()]
+        if not messages:
+            return
+        if end.peer is None:
+            self.logger.debug("%s: no MidiPlexer yet. Dropped %d messages.", end.name, len(messages))
+            return
+        for payload in chunk_messages(messages):
+            end.send(SIGNAL, payload)
+
+    def run(self):
+        self.open()
+        realtime.apply(self.realtime_options, self.logger)
+        while not self.shutdown_callback.is_set():
+            for key, _ in self.selector.select(self.POLL_S):
+                self.handle(key.data)
+            for end in self.inputs:
+                self.forward(end)
+        for end in self.inputs + self.outputs:
+            if end.midi is not None:
+                end.midi.close()
+            end.sock.close()
+
+    def stop(self):
+        self.shutdown_callback.set()
+        self.join()
+
+def probe(host, port, count=1000, messages=16):
+    """
+    Send count events of messages note_ons each to a node started with --echo, one at a time, and report the round
+    trip, how long the events took to reach the node through the clock offset estimate, and records lost each way.
+    Run the node and the probe as two processes, over loopback or the real link.
+    """
+    link = NodeLink(host, port)
+    payload = pack_messages([bytes([0x90, n % 128, 64]) for n in range(messages)])
+    rtts = []
+    one_way = []
+    for i in range(count):
+        if i % 100 == 0:
+            # a few pings along the way, for the clock estimate.
+            link.next_ping = 0
+        link.service(time.monotonic_ns())
+        t0 = time.monotonic_ns()
+        link.send(EVENT, payload)
+        echoed = []
+        deadline = time.monotonic() + 1
+        while not echoed and time.monotonic() < deadline:
+            select.select([link.sock], [], [], 0.1)
+            echoed = link.receive()
+        if echoed:
+            ts, now, _ = echoed[0]
+            rtts.append(now - t0)
+            if link.clock.offset is not None:
+                one_way.append(ts - link.clock.offset - t0)
+    link.next_ping = 0
+    link.service(time.monotonic_ns())
+    time.sleep(0.1)
+    link.receive()
+    link.close()
+    rtts.sort()
+    one_way.sort()
+    stats = link.stats.get_dict()
+    return {'sent': count,
+            'echoed': len(rtts),
+            'rtt_median_us': rtts[len(rtts) // 2] / 1000 if rtts else None,
+            'rtt_p99_us': rtts[int(len(rtts) * 0.99)] / 1000 if rtts else None,
+            'one_way_median_us': one_way[len(one_way) // 2] / 1000 if one_way else None,
+            'offset_ms': stats['node_offset_ms'],
+            'lost': stats['node_records_lost'],
+            'remote_lost': stats['node_remote_records_lost']}
+
+def parse_ports(specs) -> dict:
+    ports = {}
+    for spec in specs:
+        name, _, udp_port = spec.rpartition('=')
+        ports[name] = int(udp_port)
+    return ports
+
+def main():
+    """
+    py-midiplexer-node: host midi ports for a MidiPlexer on another machine, until SIGINT or SIGTERM.
+    """
+    parser = argparse.ArgumentParser(
+        description="Host midi ports for a py_midiplexer on another machine.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--input", action="append", default=[], metavar="NAME=UDP_PORT",
+                        help="A midi input to forward to a node controller. Repeat for more")
+    parser.add_argument("--output", action="append", default=[], metavar="NAME=UDP_PORT",
+                        help="A midi output for a node client. Repeat for more")
+    parser.add_argument("--backend", default='mido.backends.rtmidi/UNIX_JACK', help="mido backend for the midi ports")
+    parser.add_argument("--echo", action="store_true",
+                        help="Send events on outputs back instead of opening midi ports, to test the link")
+    parser.add_argument("--probe", default=None, metavar="HOST:UDP_PORT",
+                        help="Don't host anything; probe an --echo node's output and report the link's latency")
+    parser.add_argument("--count", type=int, default=1000, help="Events to send with --probe")
+    cli.add_realtime_options(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    cli.use_fork()
+
+    if args.probe is not None:
+        host, _, port = args.probe.rpartition(':')
+        for k, v in probe(host, int(port), args.count).items():
+            print(f"{k}: {v:.1f}" if isinstance(v, float) else f"{k}: {v}")
+        return
+
+    node = Node(inputs=parse_ports(args.input), outputs=parse_ports(args.output), host=args.host,
+                backend=args.backend, echo=args.echo, realtime_options=cli.realtime_defaults(args))
+    node.start()
+    # blocked only after the fork, so the node process doesn't inherit the mask.
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT, signal.SIGTERM})
+    signal.sigwait({signal.SIGINT, signal.SIGTERM})
+    node.stop()
+
+if __name__ == "__main__":
+    main()
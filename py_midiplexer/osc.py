@@ -0,0 +1,253 @@
+from py_midiplexer import metrics
+import argparse
+import logging
+import socket
+import errno
+import struct
+import threading
+import time
+
+# timetag 1 means "now" in OSC.
+IMMEDIATELY = struct.pack('>Q', 1)
+BUNDLE_HEAD = b'#bundle\x00' + IMMEDIATELY
+INT = struct.Struct('>i')
+FLOAT = struct.Struct('>f')
+
+def encode_string(s) -> bytes:
+    data = s.encode() if isinstance(s, str) else s
+    # null terminated, padded to a multiple of four.
+    return data + b'\x00' * (4 - len(data) % 4)
+
+def encode_blob(b) -> bytes:
+    return INT.pack(len(b)) + b + b'\x00' * (-len(b) % 4)
+
+def encode_message(address, args=()) -> bytes:
+    tags = ','
+    data = b''
+    for arg in args:
+        if arg is True:
+            tags += 'T'
+        elif arg is False:
+            tags += 'F'
+        elif isinstance(arg, int):
+            tags += 'i'
+            data += INT.pack(arg)
+        elif isinstance(arg, float):
+            tags += 'f'
+            data += FLOAT.pack(arg)
+        elif isinstance(arg, str):
+            tags += 's'
+            data += encode_string(arg)
+        elif isinstance(arg, (bytes, bytearray)):
+            tags += 'b'
+            data += encode_blob(bytes(arg))
+        else:
+            raise TypeError(f"Can't send {arg!r} over OSC.")
+    return encode_string(address) + encode_string(tags) + data
+
+def encode_bundle(packets) -> bytes:
+    """
+    packets are encoded messages or bundles. the bundle is for immediate delivery.
+    """
+    return BUNDLE_HEAD + b''.join(INT.pack(len(p)) + p for p in packets)
+
+def read_string(packet, i):
+    end = packet.index(b'\x00', i)
+    return packet[i:end].decode(), (end + 4) & ~3
+
+def decode(packet) -> list:
+    """
+    returns the (address, args) of every message in packet, bundles flattened in order.
+    """
+    if packet.startswith(b'#bundle\x00'):
+        messages = []
+        i = len(BUNDLE_HEAD)
+        while i < len(packet):
+            n, = INT.unpack_from(packet, i)
+            messages += decode(packet[i + 4:i + 4 + n])
+            i += 4 + n
+        return messages
+    address, i = read_string(packet, 0)
+    tags, i = read_string(packet, i)
+    args = []
+    for tag in tags[1:]:
+        if tag == 'i':
+            args.append(INT.unpack_from(packet, i)[0])
+            i += 4
+        elif tag == 'f':
+            args.append(FLOAT.unpack_from(packet, i)[0])
+            i += 4
+        elif tag == 's':
+            s, i = read_string(packet, i)
+            args.append(s)
+        elif tag == 'b':
+            n, = INT.unpack_from(packet, i)
+            args.append(packet[i + 4:i + 4 + n])
+            i += 4 + n + (-n % 4)
+        elif tag == 'T':
+            args.append(True)
+        elif tag == 'F':
+            args.append(False)
+        else:
+            raise ValueError(f"Unsupported OSC type tag '{tag}'.")
+    return [(address, args)]
+
+def message_key(address, args) -> str:
+    """
+    how an OSC message appears in a controller's signal_map, like the hex of a midi message: the address and args,
+    space-separated. "/fcb/switch 1"
+    """
+    return ' '.join([address] + [str(a) for a in args])
+
+class Message(object):
+    """
+    An OSC message, encoded once when it's made. bytes() gives the packet, like a mido Message's bytes(), so the
+    port wrappers can record it.
+    """
+    __slots__ = ('address', 'args', 'packet')
+
+    def __init__(self, address, args=()):
+        self.address = address
+        self.args = tuple(args)
+        self.packet = encode_message(address, self.args)
+
+    def bytes(self):
+        return self.packet
+
+    def __repr__(self):
+        return f"Message({message_key(self.address, self.args)!r})"
+
+class OscPort(object):
+    """
+    Sends OSC messages to one host and port over UDP. Between begin_bundle() and end_bundle(), sends are collected
+    and go out as one bundle, or as the message itself if there was only one. A bundle too big for one datagram goes
+    out in halves. A send that fails, usually because nothing is listening yet, is counted as sends_failed and
+    dropped.
+    """
+    def __init__(self, host, port, counters=None):
+        self.address = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(self.address)
+        self.bundle = None
+        self.counters = counters if counters is not None else metrics.Counters()
+        self.failing = False
+        self.logger = logging.getLogger(f'{self.__class__.__name__}:{host}:{port}')
+
+    def send(self, msg):
+        if self.bundle is not None:
+            self.bundle.append(msg.packet)
+        else:
+            self.transmit(msg.packet)
+
+    def begin_bundle(self):
+        self.bundle = []
+
+    def end_bundle(self):
+        packets, self.bundle = self.bundle, None
+        if packets:
+            self.send_packets(packets)
+
+    def send_packets(self, packets):
+        if len(packets) == 1:
+            self.transmit(packets[0])
+            return
+        try:
+            self.sock.send(encode_bundle(packets))
+            self.failing = False
+        except OSError as e:
+            if e.errno != errno.EMSGSIZE:
+                self.failed(e, len(packets))
+                return
+            half = len(packets) // 2
+            self.send_packets(packets[:half])
+            self.send_packets(packets[half:])
+
+    def transmit(self, packet):
+        try:
+            self.sock.send(packet)
+            self.failing = False
+        except OSError as e:
+            self.failed(e, 1)
+
+    def failed(self, e, n):
+        self.counters.incr(metrics.SENDS_FAILED, n)
+        if not self.failing:
+            self.logger.warning("Could not send to %s:%s: %s", *self.address, e)
+            self.failing = True
+        else:
+            self.logger.debug("Could not send to %s:%s: %s", *self.address, e)
+
+    def close(self):
+        self.sock.close()
+
+def bench(tracks=16, changes=2000, midi_port=None):
+    """
+    Send scene changes of tracks messages each to a local UDP stand-in, as separate packets and as one bundle, and
+    report throughput and the time from starting a change until the stand-in has all of it. With midi_port, do the
+    same with note_on messages on that mido output port, timing the sends only.
+    """
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    receiver.bind(('127.0.0.1', 0))
+    port = OscPort(*receiver.getsockname())
+    msgs = [Message(f'/luppp/track/{t}/clip/play', [t, 0]) for t in range(tracks)]
+    results = {}
+
+    def stand_in(expected, done, latencies, starts):
+        got = 0
+        change = 0
+        while change < changes:
+            got += len(decode(receiver.recv(65536)))
+            if got >= expected:
+                latencies.append(time.perf_counter_ns() - starts[change])
+                got -= expected
+                change += 1
+        done.set()
+
+    for mode in ('packets', 'bundle'):
+        latencies = []
+        starts = [0] * changes
+        done = threading.Event()
+        t = threading.Thread(target=stand_in, args=(tracks, done, latencies, starts), daemon=True)
+        t.start()
+        t0 = time.perf_counter()
+        for i in range(changes):
+            starts[i] = time.perf_counter_ns()
+            if mode == 'bundle':
+                port.begin_bundle()
+            for msg in msgs:
+                port.send(msg)
+            if mode == 'bundle':
+                port.end_bundle()
+            # don't outrun the stand-in; this measures latency, not socket buffers.
+            while len(latencies) <= i and not done.is_set():
+                pass
+        done.wait(5)
+        elapsed = time.perf_counter() - t0
+        latencies.sort()
+        results[mode] = {'changes_per_s': changes / elapsed,
+                         'median_us': latencies[len(latencies) // 2] / 1000 if latencies else None,
+                         'p99_us': latencies[int(len(latencies) * 0.99)] / 1000 if latencies else None}
+
+    if midi_port is not None:
+        import mido
+        out = mido.open_output(midi_port)
+        midi = [mido.Message('note_on', note=t) for t in range(tracks)]
+        t0 = time.perf_counter()
+        for i in range(changes):
+            for msg in midi:
+                out.send(msg)
+        results['midi'] = {'changes_per_s': changes / (time.perf_counter() - t0)}
+        out.close()
+    port.close()
+    receiver.close()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare separate OSC packets, OSC bundles and midi for scene changes.")
+    parser.add_argument("--tracks", type=int, default=16, help="messages per scene change")
+    parser.add_argument("--changes", type=int, default=2000, help="scene changes to send")
+    parser.add_argument("--midi-port", default=None, help="also time the same sends on this mido output port")
+    args = parser.parse_args()
+    for mode, r in bench(args.tracks, args.changes, args.midi_port).items():
+        print(mode, ' '.join(f"{k}={v:.1f}" for k, v in r.items() if v is not None))
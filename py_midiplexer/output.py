@@ -0,0 +1,99 @@
+from py_midiplexer import metrics
+import time
+
+# 31.25 kbaud, 10 bits on the wire per byte.
+DIN_MIDI_BANDWIDTH = 3125
+
+def coalesce_key(msg):
+    """
+    messages with the same key supersede each other within a tick. None for messages that must all be sent.
+    """
+    if msg.type == 'control_change':
+        return ('control_change', msg.channel, msg.control)
+    if msg.type == 'pitchwheel':
+        return ('pitchwheel', msg.channel)
+    return None
+
+class PacedPort(object):
+    """
+    Optional output stage for a client. Messages sent during a tick are buffered. flush() is called once per tick;
+    it drops superseded cc/pitchwheel values and releases what the token bucket allows. Whatever doesn't fit waits for
+    the next tick, and can still be superseded there.
+
+    bandwidth is in bytes per second, 0 for unlimited. burst is the bucket size in bytes. With running_status, a
+    channel message that repeats the previous status byte is charged one byte less. The port itself still gets whole
+    messages; dropping the status byte on the wire is up to the interface driver. This only makes sure we don't
+    throttle harder than the wire needs.
+    """
+    def __init__(self, port, bandwidth=DIN_MIDI_BANDWIDTH, burst=32, coalesce=True, running_status=True,
+                 counters=None):
+        self.port = port
+        self.bandwidth = bandwidth
+        self.burst = burst
+        self.coalesce = coalesce
+        self.running_status = running_status
+        self.counters = counters
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.last_status = None
+        self.pending = []
+        # coalesce key -> index in pending
+        self.slots = {}
+
+    def send(self, msg):
+        if self.coalesce:
+            key = coalesce_key(msg)
+            if key is not None:
+                i = self.slots.get(key)
+                if i is not None:
+                    self.pending[i] = msg
+                    if self.counters is not None:
+                        self.counters.incr(metrics.MESSAGES_COALESCED)
+                    return
+                self.slots[key] = len(self.pending)
+        self.pending.append(msg)
+
+    def wire_size(self, msg):
+        data = msg.bytes()
+        status = data[0]
+        if status >= 0xf8:
+            # realtime. doesn't touch running status.
+            return len(data)
+        if status >= 0xf0:
+            self.last_status = None
+            return len(data)
+        size = len(data)
+        if self.running_status and status == self.last_status:
+            size -= 1
+        self.last_status = status
+        return size
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.bandwidth:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.bandwidth)
+            self.last_refill = now
+        n = 0
+        for msg in self.pending:
+            if self.bandwidth:
+                last_status = self.last_status
+                cost = self.wire_size(msg)
+                # a message bigger than the whole bucket goes out whenever the bucket is full.
+                if cost > self.tokens and self.tokens < self.burst:
+                    # put running status back the way it was; this one didn't go out.
+                    self.last_status = last_status
+                    break
+                self.tokens -= cost
+            self.port.send(msg)
+            n += 1
+        if n == len(self.pending):
+            self.pending.clear()
+            self.slots.clear()
+        else:
+            del self.pending[:n]
+            self.slots = {key: i - n for key, i in self.slots.items() if i >= n}
+
+    def close(self):
+        self.port.close()
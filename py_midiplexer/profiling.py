@@ -0,0 +1,70 @@
+import cProfile
+import pstats
+import logging
+import time
+import glob
+import os
+
+# every process that profiles, by kind rather than class, so subclasses like OscClient merge with the rest.
+PROCTYPES = ('mux', 'controller', 'client')
+
+class Profiler(object):
+    """
+    Per-process cProfile window. Every midiplexer process owns one and calls check() from its loop; when no window
+    is open that's a single comparison.
+    """
+    def __init__(self, proctype: str, name: str):
+        self.proctype = proctype
+        self.name = name
+        self.profile = None
+        self.deadline = None
+        self.outdir = None
+        self.logger = logging.getLogger(f'{self.__class__.__name__}:{self.name}')
+
+    def start(self, seconds, outdir):
+        if self.profile is not None:
+            self.logger.warning("Already profiling.")
+            return
+        self.outdir = outdir
+        self.deadline = time.monotonic() + seconds
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def check(self):
+        """
+        stop and dump the profile once the window has passed. Returns the dump path if one was written.
+        """
+        if self.deadline is None or time.monotonic() < self.deadline:
+            return None
+        return self.stop()
+
+    def stop(self):
+        if self.profile is None:
+            return None
+        self.profile.disable()
+        os.makedirs(self.outdir, exist_ok=True)
+        path = os.path.join(self.outdir, f'{self.proctype}.{self.name}.{os.getpid()}.prof')
+        self.profile.dump_stats(path)
+        self.profile = None
+        self.deadline = None
+        self.logger.info("Wrote profile %s.", path)
+        return path
+
+def merge_profiles(outdir, proctypes=PROCTYPES, sort='cumulative', limit=50):
+    """
+    Merge the per-process dumps in outdir into one report per process type: <type>.prof for further digging
+    and <type>.txt with the top entries. Returns the list of text reports written.
+    """
+    reports = []
+    for proctype in proctypes:
+        dumps = glob.glob(os.path.join(outdir, f'{proctype}.*.prof'))
+        if not dumps:
+            continue
+        txt = os.path.join(outdir, f'{proctype}.txt')
+        with open(txt, 'w') as f:
+            stats = pstats.Stats(*dumps, stream=f)
+            f.write(f'{proctype}: merged {len(dumps)} process(es)\n')
+            stats.sort_stats(sort).print_stats(limit)
+        stats.dump_stats(os.path.join(outdir, f'{proctype}.prof'))
+        reports.append(txt)
+    return reports
@@ -1,7 +1,21 @@
-from enum import Enum
 from pprint import pprint
-from py_midiplexer.controller import MidiController, Controller
-from py_midiplexer.client import MidiClient, Client
+from py_midiplexer.mode import Mode
+from py_midiplexer.controller import MidiController, OscController, NodeController, Controller
+from py_midiplexer.client import MidiClient, MidiClockClient, OscClient, NodeClient, Client
+from py_midiplexer.logprocess import LogProcess
+from py_midiplexer.profiling import Profiler, merge_profiles
+from py_midiplexer import metrics
+from py_midiplexer.tracing import Tracer, merge_traces
+from py_midiplexer.recording import RecordProcess
+from py_midiplexer.boundedqueue import BoundedQueue, signal_key
+from py_midiplexer.timebase import Timebase
+from py_midiplexer import realtime
+from py_midiplexer.supervisor import Supervisor, join_all
+from py_midiplexer.mapindex import MapIndex
+from py_midiplexer.configstore import ConfigStore
+from py_midiplexer.status import TrackStates, RecentSignals
+from py_midiplexer.scripts import ScriptPool
+from py_midiplexer import curves
 from py_midiplexer import exceptions
 import multiprocessing
 from multiprocessing.sharedctypes import Array
@@ -10,45 +24,105 @@ import logging
 import queue
 import time
 import traceback
+import gc
 import os
 import json
+import signal as posix_signal
 
-class Mode(Enum):
-    """
-    I think the most important distinction between trigger and scene is that trigger just fires off signals at the specified
-    client(s)/track(s), but scene tries to turn off other tracks. It's not perfect since we don't have any feedback on the current
-    state of a track (yet. Can you say OSC?). So, for now, we'll blindly assume that everything will be found exactly as midiplexer
-    left it (or at least hope that the user manually returned things to the expected state). 
-    It was going to be that trigger was one-at-a-time, but it's frankly too much work to enforce that, and what's the point? It's
-    an option to do one-at-a-time, just don't screw up the config. 
-    """
-    TRIGGER = 1
-    SCENE = 2
-    
 class MidiPlexer(multiprocessing.Process):
-    def __init__(self, f=os.environ['HOME']+'/.config/py-midiplexer/config.json', daemon_mode=True):
+    def __init__(self,
+                 f=os.environ['HOME']+'/.config/py-midiplexer/config.json',
+                 daemon_mode=True,
+                 metrics_path=os.environ['HOME']+'/.cache/py-midiplexer/metrics.prom',
+                 fast_path=True,
+                 realtime_defaults=None):
         self.logger = logging.getLogger('MidiPlexer')
+        # CLOCK_MONOTONIC is system wide, so the MidiPlexer process can time its start from here. see check_ready().
+        self.created = time.monotonic()
+        # seconds from created until every port was up, or 0 until then.
+        self.ready_time = multiprocessing.RawValue('d', 0)
+        # while the config loads, controllers and clients are only built. they're all started together at the end.
+        self.loading = False
         self.shutdown_callback = multiprocessing.Event()
-        self.signal_queue = multiprocessing.Queue()
+        self.signal_queue = BoundedQueue(key=signal_key)
+        # {"signal_queue": {"maxsize": ..., "policy": ...}, "event_queue": {...}}. see BoundedQueue.
+        self.queue_options = {}
         self.command_queue = multiprocessing.Queue()
         self.stdout_queue = multiprocessing.Queue()
         self.config_queue = multiprocessing.Queue()
-        self.status_queue = multiprocessing.Queue()
+        # created in run(), by the process that starts it.
+        self.log_process = None
+        self.counters = metrics.Counters()
+        self.metrics_path = metrics_path
+        self.metrics_process = None
 
         self.daemon_mode = daemon_mode
         self.config = f
 
         self.saved = True
+        # the config as of the last loop, for the shell and anything else to read without asking. see ConfigStore.
+        self.config_store = ConfigStore()
+        self.config_dirty = True
+        # mode, saved and the like for the shell's status bar, published only when something changed. see
+        # update_status().
+        self.status_store = ConfigStore(capacity=64 * 1024)
+        self.status = None
+        # (controller, signal, time) of the latest signals, for the status.
+        self.recent_signals = RecentSignals()
+        # [track] lists for trigger_track(), built once per track label rather than once per signal.
+        self.single_tracklists = {}
+        # every client's track state, where the shell can read it. {client name: slot}
+        self.trackstates = TrackStates(Client.TRACKSTATE_SIZE)
+        self.trackstate_slots = {}
         self.clients = []
         self.controllers = []
         self.scenes = {}
         self.controller_signal_scene_map = {}
         self.controller_signal_trigger_map = {}
         self.mode_switch = {}
-        self.mode = Mode.TRIGGER
+        # {controller: {signal: {"code": ... or "file": ..., "timeout_ms": ...}}}. a signal with a script runs it
+        # instead of anything the other maps say. see ScriptPool.
+        self.controller_signal_script_map = {}
+        self.scripts = ScriptPool(counters=self.counters)
+        # reverse indexes over the three maps above. see MapIndex.
+        self.index = MapIndex()
+        # {label: {"controller": ..., "input": {"type", "channel", "control"}, "targets": [{"client", "track"}],
+        #          "curve": ...}}
+        self.continuous_map = {}
+        # shared with the controllers so they can route trigger-mode signals and apply mode switches themselves.
+        self.shared_mode = multiprocessing.Value('i', Mode.TRIGGER.value)
+        self.fast_path = fast_path
+        # realtime options from the command line, and the config file's "realtime" section that refines them per
+        # process. see realtime.resolve().
+        self.realtime_defaults = realtime_defaults if realtime_defaults is not None else {}
+        self.realtime_config = {}
+        self.supervisor = Supervisor()
+        # written by whichever clock client or clock source controller is running, read by every client to hold
+        # quantised triggers until the next boundary.
+        self.timebase = Timebase()
+        # triggers wait for the next multiple of this many beats. 0 sends them right away.
+        self.quantize = 0
+        self.profiler = Profiler('mux', 'mux')
+        self.pending_profile = None
+        self.trace_trigger = multiprocessing.Event()
+        self.tracer = Tracer(self.__class__.__name__, 'mux', trigger=self.trace_trigger)
+        self.trace_outdir = None
+        self.pending_trace = None
+        self.trace_dumps = 0
+        self.record_queue = multiprocessing.Queue()
+        self.record_process = None
+        self.recording = False
 
         super().__init__()
 
+    @property
+    def mode(self) -> Mode:
+        return Mode(self.shared_mode.value)
+
+    @mode.setter
+    def mode(self, mode: Mode):
+        self.shared_mode.value = mode.value
+
     def controller_listen(self, controller: Controller):
             signal = controller.check()
             if signal is not None:
@@ -59,13 +133,10 @@ class MidiPlexer(multiprocessing.Process):
         """
         Adds a new scene to the config based on the currently-playing tracks across all clients
         """
-        scene_dict = {}
-        for client in self.clients:
-            client.command_queue.put({'queue_trackstate_playing':None})
-            scene_dict.update({client.name: client.trackstate_queue.get()})
-        self.scenes.update({scene_label: scene_dict})
+        scene_dict = {client.name: client.playing_tracks() for client in self.clients}
+        self.set_scene(scene_label, scene_dict)
 
-        self.saved = False
+        self.mark_changed()
             
         
 
@@ -90,37 +161,120 @@ class MidiPlexer(multiprocessing.Process):
             self.saved = True
 
     def process_conf_dict(self, conf):
+        self.queue_options = conf.get('queues', {})
+        # nothing has been forked yet that holds the signal queue, so it can still be replaced.
+        self.signal_queue = BoundedQueue(key=signal_key, **self.queue_options.get('signal_queue', {}))
+        self.realtime_config = conf.get('realtime', {})
+        self.supervisor = Supervisor(**conf.get('supervisor', {}))
+        self.loading = True
         for client in conf['clients']:
-            self.add_client(client['name'], toggle_record=client['toggle_record'], type=client['type'], tracks=client['tracks'])
+            self.add_client(client['name'], toggle_record=client['toggle_record'], type=client['type'], tracks=client['tracks'],
+                            output=client.get('output'), clock=client.get('clock'), feedback=client.get('feedback'),
+                            osc=client.get('osc'), node=client.get('node'))
         for ctrlr in conf['controllers']:
-            self.add_controller(ctrlr['name'], type=ctrlr['type'], signal_map=ctrlr['signal_map']) 
+            self.add_controller(ctrlr['name'], type=ctrlr['type'], signal_map=ctrlr['signal_map'],
+                                clock_source=ctrlr.get('clock_source', False), gestures=ctrlr.get('gestures'),
+                                debounce=ctrlr.get('debounce'), osc=ctrlr.get('osc'), node=ctrlr.get('node'))
         self.scenes = conf['scenes']
         self.controller_signal_scene_map = conf['controller_signal_scene_map']
         self.controller_signal_trigger_map = conf['controller_signal_trigger_map']
         self.mode_switch = conf['mode_switch']
-        
-    def add_controller(self, name, type='midi', signal_map={}):
+        self.continuous_map = conf.get('continuous_map', {})
+        self.quantize = conf.get('quantize', 0)
+        self.controller_signal_script_map = conf.get('controller_signal_script_map', {})
+        self.scripts = ScriptPool(counters=self.counters, **conf.get('scripts', {}))
+        self.scripts.set_scripts(self.controller_signal_script_map)
+        self.rebuild_index()
+        self.loading = False
+        if self.daemon_mode:
+            # every child opens its own port, so starting them back to back brings the ports up in parallel.
+            for c in self.controllers + self.clients:
+                c.start()
+        self.push_routes()
+
+    def build_controller(self, name, type='midi', signal_map={}, clock_source=False, gestures=None, debounce=None,
+                         osc=None, node=None):
+        fast_path = {}
+        if self.fast_path:
+            fast_path = {'event_queues': {c.name: c.event_queue for c in self.clients}, 'shared_mode': self.shared_mode}
+        common = dict(signal_map=signal_map, trace_trigger=self.trace_trigger,
+                      continuous_queues={c.name: c.continuous_queue for c in self.clients},
+                      timebase=self.timebase, clock_source=clock_source, gestures=gestures, debounce=debounce,
+                      realtime_options=realtime.resolve(self.realtime_defaults, self.realtime_config, 'controller',
+                                                        name),
+                      **fast_path)
+        if type == 'midi':
+            return MidiController(self.shutdown_callback, self.signal_queue, self.stdout_queue, name, **common)
+        if type == 'osc':
+            return OscController(self.shutdown_callback, self.signal_queue, self.stdout_queue, name, osc=osc, **common)
+        if type == 'node':
+            return NodeController(self.shutdown_callback, self.signal_queue, self.stdout_queue, name, node=node,
+                                  **common)
+        self.logger.error("Unknown controller type %s.", type)
+        return None
+
+    def add_controller(self, name, type='midi', signal_map={}, clock_source=False, gestures=None, debounce=None,
+                       osc=None, node=None):
         self.logger.debug(f'command received: add controller "{name}"')
-        if type == 'midi': #maybe someday we'll have an osc controller class...
-            controller = MidiController(self.shutdown_callback, self.signal_queue, self.stdout_queue, name, signal_map=signal_map)
+        controller = self.build_controller(name, type=type, signal_map=signal_map, clock_source=clock_source,
+                                           gestures=gestures, debounce=debounce, osc=osc, node=node)
+        if controller is not None:
             self.controllers.append(controller)
-            if self.daemon_mode:
+            if self.daemon_mode and not self.loading:
                 controller.start()
-        self.saved = False
+                self.restart_metrics()
+                self.push_routes()
+        self.mark_changed()
 
-    def add_client(self, name, toggle_record=False, type='midi', tracks={}):
-        if type == 'midi': #maybe someday we'll have an osc client class...
-            client = MidiClient(self.shutdown_callback, self.stdout_queue, name, tracks=tracks, toggle_record=toggle_record)
-            self.clients.append(client)
-            if self.daemon_mode:
-                client.start()
-        self.saved = False
+    def build_client(self, name, toggle_record=False, type='midi', tracks={}, output=None, clock=None, feedback=None,
+                     trackstate=None, osc=None, node=None):
+        common = {'tracks': tracks,
+                  'trackstate': trackstate,
+                  'toggle_record': toggle_record,
+                  'trace_trigger': self.trace_trigger,
+                  'record_queue': self.record_queue,
+                  'event_queue_options': self.queue_options.get('event_queue', {}),
+                  'output_options': output,
+                  'timebase': self.timebase,
+                  'realtime_options': realtime.resolve(self.realtime_defaults, self.realtime_config, 'client', name)}
+        if type == 'midi':
+            return MidiClient(self.shutdown_callback, self.stdout_queue, name, feedback_options=feedback, **common)
+        if type == 'osc':
+            return OscClient(self.shutdown_callback, self.stdout_queue, name, osc=osc, **common)
+        if type == 'node':
+            return NodeClient(self.shutdown_callback, self.stdout_queue, name, node=node, **common)
+        if type == 'clock':
+            return MidiClockClient(self.shutdown_callback, self.stdout_queue, name, clock=clock, **common)
+        self.logger.error("Unknown client type %s.", type)
+        return None
+
+    def add_client(self, name, toggle_record=False, type='midi', tracks={}, output=None, clock=None, feedback=None,
+                   osc=None, node=None):
+        slot = self.trackstates.allocate()
+        if slot is None:
+            self.logger.warning("No track state slots left. %s's tracks won't show in the shell.", name)
+        client = self.build_client(name, toggle_record=toggle_record, type=type, tracks=tracks, output=output,
+                                   clock=clock, feedback=feedback, osc=osc, node=node,
+                                   trackstate=self.trackstates.view(slot) if slot is not None else None)
+        if client is None:
+            if slot is not None:
+                self.trackstates.release(slot)
+            return
+        if slot is not None:
+            self.trackstate_slots[name] = slot
+        self.clients.append(client)
+        if self.daemon_mode and not self.loading:
+            client.start()
+            self.restart_metrics()
+        self.mark_changed()
 
     def client_add_track(self, client_name, track_label, attrs):
         for client in self.clients:
             if client.name == client_name:
                 client.command_queue.put({'create_track':(track_label, attrs)})
-        self.saved = False
+                # keep our copy of the client's tracks current for the supervisor.
+                client.create_track(track_label, attrs)
+        self.mark_changed()
 
     def client_list_tracks(self, client_name):
         for client in self.clients:
@@ -129,7 +283,7 @@ class MidiPlexer(multiprocessing.Process):
                 
     def add_scene(self, scene: str):
         self.scenes.update({scene: {}})
-        self.saved = False
+        self.mark_changed()
         
     def add_track_to_scene(self, client: str, track_label, scene: str):
         if scene not in self.scenes.keys():
@@ -138,7 +292,21 @@ class MidiPlexer(multiprocessing.Process):
             self.scenes[scene][client].append(track_label)
         else:
             self.scenes[scene].update({client: [track_label]})
-        self.saved = False
+        self.index.add_scene_track(scene, client, track_label)
+        self.mark_changed()
+
+    def set_scene(self, scene: str, scene_dict: dict):
+        """
+        replace a scene's tracks wholesale.
+        """
+        for client, tracks in self.scenes.get(scene, {}).items():
+            for track in tracks:
+                self.index.remove_scene_track(scene, client, track, False)
+        self.scenes.update({scene: scene_dict})
+        for client, tracks in scene_dict.items():
+            for track in tracks:
+                self.index.add_scene_track(scene, client, track)
+        self.mark_changed()
 
     def assign_track(self, controller: str, signal, client: str, track_label):
         if controller in self.controller_signal_trigger_map.keys():
@@ -151,51 +319,346 @@ class MidiPlexer(multiprocessing.Process):
                 self.controller_signal_trigger_map[controller].update({signal: {client: [track_label]}})
         else:
             self.controller_signal_trigger_map.update({controller: {signal: {client: [track_label]}}})
-        self.saved = False
-        
+        self.index.add_trigger(controller, signal, client, track_label)
+        self.push_routes()
+        self.mark_changed()
+
+    def delete_trigger(self, controller: str, signal, client: str=None, track_label=None):
+        """
+        Remove a trigger mapping. Without a client, the signal stops triggering anything; without a track, it stops
+        triggering anything on that client.
+        """
+        try:
+            clients = self.controller_signal_trigger_map[controller][signal]
+        except KeyError:
+            raise exceptions.NoSuchSignal(controller, signal)
+        if client is not None:
+            if client not in clients:
+                raise exceptions.NoSuchClient(client)
+            if track_label is not None and track_label not in clients[client]:
+                raise exceptions.NoSuchTrack(client, track_label)
+        for c in [client] if client is not None else list(clients):
+            tracks = clients.get(c, [])
+            for t in [track_label] if track_label is not None else list(tracks):
+                if t in tracks:
+                    tracks.remove(t)
+                self.index.remove_trigger(controller, signal, c, t, bool(tracks))
+            if not tracks:
+                clients.pop(c, None)
+        if not clients:
+            del self.controller_signal_trigger_map[controller][signal]
+        self.push_routes()
+        self.mark_changed()
+
     def assign_scene(self, controller: str, signal, scene: str):
         if scene not in self.scenes.keys():
             self.add_scene(scene)
         if controller in self.controller_signal_scene_map.keys():
             if signal in self.controller_signal_scene_map[controller].keys():
-                self.controller_signal_scene_map[controller][signal].update(scene)
-            else:
-                self.controller_signal_scene_map[controller].update({signal: scene})
+                # one scene per signal. the new one replaces the old.
+                self.index.remove_scene_trigger(controller, signal, self.controller_signal_scene_map[controller][signal])
+            self.controller_signal_scene_map[controller].update({signal: scene})
         else:
             self.controller_signal_scene_map.update({controller: {signal: scene}})
-        self.saved = False
+        self.index.add_scene_trigger(controller, signal, scene)
+        self.mark_changed()
+
+    def delete_scene_trigger(self, controller: str, signal):
+        try:
+            scene = self.controller_signal_scene_map[controller].pop(signal)
+        except KeyError:
+            raise exceptions.NoSuchSignal(controller, signal)
+        self.index.remove_scene_trigger(controller, signal, scene)
+        self.mark_changed()
+
+    def rename_track(self, client: str, old, new):
+        """
+        Rename a client's track everywhere it's used: the client itself, trigger mappings, scenes and continuous
+        mappings.
+        """
+        c = self.get_client(client)
+        if c is None or old not in c.tracks:
+            raise exceptions.NoSuchTrack(client, old)
+        if new in c.tracks:
+            self.logger.error("Client %s already has a track %s.", client, new)
+            return
+        c.command_queue.put({'rename_track': (old, new)})
+        c.rename_track(old, new)
+        for controller, signal in self.index.track_signals.pop((client, old), set()):
+            tracks = self.controller_signal_trigger_map[controller][signal][client]
+            tracks[tracks.index(old)] = new
+            self.index.add_trigger(controller, signal, client, new)
+        for scene in self.index.track_scenes.pop((client, old), set()):
+            tracks = self.scenes[scene][client]
+            tracks[tracks.index(old)] = new
+            self.index.add_scene_track(scene, client, new)
+        for m in self.continuous_map.values():
+            for target in m['targets']:
+                if target['client'] == client and target['track'] == old:
+                    target['track'] = new
+        self.push_routes()
+        self.mark_changed()
+
+    def rename_scene(self, old: str, new: str):
+        if old not in self.scenes:
+            raise exceptions.NoSuchScene(old)
+        if new in self.scenes:
+            self.logger.error("There's already a scene %s.", new)
+            return
+        self.scenes[new] = self.scenes.pop(old)
+        for controller, signal in self.index.scene_signals.pop(old, set()):
+            self.controller_signal_scene_map[controller][signal] = new
+            self.index.add_scene_trigger(controller, signal, new)
+        for client, tracks in self.scenes[new].items():
+            for track in tracks:
+                self.index.remove_scene_track(old, client, track, False)
+                self.index.add_scene_track(new, client, track)
+        self.mark_changed()
+
+    def where_used(self, client: str, track_label) -> dict:
+        """
+        every signal that triggers a track and every scene it's in, plus its continuous mappings.
+        """
+        used = self.index.where_used(client, track_label)
+        used["continuous"] = sorted(label for label, m in self.continuous_map.items()
+                                    if {'client': client, 'track': track_label} in m['targets'])
+        return used
+
+    def remove_client(self, client: str):
+        """
+        Stop a client's process and remove it and every mapping that refers to it.
+        """
+        c = self.get_client(client)
+        if c is None:
+            raise exceptions.NoSuchClient(client)
+        for controller, signal in list(self.index.client_signals.get(client, ())):
+            if client in self.controller_signal_trigger_map.get(controller, {}).get(signal, {}):
+                self.delete_trigger(controller, signal, client)
+        self.index.client_signals.pop(client, None)
+        for scene in self.index.client_scenes.pop(client, set()):
+            for track in self.scenes[scene].pop(client, []):
+                self.index.track_scenes.get((client, track), set()).discard(scene)
+        for label in list(self.continuous_map):
+            m = self.continuous_map[label]
+            m['targets'] = [t for t in m['targets'] if t['client'] != client]
+            if not m['targets']:
+                del self.continuous_map[label]
+        # out of the list first so the supervisor doesn't bring it back.
+        self.clients.remove(c)
+        if c.pid is not None:
+            c.command_queue.put({'exit': ()})
+            for stuck in join_all([c], self.supervisor.shutdown_timeout):
+                stuck.terminate()
+                stuck.join()
+        if client in self.trackstate_slots:
+            self.trackstates.release(self.trackstate_slots.pop(client))
+        self.restart_metrics()
+        self.push_routes()
+        self.logger.warning("Removed client %s.", client)
+        self.mark_changed()
+
+    def rebuild_index(self):
+        self.index.rebuild(self.controller_signal_trigger_map, self.controller_signal_scene_map, self.scenes,
+                           {c.name: c.signal_labels() for c in self.controllers})
 
     def assign_mode_switch(self, controller: str, signal):
         if controller not in self.mode_switch.keys():
             self.mode_switch.update({controller: [signal]})
         else:
             self.mode_switch[controller].append(signal)
-        self.saved = False
+        self.push_routes()
+        self.mark_changed()
 
-    def controller_signal_exists(self, controller: str, signal: int) -> bool:
+    def check_batch(self, batch: dict) -> list:
+        """
+        returns a list of reasons apply_batch() would fail, empty if it wouldn't.
+        """
+        errors = []
+        clients = {c.name: c for c in self.clients}
+        new_clients = {c['name'] for c in batch.get('clients', [])}
+        controllers = {c.name: c for c in self.controllers}
+        new_signals = batch.get('signals', {})
+        new_tracks = batch.get('tracks', {})
+        for client in new_tracks:
+            if client not in clients and client not in new_clients:
+                errors.append(f"No client '{client}' to add tracks to.")
+        for controller in new_signals:
+            if controller not in controllers:
+                errors.append(f"No controller '{controller}' to add signals to.")
+        def track_exists(client, track):
+            return track in new_tracks.get(client, {}) or (client in clients and track in clients[client].tracks)
+        def signal_exists(controller, signal):
+            return (signal in new_signals.get(controller, {}).values()
+                    or signal in controllers[controller].signal_labels())
+        for controller, signal, client, track in batch.get('triggers', []):
+            if controller not in controllers:
+                errors.append(f"Trigger {signal}: no controller '{controller}'.")
+            elif not signal_exists(controller, signal):
+                errors.append(f"Trigger {signal}: no signal '{signal}' on controller '{controller}'.")
+            if not track_exists(client, track):
+                errors.append(f"Trigger {signal}: no track '{track}' on client '{client}'.")
+        for scene, scene_tracks in batch.get('scenes', {}).items():
+            for client, tracks in scene_tracks.items():
+                for track in tracks:
+                    if not track_exists(client, track):
+                        errors.append(f"Scene {scene}: no track '{track}' on client '{client}'.")
+        for controller, signal, scene in batch.get('scene_triggers', []):
+            if controller not in controllers:
+                errors.append(f"Scene trigger {signal}: no controller '{controller}'.")
+            elif not signal_exists(controller, signal):
+                errors.append(f"Scene trigger {signal}: no signal '{signal}' on controller '{controller}'.")
+        return errors
+
+    def apply_batch(self, batch: dict) -> dict:
+        """
+        Provision clients, tracks, signals, trigger mappings, scenes and scene mappings in one go:
+            {"clients": [{"name": ..., "type": ..., "toggle_record": ...}],
+             "tracks": {client: {label: attrs}},
+             "signals": {controller: {message hex: signal label}},
+             "triggers": [[controller, signal, client, track]],
+             "scenes": {scene: {client: [tracks]}},
+             "scene_triggers": [[controller, signal, scene]]}
+        Every key is optional. The whole batch is checked first and nothing is applied if any of it is wrong. Each
+        client and controller gets one command for all of its share, and routes are pushed once at the end. Returns
+        the number of each thing applied, or {"errors": [...]}.
+        """
+        t0 = time.perf_counter()
+        errors = self.check_batch(batch)
+        if errors:
+            return {"errors": errors}
+        existing_clients = list(self.clients)
+        self.loading = True
+        for c in batch.get('clients', []):
+            if not self.client_exists(c['name']):
+                self.add_client(c['name'], toggle_record=c.get('toggle_record', False), type=c.get('type', 'midi'),
+                                osc=c.get('osc'), node=c.get('node'))
+        self.loading = False
+        added = [c for c in self.clients if c not in existing_clients]
+        if self.daemon_mode and added:
+            for c in added:
+                c.start()
+            self.restart_metrics()
+        clients = {c.name: c for c in self.clients}
+        for client, tracks in batch.get('tracks', {}).items():
+            clients[client].command_queue.put({'create_tracks': (tracks,)})
+            for label, attrs in tracks.items():
+                # our copy, for the supervisor.
+                clients[client].create_track(label, dict(attrs))
         for c in self.controllers:
-            if c.name == controller:
-                for k, v in c.signal_map.items():
-                    if v == signal:
-                        return True
-        return False
-        
+            signal_map = batch.get('signals', {}).get(c.name)
+            if signal_map:
+                c.command_queue.put({'add_signals': (signal_map,)})
+                c.signal_map.update(signal_map)
+                self.index.set_signals(c.name, c.signal_labels())
+        for controller, signal, client, track in batch.get('triggers', []):
+            signals = self.controller_signal_trigger_map.setdefault(controller, {})
+            tracks = signals.setdefault(signal, {}).setdefault(client, [])
+            if track not in tracks:
+                tracks.append(track)
+                self.index.add_trigger(controller, signal, client, track)
+        for scene, scene_tracks in batch.get('scenes', {}).items():
+            for client, tracks in scene_tracks.items():
+                scene_client_tracks = self.scenes.setdefault(scene, {}).setdefault(client, [])
+                for track in tracks:
+                    if track not in scene_client_tracks:
+                        scene_client_tracks.append(track)
+                        self.index.add_scene_track(scene, client, track)
+        for controller, signal, scene in batch.get('scene_triggers', []):
+            self.scenes.setdefault(scene, {})
+            old = self.controller_signal_scene_map.setdefault(controller, {}).get(signal)
+            if old is not None:
+                self.index.remove_scene_trigger(controller, signal, old)
+            self.controller_signal_scene_map[controller][signal] = scene
+            self.index.add_scene_trigger(controller, signal, scene)
+        self.push_routes()
+        self.mark_changed()
+        result = {key: len(batch.get(key, ())) for key in ('clients', 'triggers', 'scenes', 'scene_triggers')}
+        result.update({"tracks": sum(len(t) for t in batch.get('tracks', {}).values()),
+                       "signals": sum(len(s) for s in batch.get('signals', {}).values()),
+                       "elapsed_ms": (time.perf_counter() - t0) * 1000})
+        self.logger.info("Applied batch: %s", result)
+        return result
+
+    def push_routes(self):
+        """
+        Send each controller its slice of the trigger map and its mode switch signals so it can route pure trigger
+        signals straight to the clients. See Controller.fast_route(). Continuous mappings are always pushed down to
+        both ends; they never pass through this process.
+        """
+        if not self.daemon_mode:
+            return
+        for c in self.controllers:
+            if self.fast_path:
+                c.command_queue.put({'routes': (self.fast_trigger_map(c.name), self.mode_switch.get(c.name, []),
+                                                self.quantize)})
+            c.command_queue.put({'continuous_routes': ({label: m for label, m in self.continuous_map.items()
+                                                        if m['controller'] == c.name},)})
+        for client in self.clients:
+            client_map = {}
+            for label, m in self.continuous_map.items():
+                tracks = [t['track'] for t in m['targets'] if t['client'] == client.name]
+                if tracks:
+                    input_size = curves.FOURTEEN_BIT if m['input']['type'] == 'pitchwheel' else curves.SEVEN_BIT
+                    client_map[label] = {'tracks': tracks, 'curve': m['curve'], 'input_size': input_size}
+            client.command_queue.put({'continuous_map': (client_map,)})
+
+    def fast_trigger_map(self, controller: str) -> dict:
+        """
+        the part of a controller's trigger map it may route on its own. Scripted signals always come through here.
+        """
+        scripted = self.controller_signal_script_map.get(controller, {})
+        return {signal: clients for signal, clients in self.controller_signal_trigger_map.get(controller, {}).items()
+                if signal not in scripted}
+
+    def set_quantize(self, beats):
+        """
+        Hold track and scene triggers until the next multiple of beats on the running clock: 1 for the next beat, 4
+        for the next bar in 4/4. 0 turns quantising off. Without a running clock, triggers go out right away.
+        """
+        self.quantize = beats
+        self.logger.info("Quantising triggers to %s beats.", beats)
+        self.push_routes()
+        self.mark_changed()
+
+    def assign_continuous(self, label, controller: str, inp: dict, client: str, track_label, curve='linear'):
+        """
+        Map a controller cc or pitchwheel to a client track's value through a response curve. Assigning an existing
+        label again adds another target.
+        """
+        if label in self.continuous_map:
+            self.continuous_map[label]['targets'].append({'client': client, 'track': track_label})
+        else:
+            self.continuous_map.update({label: {'controller': controller,
+                                                'input': inp,
+                                                'targets': [{'client': client, 'track': track_label}],
+                                                'curve': curve}})
+        self.push_routes()
+        self.mark_changed()
+
+    def controller_signal_exists(self, controller: str, signal: int) -> bool:
+        return (controller, signal) in self.index.signals
+
+    def get_client(self, client: str):
+        for c in self.clients:
+            if c.name == client:
+                return c
+        return None
+
+    def client_exists(self, client: str) -> bool:
+        return self.get_client(client) is not None
+
     def client_track_exists(self, client: str, track_label) -> bool:
-        for cli in self.clients:
-            if cli.name == client:
-                for label, track in cli.tracks.items():
-                    if label == track_label:
-                        return True
-        return False
+        c = self.get_client(client)
+        return c is not None and track_label in c.tracks
         
     def trigger_scene(self, scene: int):
         """
         scene presses are idempotent. Multiple presses should have no effect.
         an empty scene turns off all tracks.
         """
-        self.logger.info(f"Triggering scene {scene}.")
+        self.logger.info("Triggering scene %s.", scene)
         for client in self.clients:
-            if client.name in self.scenes[scene].keys():
+            if client.name in self.scenes[scene]:
                 # client has tracks in the scene. send list to event queue with desired state of True
                 self.trigger_event(client, self.scenes[scene][client.name], True)
                 #turning off tracks not in the scene is handled in MidiClient.process_events()
@@ -209,32 +672,93 @@ class MidiPlexer(multiprocessing.Process):
         Places track events on the event queue.
         desired state is True (on), False (off), or None (for trigger mode)
         """
-        self.logger.info(f"Triggering track {client} {track}.")
+        self.logger.info("Triggering track %s %s.", client, track)
+        try:
+            tracklist = self.single_tracklists[track]
+        except KeyError:
+            tracklist = self.single_tracklists[track] = [track]
         for c in self.clients:
             if c.name == client:
-                self.trigger_event(c, [track], None)
+                self.trigger_event(c, tracklist, None)
+
+    def assign_script(self, controller: str, signal, entry: dict):
+        """
+        Run a script whenever the signal comes in, instead of its trigger or scene mapping. entry is {"code": source}
+        or {"file": path}, optionally with "timeout_ms". see ScriptAPI for what the script can do.
+        """
+        self.controller_signal_script_map.setdefault(controller, {})[signal] = entry
+        self.scripts.set_scripts(self.controller_signal_script_map)
+        self.push_routes()
+        self.mark_changed()
+
+    def delete_script(self, controller: str, signal):
+        try:
+            del self.controller_signal_script_map[controller][signal]
+        except KeyError:
+            raise exceptions.NoSuchSignal(controller, signal)
+        self.scripts.set_scripts(self.controller_signal_script_map)
+        self.push_routes()
+        self.mark_changed()
+
+    def apply_script_action(self, action):
+        """
+        something a finished script asked for. see ScriptAPI. Unlike a trigger mapping, a script can turn a track on or
+        off in either mode. A track is queued as a single label, so the client leaves its other tracks alone.
+        """
+        kind, target, track, state = action
+        if kind == 'trigger':
+            client = self.get_client(target)
+            if client is None:
+                self.logger.error("Script triggered track %s on client %s, which doesn't exist.", track, target)
+                return
+            self.logger.info("Script triggering track %s %s, state %s.", target, track, state)
+            client.event_queue.put((track, state, self.quantize))
+        elif kind == 'scene':
+            if target not in self.scenes:
+                self.logger.error("Script triggered scene %s, which doesn't exist.", target)
+                return
+            self.trigger_scene(target)
 
     def trigger_event(self, client: Client, tracklist: list, desired_state):
         if self.mode == Mode.TRIGGER:
             # trigger mode must be None
             desired_state = None
 
-        self.logger.info(f"Sending event to client {client.name}, tracklist {tracklist}, state {desired_state}..")
-        client.event_queue.put((tracklist, desired_state))
+        self.logger.info("Sending event to client %s, tracklist %s, state %s..", client.name, tracklist, desired_state)
+        t0 = self.tracer.begin()
+        client.event_queue.put((tracklist, desired_state, self.quantize))
+        self.tracer.end('queue put', t0)
             
     def handle_signals(self):
         if not self.signal_queue.empty():
             while not self.signal_queue.empty():
                 try:
-                    (controller, signal) = self.signal_queue.get_nowait()
+                    t0 = self.tracer.begin()
+                    (controller, signal, handled) = self.signal_queue.get_nowait()
+                    self.tracer.end('queue get', t0)
                 except queue.Empty:
                     time.sleep(0.008)
                     continue
-                self.logger.debug(f'Received signal {signal} from controller {controller}.')
-                for c, s in self.mode_switch.items():
-                    if c == controller and signal in s:
+                if self.recording:
+                    self.record_queue.put(('S', time.monotonic_ns(), controller, signal))
+                self.recent_signals.append(controller, signal, time.time())
+                self.counters.incr(metrics.SIGNALS_RECEIVED)
+                self.logger.debug('Received signal %s from controller %s.', signal, controller)
+                if signal in self.mode_switch.get(controller, ()):
+                    if handled:
+                        # the controller already switched the shared mode.
+                        self.logger.info("Changed mode to %s", self.mode)
+                    else:
                         self.change_mode()
-                        return
+                    return
+                if handled:
+                    # routed by the controller itself.
+                    continue
+                t0 = self.tracer.begin()
+                if self.scripts.submit(controller, signal, self.mode.value):
+                    # the script runs in the pool. nothing here waits for it.
+                    self.tracer.end('dispatch lookup', t0)
+                    continue
                 try:
                     if self.mode == Mode.TRIGGER:
                         for client in self.controller_signal_trigger_map[controller][signal]:
@@ -242,11 +766,13 @@ class MidiPlexer(multiprocessing.Process):
                                 #todo: start in another process?
                                 self.trigger_track(client, track)
                     elif self.mode == Mode.SCENE:
-                        self.logger.debug(self.controller_signal_scene_map.__str__())
+                        self.logger.debug('%s', self.controller_signal_scene_map)
                         self.trigger_scene(self.controller_signal_scene_map[controller][signal])
-                except KeyError as e:
-                    self.logger.warn(f"Registered signal {signal} on controller {controller} not in {self.mode} map.")
-                    self.logger.error(traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__))
+                except KeyError:
+                    self.counters.incr(metrics.SIGNALS_DROPPED)
+                    self.logger.warning("Registered signal %s on controller %s not in %s map.", signal, controller, self.mode)
+                    self.logger.debug("Missing mapping.", exc_info=True)
+                self.tracer.end('dispatch lookup', t0)
         else:
             raise exceptions.NothingToDo
 
@@ -260,15 +786,16 @@ class MidiPlexer(multiprocessing.Process):
                     label = signal_label
                 self.logger.debug(f'Registering signal "{signal_label}" to controller {ctlrlabel}.')
                 c.command_queue.put({'register': signal_label})
-        self.saved = False
+        self.mark_changed()
     
     def change_mode(self):
-        if self.mode == Mode.TRIGGER:
-            new_mode = Mode.SCENE
-        elif self.mode == Mode.SCENE:
-            new_mode = Mode.TRIGGER
-        self.mode = new_mode
-        self.logger.info(f"Changed mode to {new_mode}")
+        with self.shared_mode.get_lock():
+            if self.mode == Mode.TRIGGER:
+                new_mode = Mode.SCENE
+            elif self.mode == Mode.SCENE:
+                new_mode = Mode.TRIGGER
+            self.mode = new_mode
+        self.logger.info("Changed mode to %s", new_mode)
 
     def print(self):
         pprint(self.__dict__())
@@ -285,12 +812,13 @@ class MidiPlexer(multiprocessing.Process):
                             self.assign_track(controller, signal, client, track)
                             continue
                         if c == 'add_client':
-                            name, typ, toggle_record = command['add_client']
-                            self.add_client(name, toggle_record=toggle_record, type=typ)
+                            name, typ, toggle_record, transport = command['add_client']
+                            # {type: {"host", "port"}} for osc and node clients.
+                            self.add_client(name, toggle_record=toggle_record, type=typ, **transport)
                             continue
                         if c == 'add_controller':
-                            label, typ = command['add_controller']
-                            self.add_controller(label, type=typ)
+                            label, typ, transport = command['add_controller']
+                            self.add_controller(label, type=typ, **transport)
                             continue
                         if c == 'register_controller_signal':
                             label, signal_label  = command['register_controller_signal']
@@ -332,6 +860,57 @@ class MidiPlexer(multiprocessing.Process):
                         if c == 'track_toggle_record':
                             clientlabel, tracklabel = command[c]
                             self.track_toggle_record(clientlabel, tracklabel)
+                        if c == 'profile':
+                            seconds, outdir = command[c]
+                            self.profile(seconds, outdir)
+                        if c == 'trace':
+                            enabled, threshold_ms, outdir = command[c]
+                            self.trace(enabled, threshold_ms, outdir)
+                        if c == 'trace_dump':
+                            self.dump_trace()
+                        if c == 'record_start':
+                            path, = command[c]
+                            self.start_recording(path)
+                        if c == 'record_stop':
+                            self.stop_recording()
+                        if c == 'assign_continuous':
+                            label, controller, inp, client, track, curve = command[c]
+                            self.assign_continuous(label, controller, inp, client, track, curve=curve)
+                        if c == 'get_continuous_map_stdout':
+                            self.stdout_queue.put(self.continuous_map)
+                        if c == 'apply_batch':
+                            batch, = command[c]
+                            self.stdout_queue.put(self.apply_batch(batch))
+                        if c == 'set_quantize':
+                            beats, = command[c]
+                            self.set_quantize(beats)
+                        if c == 'where_used':
+                            client, track = command[c]
+                            self.stdout_queue.put(self.where_used(client, track))
+                        try:
+                            if c == 'delete_trigger':
+                                controller, signal, client, track = command[c]
+                                self.delete_trigger(controller, signal, client, track)
+                            if c == 'delete_scene_trigger':
+                                controller, signal = command[c]
+                                self.delete_scene_trigger(controller, signal)
+                            if c == 'assign_script':
+                                controller, signal, entry = command[c]
+                                self.assign_script(controller, signal, entry)
+                            if c == 'delete_script':
+                                controller, signal = command[c]
+                                self.delete_script(controller, signal)
+                            if c == 'rename_track':
+                                client, old, new = command[c]
+                                self.rename_track(client, old, new)
+                            if c == 'rename_scene':
+                                old, new = command[c]
+                                self.rename_scene(old, new)
+                            if c == 'remove_client':
+                                client, = command[c]
+                                self.remove_client(client)
+                        except exceptions.PyMidiPlexerException as e:
+                            self.logger.error(e.msg)
 
                         
                 except queue.Empty:
@@ -345,19 +924,243 @@ class MidiPlexer(multiprocessing.Process):
                 client.command_queue.put({'toggle_record':(tracklabel,)})
 
         
+    def profile(self, seconds, outdir):
+        """
+        Profile this process and every controller and client for the given number of seconds. Each process dumps its
+        own stats; check_profile() merges them into one report per process type once they're all in.
+        """
+        outdir = os.path.join(outdir, time.strftime('%Y%m%d-%H%M%S'))
+        for c in self.controllers + self.clients:
+            c.command_queue.put({'profile': (seconds, outdir)})
+        self.profiler.start(seconds, outdir)
+        self.pending_profile = (outdir, len(self.controllers) + len(self.clients) + 1, time.monotonic() + seconds + 2)
+        self.logger.warning("Profiling for %s seconds into %s.", seconds, outdir)
+
+    def check_profile(self):
+        self.profiler.check()
+        if self.pending_profile is None or self.profiler.profile is not None:
+            return
+        outdir, expected, deadline = self.pending_profile
+        dumps = len([f for f in os.listdir(outdir) if f.endswith('.prof')]) if os.path.isdir(outdir) else 0
+        if dumps < expected and time.monotonic() < deadline:
+            return
+        if dumps < expected:
+            self.logger.warning("Only %d of %d processes wrote a profile.", dumps, expected)
+        self.pending_profile = None
+        for report in merge_profiles(outdir):
+            self.logger.warning("Profile report written to %s.", report)
+
+    def trace(self, enabled, threshold_ms, outdir):
+        """
+        Turn span tracing on or off in every process. With a threshold, any span longer than threshold_ms makes every
+        process dump its ring buffer.
+        """
+        self.trace_outdir = outdir
+        for c in self.controllers + self.clients:
+            c.command_queue.put({'trace': (enabled, threshold_ms)})
+        self.tracer.configure(enabled, threshold_ms)
+        self.trace_trigger.clear()
+        self.logger.warning("Tracing %s.", "enabled" if enabled else "disabled")
+
+    def dump_trace(self):
+        if self.pending_trace is not None or self.trace_outdir is None:
+            # already dumping. ignore triggers until that one's merged.
+            return
+        self.trace_dumps += 1
+        outdir = os.path.join(self.trace_outdir, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.trace_dumps}")
+        for c in self.controllers + self.clients:
+            c.command_queue.put({'trace_dump': (outdir,)})
+        self.tracer.dump(outdir)
+        self.pending_trace = (outdir, len(self.controllers) + len(self.clients) + 1, time.monotonic() + 2)
+
+    def check_trace(self):
+        if self.tracer.enabled and self.trace_trigger.is_set():
+            self.trace_trigger.clear()
+            self.logger.warning("Latency threshold exceeded. Dumping trace.")
+            self.dump_trace()
+        if self.pending_trace is None:
+            return
+        outdir, expected, deadline = self.pending_trace
+        dumps = len([f for f in os.listdir(outdir) if f.endswith('.json')])
+        if dumps < expected and time.monotonic() < deadline:
+            return
+        self.pending_trace = None
+        self.logger.warning("Trace written to %s.", merge_traces(outdir))
+
+    def start_recording(self, path):
+        """
+        Record the signal stream and every client send to path. The header holds the mode and playing tracks at the
+        start so a replay can begin from the same state.
+        """
+        if self.recording:
+            self.logger.warning("Already recording.")
+            return
+        trackstate = {client.name: client.playing_tracks() for client in self.clients}
+        self.record_process = RecordProcess(self.record_queue, path, {'mode': self.mode.name, 'trackstate': trackstate})
+        self.record_process.start()
+        for client in self.clients:
+            client.command_queue.put({'record': (True,)})
+        self.recording = True
+        self.logger.warning("Recording to %s.", path)
+
+    def stop_recording(self):
+        if not self.recording:
+            return
+        self.recording = False
+        for client in self.clients:
+            client.command_queue.put({'record': (False,)})
+        self.record_process.stop()
+        self.record_process = None
+
+    def get_metrics_source(self):
+        return metrics.MetricsSource(self.__class__.__name__, 'mux', self.pid, self.counters,
+                                     {'signal_queue': self.signal_queue, 'command_queue': self.command_queue},
+                                     gauges=self.get_gauges)
+
+    def get_gauges(self):
+        gauges = {'startup_seconds': self.ready_time.value}
+        gauges.update(self.scripts.run_time.get_dict())
+        return gauges
+
+    def restart_metrics(self):
+        """
+        (re)start the metrics process. The metrics process inherits its view of the other processes when it's forked,
+        so it has to be restarted whenever a controller or client is added. Only called from the MidiPlexer process.
+        """
+        if self.metrics_process is None:
+            # not running yet. run() starts it once the config is loaded.
+            return
+        self.metrics_process.stop()
+        self.start_metrics()
+
+    def start_metrics(self):
+        sources = [self.get_metrics_source()]
+        sources += [c.get_metrics_source() for c in self.controllers + self.clients]
+        self.metrics_process = metrics.MetricsProcess(sources, self.metrics_path)
+        self.metrics_process.start()
+
+    def respawn(self, old):
+        """
+        Replace a dead controller or client with a new process built from our copy of its config. It takes over the
+        old one's queues, so nothing else needs to know, and clients get their last published track state back.
+        Events still queued for a client are replayed or dropped according to the supervisor's queued_events.
+        """
+        conf = old.get_config_dict()
+        if old in self.controllers:
+            new = self.build_controller(conf['name'], type=conf['type'], signal_map=conf['signal_map'],
+                                        clock_source=conf.get('clock_source', False), gestures=conf.get('gestures'),
+                                        debounce=conf.get('debounce'), osc=conf.get('osc'), node=conf.get('node'))
+            procs = self.controllers
+        else:
+            new = self.build_client(conf['name'], toggle_record=conf['toggle_record'], type=conf['type'],
+                                    tracks=conf['tracks'], output=conf.get('output'), clock=conf.get('clock'),
+                                    feedback=conf.get('feedback'), osc=conf.get('osc'), node=conf.get('node'))
+            procs = self.clients
+        new.adopt(old)
+        if procs is self.clients and self.supervisor.queued_events == 'drop':
+            dropped = 0
+            while True:
+                try:
+                    new.event_queue.get_nowait()
+                except queue.Empty:
+                    break
+                dropped += 1
+            if dropped:
+                self.logger.warning("Dropped %d events queued for %s.", dropped, new.name)
+        procs[procs.index(old)] = new
+        new.start()
+        self.logger.warning("Restarted %s %s.", new.__class__.__name__, new.name)
+        self.restart_metrics()
+        self.push_routes()
+
+    def supervise(self):
+        if self.shutdown_callback.is_set():
+            # children are on their way out. don't bring them back.
+            return
+        for c in self.controllers:
+            while not c.state_queue.empty():
+                try:
+                    state = c.state_queue.get_nowait()
+                except queue.Empty:
+                    break
+                c.signal_map = state['signal_map']
+                self.index.set_signals(c.name, c.signal_labels())
+                self.mark_changed()
+        for child in self.supervisor.check(self.controllers + self.clients):
+            self.respawn(child)
+
+    def mark_changed(self):
+        """
+        the config no longer matches the file, and the store gets a new snapshot at the end of this loop.
+        """
+        self.saved = False
+        self.config_dirty = True
+
+    def publish_config(self):
+        if self.config_store.publish(self.get_config_dict()):
+            self.logger.debug("Published config generation %d.", self.config_store.generation)
+        self.config_dirty = False
+
     def update_status(self):
+        """
+        publish the status to the status store if any of it changed since last time. Called when idle.
+        """
+        status = {'mode': self.mode.value,
+                  'filename': self.config,
+                  'saved': self.saved,
+                  'log_dropped': self.log_process.dropped.value,
+                  'ready_ms': round(self.ready_time.value * 1000),
+                  'config_generation': self.config_store.generation,
+                  'clients': dict(self.trackstate_slots),
+                  'recent_signals': self.recent_signals.get_list()}
+        if status != self.status:
+            self.status = status
+            self.status_store.publish(status)
+
+    def preload(self):
+        """
+        Import mido and its rtmidi backend here, once, so that the controllers and clients forked from this process
+        start with them loaded instead of each importing them on its own. This process is their fork server.
+        """
+        t0 = time.monotonic()
         try:
-            self.status_queue.get_nowait()
-        except queue.Empty:
-            pass
-        self.status_queue.put({
-            'mode': self.mode,
-            'filename': self.config,
-            'saved': self.saved
-        })
+            import mido
+            import mido.backends.rtmidi
+        except ImportError as e:
+            self.logger.error("Could not preload mido: %s", e)
+            return
+        self.logger.debug("Preloaded mido in %.1f ms.", (time.monotonic() - t0) * 1000)
+
+    def check_ready(self):
+        """
+        note the time from creating the MidiPlexer until every controller and client has its port open and is in its
+        loop, i.e. until any signal can be routed.
+        """
+        children = self.controllers + self.clients
+        if not all(c.heartbeat.value for c in children):
+            return
+        self.ready_time.value = time.monotonic() - self.created
+        self.logger.info("Ready to route %.0f ms after start, with %d ports.", self.ready_time.value * 1000,
+                         len(children))
 
     def run(self):
+        # ctrl-c in the shell reaches the whole process group. this process and its children stop through
+        # shutdown_callback instead.
+        posix_signal.signal(posix_signal.SIGINT, posix_signal.SIG_IGN)
+        # start the log process before anything else so that it keeps the real handlers. this process and every
+        # child forked from it afterward only put records on its queue.
+        self.log_process = LogProcess()
+        self.log_process.start()
+        self.log_process.install()
+        self.preload()
         self.load_config()
+        self.start_metrics()
+        self.scripts.start(self.trackstates, self.status_store, self.config_store)
+        # config is loaded; everything allocated so far lives for the whole show. keep the collector off of it.
+        gc.freeze()
+        # after the children are forked so that they don't inherit it. clients and controllers added later will still
+        # inherit the cpu affinity.
+        realtime.apply(realtime.resolve(self.realtime_defaults, self.realtime_config, 'mux', 'mux'), self.logger)
         while not self.shutdown_callback.is_set():
             try:
                 self.handle_signals()
@@ -370,19 +1173,36 @@ class MidiPlexer(multiprocessing.Process):
                 wait = False            
             except exceptions.NothingToDo:
                 wait = True
+            for action in self.scripts.poll():
+                self.apply_script_action(action)
+            self.check_profile()
+            self.check_trace()
+            self.supervise()
+            if not self.ready_time.value:
+                self.check_ready()
+            if self.config_dirty:
+                self.publish_config()
             if wait:
                 self.update_status()
                 time.sleep(0.008)
             # Shutdown Callback is set
         self.logger.warn("MidiPlexer stopped.")
+        # children are still logging on their way out. wait for them before stopping the log process.
+        stuck = join_all(self.controllers + self.clients, self.supervisor.shutdown_timeout)
+        for c in stuck:
+            self.logger.error("%s %s did not stop within %s seconds. Terminating it.", c.__class__.__name__, c.name,
+                              self.supervisor.shutdown_timeout)
+            c.terminate()
+        join_all(stuck, 1.0)
+        self.stop_recording()
+        self.scripts.stop()
+        self.metrics_process.stop()
+        self.log_process.stop()
             
 
     def shutdown(self):
         self.shutdown_callback.set()
-        for c in self.controllers:
-            c.join()
-        for c in self.clients:
-            c.join()
+        join_all(self.controllers + self.clients, self.supervisor.shutdown_timeout)
         self.logger.warn("Shutting Down.")
         
     def save(self, f=None):
@@ -398,13 +1218,22 @@ class MidiPlexer(multiprocessing.Process):
         self.config_queue.put(self.get_config_dict())
 
     def get_config_dict(self):
-       [client.command_queue.put({'queue_config_dict':()})for client in self.clients]
-       [c.command_queue.put({'queue_config_dict':()}) for c in self.controllers]
-       return {
-            "clients": [client.config_queue.get() for client in self.clients],
-            "controllers": [c.config_queue.get() for c in self.controllers],
+        """
+        built from our own copies of the controllers and clients, which every config change goes through. No need to
+        ask the processes themselves.
+        """
+        return {
+            "clients": [client.get_config_dict() for client in self.clients],
+            "controllers": [c.get_config_dict() for c in self.controllers],
             "scenes": self.scenes,
             "controller_signal_scene_map": self.controller_signal_scene_map,
             "controller_signal_trigger_map": self.controller_signal_trigger_map,
             "mode_switch": self.mode_switch,
+            "queues": self.queue_options,
+            "continuous_map": self.continuous_map,
+            "quantize": self.quantize,
+            "realtime": self.realtime_config,
+            "supervisor": self.supervisor.get_config_dict(),
+            "controller_signal_script_map": self.controller_signal_script_map,
+            "scripts": self.scripts.get_config_dict(),
         }
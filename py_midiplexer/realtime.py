@@ -0,0 +1,79 @@
+from py_midiplexer import metrics
+import ctypes
+import errno
+import gc
+import os
+
+POLICIES = {
+    'other': os.SCHED_OTHER,
+    'fifo': os.SCHED_FIFO,
+    'rr': os.SCHED_RR,
+}
+POLICY_NAMES = {v: k for k, v in POLICIES.items()}
+
+# from sys/mman.h
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+def resolve(defaults: dict, config: dict, kind: str, name: str) -> dict:
+    """
+    Options for one process. defaults come from the command line. config is the "realtime" section of the config
+    file: {"mux": {...}, "controller": {...}, "client": {...}, "processes": {name: {...}}}. Later layers win.
+    """
+    options = dict(defaults)
+    options.update(config.get(kind, {}))
+    options.update(config.get('processes', {}).get(name, {}))
+    return options
+
+def mlockall():
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+
+def apply(options: dict, logger) -> dict:
+    """
+    Apply realtime options to the calling process and return what it actually ended up with. Anything that can't be
+    had (usually for lack of privileges; see RLIMIT_RTPRIO and RLIMIT_MEMLOCK) is logged and left as it was.
+      cpus: list of cpu numbers to pin to.
+      policy: 'other', 'fifo' or 'rr'. priority: 1-99 for fifo and rr. Children forked later start as 'other'.
+      mlock: lock all current and future memory so the routing loop never waits on a page fault.
+      gc_disable: turn off the cyclic garbage collector. Reference cycles made afterward are never freed, so only for
+                  processes that don't build any once they're running.
+    """
+    if options.get('cpus'):
+        try:
+            os.sched_setaffinity(0, options['cpus'])
+        except (OSError, ValueError) as e:
+            logger.warning("Could not pin to cpus %s: %s", options['cpus'], e)
+
+    policy = options.get('policy')
+    if policy is not None:
+        priority = options.get('priority', 0 if policy == 'other' else 1)
+        try:
+            os.sched_setscheduler(0, POLICIES[policy] | os.SCHED_RESET_ON_FORK, os.sched_param(priority))
+        except KeyError:
+            logger.warning("Unknown scheduling policy %s.", policy)
+        except OSError as e:
+            logger.warning("Could not set scheduling policy %s priority %s: %s", policy, priority, e)
+
+    if options.get('mlock'):
+        try:
+            mlockall()
+        except OSError as e:
+            hint = " Raise RLIMIT_MEMLOCK." if e.errno in (errno.ENOMEM, errno.EPERM) else ""
+            logger.warning("Could not lock memory: %s.%s", e, hint)
+
+    if options.get('gc_disable'):
+        gc.disable()
+
+    # None without /proc, in which case whether memory is locked isn't known.
+    sched = metrics.read_sched(os.getpid())
+    applied = {"cpus": sorted(os.sched_getaffinity(0)),
+               "policy": POLICY_NAMES.get(os.sched_getscheduler(0) & ~os.SCHED_RESET_ON_FORK, 'other'),
+               "priority": os.sched_getparam(0).sched_priority,
+               "mlock": None if sched is None else sched['locked_bytes'] > 0,
+               "gc": gc.isenabled()}
+    if options:
+        logger.info("Realtime options %s; applied %s.", options, applied)
+    return applied
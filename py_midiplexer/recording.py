@@ -0,0 +1,229 @@
+from py_midiplexer import exceptions
+from py_midiplexer import cli
+import multiprocessing
+import argparse
+import logging
+import struct
+import queue
+import json
+import time
+
+# file layout: MAGIC, then records of one kind byte followed by a fixed struct and maybe a payload.
+#   K: key definition. u16 id, u16 length, json [controller, signal] or [client]
+#   H: header. u32 length, json {"mode": ..., "trackstate": {client: [playing track labels]}}
+#   S: signal. u64 monotonic ns, u16 key id
+#   M: client send. u64 monotonic ns, u16 key id, u16 length, raw midi bytes
+MAGIC = b'PMXR\x01'
+KEY = struct.Struct('<HH')
+HEADER = struct.Struct('<I')
+SIGNAL = struct.Struct('<QH')
+SEND = struct.Struct('<QHH')
+
+class RecordWriter(object):
+    """
+    Writes the binary recording format. Controller/signal pairs and client names are written once as key
+    definitions; after that every record refers to them by a two byte id.
+    """
+    def __init__(self, f):
+        self.f = f
+        self.keys = {}
+        self.f.write(MAGIC)
+
+    def key(self, k: tuple):
+        try:
+            return self.keys[k]
+        except KeyError:
+            pass
+        i = len(self.keys)
+        self.keys[k] = i
+        data = json.dumps(list(k)).encode()
+        self.f.write(b'K' + KEY.pack(i, len(data)) + data)
+        return i
+
+    def write_header(self, header: dict):
+        data = json.dumps(header).encode()
+        self.f.write(b'H' + HEADER.pack(len(data)) + data)
+
+    def write_signal(self, t, controller, signal):
+        self.f.write(b'S' + SIGNAL.pack(t, self.key((controller, signal))))
+
+    def write_send(self, t, client, data: bytes):
+        self.f.write(b'M' + SEND.pack(t, self.key((client,)), len(data)) + data)
+
+def read_recording(path):
+    """
+    returns (header, signals, sends). signals is a list of (t, controller, signal). sends is a list of
+    (t, client, bytes).
+    """
+    header = {}
+    signals = []
+    sends = []
+    keys = {}
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a py-midiplexer recording.")
+        while True:
+            kind = f.read(1)
+            if not kind:
+                break
+            if kind == b'K':
+                i, n = KEY.unpack(f.read(KEY.size))
+                keys[i] = tuple(json.loads(f.read(n)))
+            elif kind == b'H':
+                n, = HEADER.unpack(f.read(HEADER.size))
+                header = json.loads(f.read(n))
+            elif kind == b'S':
+                t, i = SIGNAL.unpack(f.read(SIGNAL.size))
+                signals.append((t,) + keys[i])
+            elif kind == b'M':
+                t, i, n = SEND.unpack(f.read(SEND.size))
+                sends.append((t, keys[i][0], f.read(n)))
+            else:
+                raise ValueError(f"Unknown record {kind} in {path}.")
+    return header, signals, sends
+
+class RecordingPort(object):
+    """
+    Wraps an output port and copies every sent message to the record queue. Only used while recording.
+    """
+    def __init__(self, port, record_queue, name):
+        self.port = port
+        self.record_queue = record_queue
+        self.name = name
+
+    def send(self, msg):
+        self.port.send(msg)
+        self.record_queue.put(('M', time.monotonic_ns(), self.name, bytes(msg.bytes())))
+
+class RecordProcess(multiprocessing.Process):
+    """
+    Drains the record queue into a recording file, so the routing processes never touch the disk.
+    """
+    def __init__(self, record_queue, path, header: dict):
+        self.record_queue = record_queue
+        self.path = path
+        self.header = header
+        super().__init__()
+        self.name = 'RecordProcess'
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def run(self):
+        with open(self.path, 'wb') as f:
+            writer = RecordWriter(f)
+            writer.write_header(self.header)
+            while True:
+                record = self.record_queue.get()
+                if record is None:
+                    break
+                kind, t, *args = record
+                if kind == 'S':
+                    writer.write_signal(t, *args)
+                elif kind == 'M':
+                    writer.write_send(t, *args)
+        self.logger.warning("Recording written to %s.", self.path)
+
+    def stop(self):
+        self.record_queue.put(None)
+        self.join()
+
+class MemoryPort(object):
+    """
+    Stand-in output port that keeps everything sent to it, for any transport: bundles are accepted and ignored, so
+    messages are kept one by one, the way RecordingPort records them.
+    """
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(bytes(msg.bytes()))
+
+    def begin_bundle(self):
+        pass
+
+    def end_bundle(self):
+        pass
+
+    def close(self):
+        pass
+
+# where clients keep their transport besides port, e.g. OscClient's osc_port. replay swaps all of them.
+TRANSPORTS = ('osc_port', 'node_port')
+
+def replay(path, config, speed=1.0):
+    """
+    Feed a recording back through a MidiPlexer built from config, entirely in this process: multiprocessing queues
+    are swapped for queue.Queue and every client transport for a MemoryPort. speed scales the recorded gaps between
+    signals; 0 replays as fast as possible. Returns a dict of results including whether the output matched the
+    recording.
+    """
+    # late import. py_midiplexer imports this module.
+    from py_midiplexer.py_midiplexer import MidiPlexer, Mode
+
+    header, signals, sends = read_recording(path)
+    mux = MidiPlexer(f=config, daemon_mode=False)
+    mux.load_config()
+    mux.signal_queue = queue.Queue()
+    if 'mode' in header:
+        mux.mode = Mode[header['mode']]
+    for client in mux.clients:
+        client.event_queue = queue.Queue()
+        client.port = MemoryPort()
+        for attr in TRANSPORTS:
+            if hasattr(client, attr):
+                setattr(client, attr, client.port)
+        client.update_port()
+        playing = header.get('trackstate', {}).get(client.name, [])
+        for label, track in client.tracks.items():
+            track.playing = label in playing
+
+    latencies = []
+    start = time.perf_counter()
+    t_first = signals[0][0] if signals else 0
+    for t, controller, signal in signals:
+        if speed:
+            wait = start + (t - t_first) / 1e9 / speed - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        t0 = time.perf_counter()
+        mux.signal_queue.put((controller, signal, False))
+        try:
+            mux.handle_signals()
+        except exceptions.NothingToDo:
+            pass
+        for client in mux.clients:
+            client.process_events()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    expected = {}
+    for t, client, data in sends:
+        expected.setdefault(client, []).append(data)
+    actual = {client.name: client.port.sent for client in mux.clients if client.port.sent}
+    latencies.sort()
+    return {
+        "signals": len(signals),
+        "sends": sum(len(v) for v in actual.values()),
+        "match": expected == actual,
+        "mismatched_clients": sorted(c for c in set(expected) | set(actual) if expected.get(c) != actual.get(c)),
+        "elapsed_s": elapsed,
+        "signals_per_s": len(signals) / elapsed if elapsed else 0,
+        "latency_p50_us": latencies[len(latencies) // 2] * 1e6 if latencies else 0,
+        "latency_p99_us": latencies[int(len(latencies) * 0.99)] * 1e6 if latencies else 0,
+        "latency_max_us": latencies[-1] * 1e6 if latencies else 0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a py-midiplexer recording against an in-memory backend.")
+    parser.add_argument("recording")
+    parser.add_argument("--config", "-c", required=True, help="Configuration file the recording was made with")
+    parser.add_argument("--speed", "-s", type=float, default=1.0, help="Playback speed. 0 is as fast as possible")
+    args = parser.parse_args()
+    # script workers are forked even here.
+    cli.use_fork()
+    results = replay(args.recording, args.config, speed=args.speed)
+    for k, v in results.items():
+        print(f"{k}: {v}")
+    return 0 if results["match"] else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,277 @@
+from py_midiplexer import metrics
+from py_midiplexer.mode import Mode
+import multiprocessing
+import builtins
+import collections
+import heapq
+import logging
+import time
+
+# all a script gets of the builtins. a guard against mistakes, not a sandbox: scripts come from the config file, which
+# can already do anything a midiplexer can.
+SAFE_BUILTINS = {name: getattr(builtins, name) for name in (
+    'abs', 'all', 'any', 'bool', 'dict', 'divmod', 'enumerate', 'filter', 'float', 'int', 'isinstance', 'len', 'list',
+    'map', 'max', 'min', 'range', 'reversed', 'round', 'set', 'sorted', 'str', 'sum', 'tuple', 'zip',
+    'Exception', 'KeyError', 'ValueError')}
+
+class ScriptAPI(object):
+    """
+    What a script can do, as the globals it runs with:
+      controller, signal: what set it off. mode: 'trigger' or 'scene', as of the signal.
+      state: a dict kept between runs of this script, e.g. for counters. Lost if a run is killed.
+      playing(client, track): True or False as the client last published it, or None if it hasn't yet.
+      trigger(client, track, state=None, delay_ms=0): toggle a track, or turn it on (True) or off (False).
+      scene(label, delay_ms=0): trigger a scene.
+      log(msg): log at info.
+    Actions only take effect if the script finishes in time, all together, when its result reaches the MidiPlexer.
+    Track state is read from the shared memory the shell's grid uses, so reading it never asks another process.
+    """
+    def __init__(self, trackstates, status_store, config_store, logger):
+        self.trackstates = trackstates
+        self.status_store = status_store
+        self.config_store = config_store
+        self.logger = logger
+
+    def playing(self, client, track):
+        status = self.status_store.read()
+        config = self.config_store.read()
+        if status is None or config is None or client not in status['clients']:
+            return None
+        for c in config['clients']:
+            if c['name'] == client:
+                tracks = list(c['tracks'])
+                break
+        else:
+            return None
+        board = self.trackstates.view(status['clients'][client])
+        if track not in tracks or tracks.index(track) >= len(board):
+            return None
+        value = board[tracks.index(track)]
+        return bool(value & 2) if value else None
+
+    def namespace(self, controller, signal, mode, state, actions) -> dict:
+        def trigger(client, track, state=None, delay_ms=0):
+            actions.append(('trigger', client, track, state, delay_ms))
+
+        def scene(label, delay_ms=0):
+            actions.append(('scene', label, None, None, delay_ms))
+
+        return {'__builtins__': SAFE_BUILTINS,
+                'controller': controller,
+                'signal': signal,
+                'mode': Mode(mode).name.lower(),
+                'state': state,
+                'playing': self.playing,
+                'trigger': trigger,
+                'scene': scene,
+                'log': lambda msg: self.logger.info("%s/%s: %s", controller, signal, msg)}
+
+class ScriptWorker(multiprocessing.Process):
+    """
+    Runs scripts one at a time for the ScriptPool, off the routing path. Each worker has its own pipe, so one killed
+    mid-script takes nothing shared down with it.
+    """
+    def __init__(self, index, conn, api):
+        self.conn = conn
+        self.api = api
+        self.shutdown_callback = multiprocessing.Event()
+        super().__init__()
+        self.name = f'script{index}'
+        self.logger = logging.getLogger(f'{self.__class__.__name__}:{self.name}')
+        # source: code object. compiling is the slow part of a short script.
+        self.compiled = {}
+
+    def execute(self, controller, signal, source, mode, state):
+        actions = []
+        error = None
+        t0 = time.perf_counter_ns()
+        try:
+            code = self.compiled.get(source)
+            if code is None:
+                code = self.compiled[source] = compile(source, f'<script {controller}/{signal}>', 'exec')
+            exec(code, self.api.namespace(controller, signal, mode, state, actions))
+        except Exception as e:
+            error = f"{e.__class__.__name__}: {e}"
+            actions = []
+        return actions, state, time.perf_counter_ns() - t0, error
+
+    def run(self):
+        self.logger.debug("Starting.")
+        while not self.shutdown_callback.is_set():
+            try:
+                if not self.conn.poll(0.1):
+                    continue
+                job_id, controller, signal, source, mode, state = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            self.conn.send((job_id,) + self.execute(controller, signal, source, mode, state))
+
+class ScriptPool(object):
+    """
+    Runs the scripts in the script map for the MidiPlexer, in a pool of worker processes. submit() only hands the run
+    to an idle worker, or queues it, so a slow script never holds up handle_signals. Runs of the same script go one at
+    a time, in order, so its state stays consistent. A run that takes longer than its timeout is killed with its
+    worker, and the worker replaced.
+      workers: how many scripts can run at once.
+      timeout_ms: how long a run may take, unless its script says otherwise.
+      max_pending: runs waiting for a worker past this many are dropped.
+    Workers start with the other children, before the MidiPlexer's realtime options apply. A replacement for a killed
+    one starts with the normal policy (see SCHED_RESET_ON_FORK), so scripts never compete with routing.
+    """
+    def __init__(self, workers=2, timeout_ms=100, max_pending=64, counters=None):
+        self.workers = workers
+        self.timeout_ms = timeout_ms
+        self.max_pending = max_pending
+        self.counters = counters if counters is not None else metrics.Counters()
+        self.run_time = metrics.JitterStats('script')
+        # (controller, signal): script entry from the map, {"code": ...} or {"file": ...}, with optional timeout_ms.
+        self.scripts = {}
+        self.sources = {}
+        self.states = {}
+        self.pool = []
+        self.api = None
+        # worker: (job id, key, started, timeout_ns) while it's running something.
+        self.running = {}
+        self.busy = set()
+        self.pending = collections.deque()
+        self.job_id = 0
+        # actions scripts delayed. heap of (due ns, sequence, action)
+        self.schedule = []
+        self.schedule_seq = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def get_config_dict(self):
+        return {"workers": self.workers, "timeout_ms": self.timeout_ms, "max_pending": self.max_pending}
+
+    def set_scripts(self, script_map: dict):
+        """
+        script_map is {controller: {signal: entry}}. Files are read here, once.
+        """
+        self.scripts = {}
+        self.sources = {}
+        for controller, signals in script_map.items():
+            for signal, entry in signals.items():
+                key = (controller, signal)
+                try:
+                    if 'file' in entry:
+                        with open(entry['file']) as f:
+                            source = f.read()
+                    else:
+                        source = entry['code']
+                    compile(source, f'<script {controller}/{signal}>', 'exec')
+                except (OSError, KeyError, SyntaxError) as e:
+                    self.logger.error("Script for %s/%s not loaded: %s", controller, signal, e)
+                    continue
+                self.scripts[key] = entry
+                self.sources[key] = source
+
+    def spawn(self, index):
+        parent, child = multiprocessing.Pipe()
+        worker = ScriptWorker(index, child, self.api)
+        worker.start()
+        child.close()
+        worker.parent_conn = parent
+        return worker
+
+    def start(self, trackstates, status_store, config_store):
+        self.api = ScriptAPI(trackstates, status_store, config_store, self.logger)
+        self.pool = [self.spawn(i) for i in range(self.workers)]
+
+    def stop(self):
+        for worker in self.pool:
+            worker.shutdown_callback.set()
+        for worker in self.pool:
+            worker.join(1.0)
+            if worker.is_alive():
+                worker.kill()
+            worker.parent_conn.close()
+        self.pool = []
+
+    def submit(self, controller, signal, mode):
+        """
+        run the script for controller and signal, or queue the run. Returns False if there's no such script.
+        """
+        key = (controller, signal)
+        if key not in self.sources:
+            return False
+        if len(self.pending) >= self.max_pending:
+            self.counters.incr(metrics.SCRIPTS_DROPPED)
+            self.logger.warning("Too many scripts waiting. Dropped the run for %s/%s.", controller, signal)
+            return True
+        self.pending.append((key, mode))
+        self.dispatch()
+        return True
+
+    def dispatch(self):
+        idle = [w for w in self.pool if w not in self.running]
+        if not idle or not self.pending:
+            return
+        held = collections.deque()
+        while idle and self.pending:
+            key, mode = self.pending.popleft()
+            if key in self.busy:
+                # the last run of this script hasn't finished. keep the order.
+                held.append((key, mode))
+                continue
+            worker = idle.pop()
+            self.job_id += 1
+            timeout_ms = self.scripts[key].get('timeout_ms', self.timeout_ms)
+            worker.parent_conn.send((self.job_id, key[0], key[1], self.sources[key], mode, self.states.get(key, {})))
+            self.running[worker] = (self.job_id, key, time.monotonic_ns(), timeout_ms * 1000000)
+            self.busy.add(key)
+        held.extend(self.pending)
+        self.pending = held
+
+    def kill(self, worker, key, elapsed_ns):
+        self.counters.incr(metrics.SCRIPTS_KILLED)
+        self.run_time.miss()
+        if worker.is_alive():
+            self.logger.error("Script for %s/%s ran for %.1f ms. Killed it and its actions.", *key, elapsed_ns / 1000000)
+            worker.kill()
+        else:
+            self.logger.error("Script worker %s died running %s/%s.", worker.name, *key)
+        worker.join()
+        worker.parent_conn.close()
+        i = self.pool.index(worker)
+        self.pool[i] = self.spawn(i)
+
+    def poll(self) -> list:
+        """
+        collect finished runs, kill overdue ones and hand out waiting ones. Returns the actions due now, in order.
+        """
+        now = time.monotonic_ns()
+        for worker, (job_id, key, started, timeout_ns) in list(self.running.items()):
+            if worker.parent_conn.poll():
+                try:
+                    done_id, actions, state, elapsed_ns, error = worker.parent_conn.recv()
+                except (EOFError, OSError):
+                    # died on its own. treat it like a timeout.
+                    done_id = None
+                if done_id == job_id:
+                    del self.running[worker]
+                    self.busy.discard(key)
+                    self.finish(key, actions, state, elapsed_ns, error, now)
+                    continue
+            elapsed = now - started
+            if elapsed > timeout_ns or not worker.is_alive():
+                del self.running[worker]
+                self.busy.discard(key)
+                self.kill(worker, key, elapsed)
+        self.dispatch()
+        due = []
+        while self.schedule and self.schedule[0][0] <= now:
+            due.append(heapq.heappop(self.schedule)[2])
+        return due
+
+    def finish(self, key, actions, state, elapsed_ns, error, now):
+        self.run_time.record(elapsed_ns)
+        if error is not None:
+            self.counters.incr(metrics.SCRIPTS_FAILED)
+            self.logger.error("Script for %s/%s failed: %s", *key, error)
+            return
+        self.counters.incr(metrics.SCRIPTS_RUN)
+        self.states[key] = state
+        for action in actions:
+            delay_ms = action[-1]
+            self.schedule_seq += 1
+            heapq.heappush(self.schedule, (now + int(delay_ms * 1000000), self.schedule_seq, action[:-1]))
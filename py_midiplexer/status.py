@@ -0,0 +1,66 @@
+import multiprocessing
+import ctypes
+import array
+
+# how many of the latest signals the status keeps.
+RECENT_SIGNALS = 8
+
+class RecentSignals(object):
+    """
+    The latest signals, for the status. A ring over storage allocated up front, so noting a signal on the signal path
+    allocates nothing; the list is only built when the status is published.
+    """
+    def __init__(self, size=RECENT_SIGNALS):
+        self.size = size
+        self.controllers = [None] * size
+        self.signals = [None] * size
+        self.times = array.array('d', bytes(8 * size))
+        self.next = 0
+        self.count = 0
+
+    def append(self, controller, signal, t):
+        i = self.next
+        self.controllers[i] = controller
+        self.signals[i] = signal
+        self.times[i] = t
+        self.next = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def get_list(self):
+        """
+        [(controller, signal, time)], oldest first.
+        """
+        start = self.next - self.count
+        return [(self.controllers[i], self.signals[i], self.times[i])
+                for i in (j % self.size for j in range(start, self.next))]
+
+class TrackStates(object):
+    """
+    Every client's published track state in one block of shared memory. It's allocated with the MidiPlexer, before
+    the MidiPlexer process is forked from the shell, so the shell can read it too. Each client gets a slot of size
+    bytes to use as its trackstate board; see Client.publish_trackstate(). Slots are handed out and taken back in the
+    MidiPlexer process only.
+    """
+    SLOTS = 64
+
+    def __init__(self, size, slots=SLOTS):
+        self.size = size
+        self.values = multiprocessing.RawArray('b', slots * size)
+        self.free = list(range(slots))
+
+    def view(self, slot):
+        return (ctypes.c_byte * self.size).from_buffer(self.values, slot * self.size)
+
+    def allocate(self):
+        """
+        returns a free slot, or None if they're all taken.
+        """
+        if not self.free:
+            return None
+        return self.free.pop(0)
+
+    def release(self, slot):
+        ctypes.memset(ctypes.addressof(self.values) + slot * self.size, 0, self.size)
+        self.free.append(slot)
+        self.free.sort()
@@ -0,0 +1,92 @@
+from py_midiplexer import exceptions
+import multiprocessing.connection
+import collections
+import logging
+import time
+
+QUEUED_EVENT_POLICIES = ('replay', 'drop')
+
+def join_all(processes, timeout):
+    """
+    Join processes in parallel, waiting at most timeout seconds in total. Returns the ones still running.
+    """
+    deadline = time.monotonic() + timeout
+    pending = [p for p in processes if p.pid is not None and p.is_alive()]
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        multiprocessing.connection.wait([p.sentinel for p in pending], remaining)
+        pending = [p for p in pending if p.is_alive()]
+    for p in processes:
+        if p.pid is not None and p not in pending:
+            p.join()
+    return pending
+
+class Supervisor(object):
+    """
+    Watches the controller and client processes from the MidiPlexer process. A child that exits shows up through its
+    sentinel on the next check. A child whose heartbeat has been stale for hang_timeout seconds is killed, and shows
+    up the same way. Replacing them is up to the MidiPlexer; see MidiPlexer.respawn().
+      queued_events: 'replay' hands events queued for a dead client to its replacement; 'drop' throws them away.
+      hang_timeout: seconds without a heartbeat before a child counts as hung. 0 turns hang detection off.
+      max_restarts: give up on a child that dies more than this many times in restart_window seconds.
+      shutdown_timeout: seconds to wait for children to exit on shutdown before terminating them.
+    """
+    def __init__(self, queued_events='replay', hang_timeout=5.0, max_restarts=5, restart_window=60.0,
+                 shutdown_timeout=5.0):
+        if queued_events not in QUEUED_EVENT_POLICIES:
+            raise exceptions.InvalidQueuedEventPolicy(queued_events)
+        self.queued_events = queued_events
+        self.hang_timeout = hang_timeout
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.shutdown_timeout = shutdown_timeout
+        self.next_hang_check = 0
+        # (process class, name): deque of restart times
+        self.restarts = {}
+        self.abandoned = set()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def key(self, child):
+        return (child.__class__.__name__, child.name)
+
+    def check_hung(self, children, now):
+        for c in children:
+            beat = c.heartbeat.value
+            # a heartbeat of 0 means the child is blocking on purpose, e.g. waiting to register a signal.
+            if beat and now - beat > self.hang_timeout and c.is_alive():
+                self.logger.error("%s %s has had no heartbeat for %.1f seconds. Killing it.",
+                                  c.__class__.__name__, c.name, now - beat)
+                c.kill()
+
+    def check(self, children) -> list:
+        """
+        returns the children that have died and should be replaced.
+        """
+        now = time.monotonic()
+        if self.hang_timeout and now >= self.next_hang_check:
+            self.next_hang_check = now + 1
+            self.check_hung(children, now)
+        watched = {c.sentinel: c for c in children if c.pid is not None and self.key(c) not in self.abandoned}
+        dead = []
+        for sentinel in multiprocessing.connection.wait(list(watched), timeout=0):
+            c = watched[sentinel]
+            c.join()
+            history = self.restarts.setdefault(self.key(c), collections.deque())
+            while history and now - history[0] > self.restart_window:
+                history.popleft()
+            if len(history) >= self.max_restarts:
+                self.logger.error("%s %s died %d times in %d seconds. Not restarting it again.",
+                                  c.__class__.__name__, c.name, len(history) + 1, self.restart_window)
+                self.abandoned.add(self.key(c))
+                continue
+            self.logger.error("%s %s exited with code %s. Restarting it.", c.__class__.__name__, c.name, c.exitcode)
+            history.append(now)
+            dead.append(c)
+        return dead
+
+    def get_config_dict(self):
+        return {"queued_events": self.queued_events, "hang_timeout": self.hang_timeout,
+                "max_restarts": self.max_restarts, "restart_window": self.restart_window,
+                "shutdown_timeout": self.shutdown_timeout}
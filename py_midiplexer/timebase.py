@@ -0,0 +1,98 @@
+import multiprocessing
+import math
+
+class Timebase(object):
+    """
+    Shared musical time, so any process can work out when the next beat or bar lands without asking anyone. One
+    process writes it (a clock client, or a controller following an external clock); everyone else reads. Reads and
+    writes go through a sequence counter so a reader never sees half an update.
+    Times are CLOCK_MONOTONIC nanoseconds. Beats are counted from the last start, so beat 0, 4, 8... are bar lines in
+    4/4.
+    """
+    SEQ = 0
+    ANCHOR_NS = 1
+    ANCHOR_BEAT = 2
+    NS_PER_BEAT = 3
+    # how many times read() looks for a stable update before giving up on a writer that died mid-update.
+    RETRIES = 1000
+
+    def __init__(self):
+        self.values = multiprocessing.RawArray('d', 4)
+        # this process's last stable read. no clock until there's been one.
+        self.last = (0, 0, 0)
+
+    def update(self, anchor_ns, anchor_beat, ns_per_beat):
+        """
+        beat anchor_beat happened (or is due) at anchor_ns, and beats are ns_per_beat apart from there on.
+        """
+        v = self.values
+        v[self.SEQ] += 1
+        v[self.ANCHOR_NS] = anchor_ns
+        v[self.ANCHOR_BEAT] = anchor_beat
+        v[self.NS_PER_BEAT] = ns_per_beat
+        v[self.SEQ] += 1
+
+    def stop(self):
+        self.update(0, 0, 0)
+
+    def read(self):
+        """
+        (anchor_ns, anchor_beat, ns_per_beat). If no stable update turns up in RETRIES tries, this process's last one.
+        """
+        v = self.values
+        for _ in range(self.RETRIES):
+            seq = v[self.SEQ]
+            if seq % 2:
+                continue
+            anchor_ns, anchor_beat, ns_per_beat = v[self.ANCHOR_NS], v[self.ANCHOR_BEAT], v[self.NS_PER_BEAT]
+            if v[self.SEQ] == seq:
+                self.last = (anchor_ns, anchor_beat, ns_per_beat)
+                return self.last
+        return self.last
+
+    def next_boundary(self, now_ns, beats):
+        """
+        monotonic ns of the first multiple of beats at or after now_ns, or None if no clock is running.
+        """
+        anchor_ns, anchor_beat, ns_per_beat = self.read()
+        if not ns_per_beat:
+            return None
+        beat = anchor_beat + (now_ns - anchor_ns) / ns_per_beat
+        boundary = math.ceil(beat / beats) * beats
+        return int(anchor_ns + (boundary - anchor_beat) * ns_per_beat)
+
+class ClockFollower(object):
+    """
+    Drives a Timebase from incoming midi clock messages. Messages are only seen once per controller poll, so arrival
+    times are smoothed: the tick period is an average, and each tick's time is the predicted time pulled a little
+    toward the observed one.
+    """
+    PPQN = 24
+
+    def __init__(self, timebase: Timebase, smoothing=0.1):
+        self.timebase = timebase
+        self.smoothing = smoothing
+        self.ticks = 0
+        self.last_ns = None
+        self.period_ns = None
+
+    def handle(self, msg, now_ns):
+        if msg.type == 'start':
+            self.ticks = 0
+            self.last_ns = None
+            self.period_ns = None
+        elif msg.type == 'stop':
+            self.timebase.stop()
+            self.last_ns = None
+        elif msg.type == 'clock':
+            if self.last_ns is None:
+                tick_ns = now_ns
+            else:
+                if self.period_ns is None:
+                    self.period_ns = now_ns - self.last_ns
+                predicted = self.last_ns + self.period_ns
+                tick_ns = predicted + self.smoothing * (now_ns - predicted)
+                self.period_ns += self.smoothing * ((tick_ns - self.last_ns) - self.period_ns)
+                self.ticks += 1
+                self.timebase.update(tick_ns, self.ticks / self.PPQN, self.period_ns * self.PPQN)
+            self.last_ns = tick_ns
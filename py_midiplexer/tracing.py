@@ -0,0 +1,82 @@
+import collections
+import logging
+import json
+import time
+import glob
+import os
+
+class Tracer(object):
+    """
+    Optional per-process ring buffer of span events. Timestamps come from CLOCK_MONOTONIC, which is shared by every
+    process on the machine, so dumps from all processes line up on one timeline without any offset correction.
+    When disabled, begin() returns 0 and end() returns right away.
+    """
+    def __init__(self, proctype: str, name: str, trigger=None, size=10000):
+        self.proctype = proctype
+        self.name = name
+        # multiprocessing.Event shared with the MidiPlexer. set when a span goes over the threshold.
+        self.trigger = trigger
+        self.enabled = False
+        self.threshold_ns = None
+        self.events = collections.deque(maxlen=size)
+        self.logger = logging.getLogger(f'{self.__class__.__name__}:{self.name}')
+
+    def configure(self, enabled, threshold_ms=None):
+        self.enabled = enabled
+        self.threshold_ns = None if threshold_ms is None else int(threshold_ms * 1000000)
+        if not enabled:
+            self.events.clear()
+
+    def begin(self):
+        return time.monotonic_ns() if self.enabled else 0
+
+    def end(self, name, t0):
+        if not t0:
+            return
+        dur = time.monotonic_ns() - t0
+        self.events.append((name, t0, dur))
+        if self.threshold_ns is not None and dur > self.threshold_ns and self.trigger is not None:
+            self.trigger.set()
+
+    def dump(self, outdir):
+        """
+        Write the ring buffer to outdir as Chrome trace events. Returns the path written.
+        """
+        os.makedirs(outdir, exist_ok=True)
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": pid,
+                   "args": {"name": f"{self.proctype}:{self.name}"}}]
+        for name, t0, dur in list(self.events):
+            events.append({"name": name, "cat": self.proctype, "ph": "X", "pid": pid, "tid": pid,
+                           "ts": t0 / 1000, "dur": dur / 1000})
+        path = os.path.join(outdir, f'{self.proctype}.{self.name}.{pid}.json')
+        with open(path, 'w') as f:
+            json.dump(events, f)
+        self.logger.info("Wrote %d trace events to %s.", len(events) - 1, path)
+        return path
+
+class TracedPort(object):
+    """
+    Wraps an output port so every send() shows up as a span. Only used while tracing is enabled.
+    """
+    def __init__(self, port, tracer: Tracer):
+        self.port = port
+        self.tracer = tracer
+
+    def send(self, msg):
+        t0 = self.tracer.begin()
+        self.port.send(msg)
+        self.tracer.end('port.send', t0)
+
+def merge_traces(outdir):
+    """
+    Merge the per-process dumps in outdir into outdir/trace.json, loadable by chrome://tracing and Perfetto.
+    """
+    events = []
+    for path in sorted(glob.glob(os.path.join(outdir, '*.*.*.json'))):
+        with open(path) as f:
+            events += json.load(f)
+    trace = os.path.join(outdir, 'trace.json')
+    with open(trace, 'w') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return trace
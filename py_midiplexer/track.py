@@ -7,6 +7,9 @@ class Track(object):
         self.label = label
         #always initiate to false?
         self.playing=False
+        # set by Client.apply_event while it works through an event, so it can tell the tracks in the event from the
+        # rest without building a list.
+        self.in_event = False
         self.logger = logging.getLogger(f'{__class__.__name__}:{str(self.label)}')
 
     def trigger(self, port):
@@ -19,6 +22,7 @@ class Track(object):
         return {self.number: {"midi_data": self.midi_data, "midi_value": self.midi_value}}
 
 import mido
+from py_midiplexer import curves, osc
 
 class MidiTrack(Track):
     def __init__(self, label, attrs):
@@ -31,7 +35,7 @@ class MidiTrack(Track):
             self.default_data = {}
 
         try:
-            self.on_data = attrs['on_data']
+            self.on_signal_data = attrs['on_data']
         except KeyError:
             self.on_signal_data = {}
 
@@ -49,9 +53,13 @@ class MidiTrack(Track):
             self.toggle_record = attrs['toggle_record']
         else:
             self.toggle_record = False
-            
+
+        # what the client sends back when this track's state changes, as hex strings like signal_map keys:
+        # {"playing": ["90 00 03"], "stopped": ["90 00 01", "90 00 00"]}. see MidiClient.process_feedback().
+        self.feedback = attrs.get('feedback', {})
+
         self.typ = attrs['type']
-        self.reset_to_default_data()
+        self.compile_msgs()
 
     def get_msg(self) -> mido.Message:
         """
@@ -154,12 +162,30 @@ class MidiTrack(Track):
         elif self.typ == "reset":
             return mido.Message(self.typ)
 
+    def compile_msgs(self):
+        """
+        trigger() always resets to default data afterward, so the on, off and record messages never change between
+        triggers. Build them once here instead of on every trigger.
+        """
+        self.reset_to_default_data()
+        self.update_msg_for_on_signal()
+        self.on_msg = self.get_msg()
+        self.reset_to_default_data()
+        self.update_msg_for_off_signal()
+        self.off_msg = self.get_msg()
+        self.reset_to_default_data()
+        self.update_msg_for_record_signal()
+        self.record_msg = self.get_msg()
+        self.reset_to_default_data()
+        self.default_msg = self.get_msg()
+        self.value_msgs = {}
+
     def update_msg_for_blank_signal(self, datadict):
-        for k, v in datadict.items():
-            self.logger.debug(f"changing data; {k}: {v}")
-            self.attr_dict.update({k: v})
-        msg = {"type":self.typ, "data":self.attr_dict}
-        self.logger.debug(f"Updating message: {msg.__str__()}")
+        self.attr_dict.update(datadict)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for k, v in datadict.items():
+                self.logger.debug("changing data; %s: %s", k, v)
+            self.logger.debug("Updating message: %s", {"type":self.typ, "data":self.attr_dict})
             
     def reset_to_default_data(self):
         self.attr_dict = {}
@@ -178,6 +204,7 @@ class MidiTrack(Track):
         """
         trigger sends a signal on the given port in necessary to achieve the desired state. If on_data or off_data
         config items are used, they are applied durint this step.       
+        Returns True if a message was sent.
         """
         the_same = self.playing
         
@@ -187,44 +214,142 @@ class MidiTrack(Track):
             if self.toggle_record:
                 self.toggle_record = False
                 self.playing = False
-                self.update_msg_for_record_signal()            
-                port.send(self.get_msg())
-                self.logger.debug(f"Track {self.label} is recording.")
+                port.send(self.record_msg)
+                self.logger.debug("Track %s is recording.", self.label)
             #trigger mode
             elif self.playing:
                 self.playing=False
-                self.update_msg_for_off_signal()
-                port.send(self.get_msg())
+                port.send(self.off_msg)
             else:
                 self.playing=True
-                self.update_msg_for_on_signal()
-                port.send(self.get_msg())
+                port.send(self.on_msg)
             
         else:
             #scene mode
             if self.toggle_record:
                 #scene mode does not trigger if toggle_record is on.
-                return
+                return False
             if desired_state:
             #desired playing
                 if not self.playing:
-                    self.update_msg_for_on_signal()
                     self.playing = True
-                    port.send(self.get_msg())
+                    port.send(self.on_msg)
             else:
                 # desired stopped
                 if self.playing:
-                    self.update_msg_for_off_signal()
                     self.playing = False
-                    port.send(self.get_msg())
+                    port.send(self.off_msg)
 
         if self.playing is not the_same:
-            m = {False: "not playing",
-                 True: "playing"}
-            self.logger.debug(f'State changed from {m[the_same]} to {m[self.playing]}.')
+            self.logger.debug('State changed from %s to %s.',
+                              'playing' if the_same else 'not playing',
+                              'playing' if self.playing else 'not playing')
+        # trigger mode always sends. scene mode only sends when the state changes.
+        return desired_state is None or self.playing is not the_same
 
-        #always reset to default, I guess..
-        self.reset_to_default_data()
+    def value_size(self):
+        """
+        number of distinct values send_value() accepts for this track's message type, or None if it has no value.
+        """
+        if self.typ in ('control_change', 'aftertouch', 'polytouch'):
+            return curves.SEVEN_BIT
+        if self.typ == 'pitchwheel':
+            return curves.FOURTEEN_BIT
+        return None
+
+    def send_value(self, port, value):
+        """
+        send this track's default message with its value replaced. used by continuous mappings. pitchwheel values are
+        0-16383 here, like the raw 14 bit value. Messages are cached per value, so a sweep only builds each one once.
+        """
+        try:
+            msg = self.value_msgs[value]
+        except KeyError:
+            if self.typ == 'pitchwheel':
+                msg = self.default_msg.copy(pitch=value - 8192)
+            else:
+                msg = self.default_msg.copy(value=value)
+            self.value_msgs[value] = msg
+        port.send(msg)
 
     def get_config_dict(self):
-        return {"label": self.label, "type": self.typ, "data": self.attr_dict}
+        conf = {"label": self.label, "type": self.typ, "data": self.attr_dict}
+        for key, data in (("on_data", self.on_signal_data), ("off_data", self.off_signal_data),
+                          ("record_signal_data", self.record_signal_data)):
+            if data:
+                conf.update({key: data})
+        if self.feedback:
+            conf.update({"feedback": self.feedback})
+        return conf
+
+class ClockTrack(Track):
+    """
+    A track on a clock client. Triggering it drives the clock instead of sending a message.
+    type 'run': on starts the clock and off stops it, so a scene decides whether the clock runs. Toggles in trigger
+    mode.
+    type 'tempo': sets the tempo to 'bpm', or nudges it by 'delta'. Momentary; it's never playing.
+    """
+    def __init__(self, label, attrs, clock):
+        super().__init__(label)
+        self.typ = attrs['type']
+        self.bpm = attrs.get('bpm')
+        self.delta = attrs.get('delta', 0)
+        self.toggle_record = False
+        self.clock = clock
+
+    def value_size(self):
+        return None
+
+    def trigger(self, port, desired_state):
+        """
+        Returns True if a message was sent.
+        """
+        if self.typ == 'tempo':
+            # scene mode turns off every track not in the scene. that means nothing for a tempo track.
+            if desired_state is not False:
+                self.clock.set_tempo(self.bpm if self.bpm is not None else self.clock.bpm + self.delta)
+            return False
+        the_same = self.playing
+        self.playing = not self.playing if desired_state is None else desired_state
+        if self.playing is the_same:
+            return False
+        if self.playing:
+            self.clock.start_clock()
+        else:
+            self.clock.stop_clock()
+        return True
+
+    def get_config_dict(self):
+        conf = {"label": self.label, "type": self.typ}
+        if self.bpm is not None:
+            conf.update({"bpm": self.bpm})
+        if self.delta:
+            conf.update({"delta": self.delta})
+        return conf
+
+class OscTrack(MidiTrack):
+    """
+    A track on an OSC client. data, on_data, off_data and record_signal_data hold an OSC message instead of a midi
+    one: {"address": "/luppp/track/0/clip/play", "args": [0, 0]}, overrides replacing the whole address or args.
+    With "value_arg" in data, continuous mappings replace that arg with the value as a float from 0 to 1.
+    """
+    def __init__(self, label, attrs):
+        super().__init__(label, dict(attrs, type=attrs.get('type', 'osc')))
+
+    def get_msg(self) -> osc.Message:
+        return osc.Message(self.attr_dict.get('address', '/'), self.attr_dict.get('args', []))
+
+    def value_size(self):
+        if 'value_arg' in self.default_data:
+            return curves.FOURTEEN_BIT
+        return None
+
+    def send_value(self, port, value):
+        try:
+            msg = self.value_msgs[value]
+        except KeyError:
+            args = list(self.default_msg.args)
+            args[self.default_data['value_arg']] = value / (curves.FOURTEEN_BIT - 1)
+            msg = osc.Message(self.default_msg.address, args)
+            self.value_msgs[value] = msg
+        port.send(msg)
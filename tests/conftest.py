@@ -0,0 +1,50 @@
+import queue
+
+import pytest
+
+from py_midiplexer import cli
+from py_midiplexer.py_midiplexer import MidiPlexer
+
+# as the entry points do. The tests start real processes, which expect to inherit their state across fork().
+cli.use_fork()
+
+class NullPort(object):
+    def send(self, msg):
+        pass
+
+class MemoryPort(object):
+    """
+    keeps every message sent to it, as mido messages.
+    """
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+def note(i):
+    """
+    attrs for a note_on track on note i.
+    """
+    return {'type': 'note_on', 'data': {'channel': 0, 'note': i, 'velocity': 127}}
+
+def add_client(mux, name, tracks, port=None):
+    """
+    add a midi client to a mux from the fixture below, with an in-process event queue and port (a MemoryPort unless
+    given), so client.process_events() routes in the test process.
+    """
+    mux.add_client(name, tracks=tracks)
+    client = mux.get_client(name)
+    client.event_queue = queue.SimpleQueue()
+    client.active_port = port if port is not None else MemoryPort()
+    return client
+
+@pytest.fixture
+def mux(tmp_path):
+    """
+    a MidiPlexer that stays in the test process: no child processes, and a queue.SimpleQueue for signals so that
+    mux.handle_signals() can be called directly. Modules override this fixture to add their clients and controllers.
+    """
+    m = MidiPlexer(f=str(tmp_path / 'config.json'), daemon_mode=False, metrics_path=str(tmp_path / 'metrics.prom'))
+    m.signal_queue = queue.SimpleQueue()
+    return m
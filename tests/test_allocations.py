@@ -0,0 +1,72 @@
+import tracemalloc
+
+import pytest
+
+from conftest import NullPort, add_client
+from py_midiplexer.mode import Mode
+
+SIGNALS = 1000
+TRACKS = 300
+
+def tracks(n):
+    return {f"t{i}": {"type": "note_on", "data": {"channel": 0, "note": i % 128, "velocity": 127}} for i in range(n)}
+
+@pytest.fixture
+def mux(mux):
+    # in-process queues and a port that keeps nothing, so only our own code shows up.
+    add_client(mux, 'synth', tracks(TRACKS), port=NullPort())
+    mux.add_controller('pads')
+    mux.add_scene('intro')
+    mux.set_scene('intro', {'synth': [f"t{i}" for i in range(0, TRACKS, 2)]})
+    mux.assign_track('pads', 'a', 'synth', 't1')
+    mux.assign_scene('pads', 'b', 'intro')
+    return mux
+
+def route(mux, signal):
+    mux.signal_queue.put(('pads', signal, False))
+    mux.handle_signals()
+    mux.clients[0].process_events()
+
+def allocations(mux, signal):
+    """
+    (blocks still allocated after SIGNALS signals, largest peak while handling one) in py_midiplexer's own code.
+    """
+    for _ in range(100):
+        route(mux, signal)
+    only_ours = [tracemalloc.Filter(True, '*/py_midiplexer/*')]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(only_ours)
+        peak = 0
+        for _ in range(SIGNALS):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            route(mux, signal)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        after = tracemalloc.take_snapshot().filter_traces(only_ours)
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return retained, peak
+
+@pytest.mark.parametrize('mode, signal', [(Mode.TRIGGER, 'a'), (Mode.SCENE, 'b')])
+def test_signal_path_allocations(mux, mode, signal):
+    mux.mode = mode
+    retained, peak = allocations(mux, signal)
+    # nothing is kept per signal, and nothing on the way scales with the number of tracks: a list of the scene's 150
+    # tracks alone is over 1 KB.
+    assert retained / SIGNALS < 0.01
+    assert peak < 1024
+
+class FailingPort(object):
+    def send(self, msg):
+        raise OSError('port went away')
+
+def test_failed_send_clears_scene_marks(mux):
+    client = mux.clients[0]
+    with pytest.raises(OSError):
+        client.apply_event(FailingPort(), ['t0', 't2'], True)
+    assert not any(track.in_event for track in client.tracks.values())
+    # so the next scene still turns off every track outside it.
+    client.apply_event(NullPort(), ['t4'], True)
+    assert [label for label, track in client.tracks.items() if track.playing] == ['t4']
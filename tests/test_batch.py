@@ -0,0 +1,29 @@
+import pytest
+
+from conftest import add_client, note
+
+@pytest.fixture
+def mux(mux):
+    mux.add_controller('pads', signal_map={'90 00 7f': 'a'})
+    add_client(mux, 'synth', {'t1': note(1)})
+    return mux
+
+def test_apply_batch(mux):
+    batch = {"tracks": {"synth": {"t2": note(2)}},
+             "signals": {"pads": {"90 01 7f": "b"}},
+             "triggers": [["pads", "a", "synth", "t1"], ["pads", "b", "synth", "t2"]],
+             "scenes": {"intro": {"synth": ["t1", "t2"]}},
+             "scene_triggers": [["pads", "b", "intro"]]}
+    result = mux.apply_batch(batch)
+    assert 'errors' not in result, result
+    assert mux.controller_signal_trigger_map == {'pads': {'a': {'synth': ['t1']}, 'b': {'synth': ['t2']}}}
+    assert mux.scenes == {'intro': {'synth': ['t1', 't2']}}
+    assert mux.controller_signal_scene_map == {'pads': {'b': 'intro'}}
+
+def test_check_batch_signals(mux):
+    batch = {"triggers": [["pads", "nope", "synth", "t1"]],
+             "scene_triggers": [["pads", "gone", "intro"]]}
+    assert mux.apply_batch(batch) == {"errors": ["Trigger nope: no signal 'nope' on controller 'pads'.",
+                                                 "Scene trigger gone: no signal 'gone' on controller 'pads'."]}
+    assert mux.controller_signal_trigger_map == {}
+    assert mux.controller_signal_scene_map == {}
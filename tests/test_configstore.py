@@ -0,0 +1,25 @@
+from py_midiplexer.configstore import ConfigStore
+
+def test_read_published():
+    store = ConfigStore(capacity=1024)
+    assert store.read() is None
+    store.publish({'mode': 1})
+    assert store.read() == {'mode': 1}
+    store.publish({'mode': 2})
+    assert store.read() == {'mode': 2}
+
+def test_read_gives_up_on_a_stuck_writer():
+    store = ConfigStore(capacity=1024)
+    store.RETRIES = 10
+    store.publish({'mode': 1})
+    assert store.read() == {'mode': 1}
+    # a writer that died half way through publishing the next generation.
+    store.header[ConfigStore.SEQ] += 1
+    store.header[ConfigStore.GENERATION] += 1
+    assert store.read() == {'mode': 1}
+
+def test_read_stuck_before_first_publish():
+    store = ConfigStore(capacity=1024)
+    store.RETRIES = 10
+    store.header[ConfigStore.SEQ] += 1
+    assert store.read() is None
@@ -0,0 +1,68 @@
+import pytest
+
+from py_midiplexer import controller as controller_module
+from py_midiplexer import metrics
+from py_midiplexer.debounce import Debouncer
+
+MS = 1000000
+
+DEBOUNCE = {'duplicate_ms': 5, 'window_ms': 30, 'signals': {'fast': 0, 'slow': 100}}
+SIGNAL_MAP = {'90 00 7f': 'a', '90 01 7f': 'a', '90 02 7f': 'fast', '90 03 7f': 'slow', '90 04 7f': 'slow'}
+
+# (now ns, message key, signal let through or None, why)
+STEPS = [
+    (0, '90 00 7f', 'a', None),
+    (5 * MS - 1, '90 00 7f', None, 'duplicate'),
+    # the duplicate window is over, but it's still within a's bounce window.
+    (5 * MS, '90 00 7f', None, 'bounce'),
+    # a different message for the same signal is only a bounce.
+    (10 * MS, '90 01 7f', None, 'bounce'),
+    (30 * MS - 1, '90 01 7f', None, 'bounce'),
+    (30 * MS, '90 00 7f', 'a', None),
+    # a window of 0 turns bounce checks off for fast, but not duplicate checks.
+    (31 * MS, '90 02 7f', 'fast', None),
+    (32 * MS, '90 02 7f', None, 'duplicate'),
+    (37 * MS, '90 02 7f', 'fast', None),
+    (38 * MS, '90 03 7f', 'slow', None),
+    (138 * MS - 1, '90 04 7f', None, 'bounce'),
+    (138 * MS, '90 03 7f', 'slow', None),
+    (139 * MS, '90 7f 7f', None, 'unmapped'),
+]
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    the controller's monotonic clock, set by the test.
+    """
+    clock = {'now_ns': 0}
+    monkeypatch.setattr(controller_module.time, 'monotonic_ns', lambda: clock['now_ns'])
+    return clock
+
+def test_lookup_drops_and_counts(mux, clock):
+    mux.add_controller('pads', signal_map=dict(SIGNAL_MAP), debounce=DEBOUNCE)
+    pads = mux.controllers[0]
+    for now_ns, key, signal, why in STEPS:
+        clock['now_ns'] = now_ns
+        assert pads.lookup(key) == signal, (now_ns, key, why)
+    counters = pads.counters.get_dict()
+    whys = [why for _, _, _, why in STEPS]
+    assert counters['signals_received'] == len(STEPS)
+    assert counters['signals_duplicate'] == whys.count('duplicate')
+    assert counters['signals_debounced'] == whys.count('bounce')
+    assert counters['signals_dropped'] == whys.count('unmapped')
+
+@pytest.mark.parametrize('now_ns, duplicate', [(0, True), (5 * MS - 1, True), (5 * MS, False)])
+def test_duplicate_window_edge(now_ns, duplicate):
+    debouncer = Debouncer(duplicate_ms=5)
+    assert not debouncer.duplicate('90 00 7f', 0)
+    assert debouncer.duplicate('90 00 7f', now_ns) == duplicate
+    # only the last message let through counts.
+    assert not debouncer.duplicate('90 01 7f', now_ns)
+
+def test_nothing_checked_by_default():
+    debouncer = Debouncer(signals={'slow': 100})
+    for now_ns in (0, 0, 1):
+        assert not debouncer.duplicate('90 00 7f', now_ns)
+        assert not debouncer.bounce('a', now_ns)
+    assert not debouncer.bounce('slow', 0)
+    assert debouncer.bounce('slow', 100 * MS - 1)
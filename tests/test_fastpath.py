@@ -0,0 +1,68 @@
+import queue
+
+import pytest
+
+from conftest import add_client, note
+from py_midiplexer.mode import Mode
+
+@pytest.fixture
+def mux(mux):
+    add_client(mux, 'synth', {'t1': note(1), 't2': note(2)})
+    add_client(mux, 'drums', {'d1': note(36)})
+    # after the clients, so the controller holds their (in-process) event queues.
+    mux.add_controller('pads')
+    mux.assign_track('pads', 'a', 'synth', 't1')
+    mux.assign_track('pads', 'a', 'synth', 't2')
+    mux.assign_track('pads', 'a', 'drums', 'd1')
+    mux.add_scene('intro')
+    mux.set_scene('intro', {'synth': ['t1']})
+    mux.assign_scene('pads', 'b', 'intro')
+    mux.assign_track('pads', 's', 'synth', 't1')
+    mux.assign_script('pads', 's', {'code': 'pass'})
+    mux.assign_mode_switch('pads', 'm')
+    return mux
+
+def push_routes(mux):
+    # what MidiPlexer.push_routes() sends each controller when it runs as a daemon.
+    controller = mux.controllers[0]
+    controller.set_routes(mux.fast_trigger_map(controller.name), mux.mode_switch.get(controller.name, []),
+                          mux.quantize)
+    return controller
+
+def drain(mux):
+    events = {}
+    for client in mux.clients:
+        while True:
+            try:
+                events.setdefault(client.name, []).append(client.event_queue.get_nowait())
+            except queue.Empty:
+                break
+    return events
+
+@pytest.mark.parametrize('quantize', [0, 4])
+def test_fast_route_matches_midiplexer(mux, quantize):
+    mux.quantize = quantize
+    controller = push_routes(mux)
+    mux.signal_queue.put(('pads', 'a', False))
+    mux.handle_signals()
+    routed = drain(mux)
+    assert controller.fast_route('a')
+    assert drain(mux) == routed
+    assert routed['synth'] == [(['t1'], None, quantize), (['t2'], None, quantize)]
+
+def test_mode_switch_turns_fast_path_off(mux):
+    controller = push_routes(mux)
+    assert controller.fast_route('m')
+    assert mux.mode == Mode.SCENE
+    assert not controller.fast_route('a')
+    assert drain(mux) == {'synth': [], 'drums': []}
+    assert controller.fast_route('m')
+    assert mux.mode == Mode.TRIGGER
+    assert controller.fast_route('a')
+
+def test_scripted_and_scene_signals_stay_with_midiplexer(mux):
+    controller = push_routes(mux)
+    assert set(controller.fast_routes) == {'a'}
+    assert not controller.fast_route('s')
+    assert not controller.fast_route('b')
+    assert drain(mux) == {'synth': [], 'drums': []}
@@ -0,0 +1,59 @@
+import pytest
+
+from py_midiplexer import gestures
+from py_midiplexer.gestures import GestureEngine
+from py_midiplexer.metrics import JitterStats
+
+MS = 1000000
+
+SWITCH = {'release': 'p_off', 'down': 'down', 'up': 'up', 'tap': 'tap'}
+HOLD = {'release': 'p_off', 'tap': 'tap', 'hold': 'hold', 'hold_ms': 500}
+DOUBLE = {'release': 'p_off', 'tap': 'tap', 'double_tap': 'double', 'double_tap_ms': 250}
+CHORD = {'switches': {'a': {'release': 'a_off', 'tap': 'a_tap'}, 'b': {'release': 'b_off', 'tap': 'b_tap'}},
+         'chords': [{'signals': ['a', 'b'], 'emit': 'ab', 'window_ms': 50}]}
+
+def switch(spec):
+    return {'switches': {'p': spec}}
+
+# (options, [(step, ms, signals out)], tap latency in ms or None if there's no tap). a step is a signal to feed, or
+# None to poll.
+CASES = {
+    'press only': (switch({'tap': 'tap'}), [('p', 0, ['tap']), (None, 1000, [])], 0),
+    'down and up': (switch(SWITCH), [('p', 0, ['down', 'tap']), ('p_off', 30, ['up'])], 0),
+    'tap before hold': (switch(HOLD), [('p', 0, []), (None, 499, []), ('p_off', 120, ['tap']), (None, 1000, [])],
+                        120),
+    'hold': (switch(HOLD), [('p', 0, []), (None, 499, []), (None, 500, ['hold']), ('p_off', 700, [])], None),
+    'single tap waits out the double tap': (switch(DOUBLE), [('p', 0, []), ('p_off', 40, []), (None, 289, []),
+                                                            (None, 290, ['tap'])], 290),
+    'double tap': (switch(DOUBLE), [('p', 0, []), ('p_off', 40, []), ('p', 200, ['double']), ('p_off', 240, []),
+                                    (None, 1000, [])], None),
+    # the release got lost, so the second press starts the hold over.
+    'lost release': (switch(HOLD), [('p', 0, []), ('p', 300, []), (None, 500, []), (None, 800, ['hold']),
+                                    ('p_off', 900, [])], None),
+    'chord': (CHORD, [('a', 0, []), ('b', 20, ['ab']), ('a_off', 100, []), ('b_off', 110, []), (None, 1000, [])],
+              None),
+    'chord window runs out': (CHORD, [('a', 0, []), (None, 49, []), (None, 50, ['a_tap']), ('a_off', 80, [])], 50),
+    'released before the chord': (CHORD, [('a', 0, []), ('a_off', 10, ['a_tap']), (None, 1000, [])], 10),
+    'not a gesture': (CHORD, [('x', 0, ['x'])], None),
+}
+
+@pytest.mark.parametrize('options, steps, tap_ms', CASES.values(), ids=CASES.keys())
+def test_gestures(options, steps, tap_ms):
+    latency = JitterStats('tap')
+    engine = GestureEngine(options, latency=latency)
+    for signal, ms, expected in steps:
+        now_ns = ms * MS
+        out = engine.poll(now_ns) if signal is None else engine.feed(signal, now_ns)
+        assert out == expected, (signal, ms)
+    stats = latency.get_dict()
+    if tap_ms is None:
+        assert stats['tap_ticks'] == 0
+    else:
+        assert stats['tap_ticks'] == 1
+        assert stats['tap_jitter_max_us'] == tap_ms * 1000
+    assert all(s.state == gestures.IDLE for s in engine.switches.values())
+
+def test_signals():
+    assert GestureEngine(CHORD).signals() == {'ab', 'a_tap', 'b_tap'}
+    # no hold without a release to end it.
+    assert GestureEngine(switch({'tap': 'tap', 'hold': 'hold'})).signals() == {'tap'}
@@ -0,0 +1,27 @@
+import logging
+import multiprocessing
+import time
+
+from py_midiplexer.logprocess import DroppingQueueHandler
+
+def test_full_queue_drops_and_counts():
+    log_queue = multiprocessing.Queue(2)
+    dropped = multiprocessing.Value('L', 0)
+    logger = logging.getLogger('test_logprocess')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = DroppingQueueHandler(log_queue, dropped)
+    logger.addHandler(handler)
+    try:
+        logger.info('first')
+        logger.info('second')
+        t0 = time.monotonic()
+        for i in range(5):
+            logger.info('overflow %d', i)
+        # a full queue costs no more than a failed put_nowait, never a wait on the log process.
+        assert time.monotonic() - t0 < 0.5
+    finally:
+        logger.removeHandler(handler)
+    assert dropped.value == 5
+    assert [log_queue.get(timeout=1).getMessage() for _ in range(2)] == ['first', 'second']
+    assert log_queue.empty()
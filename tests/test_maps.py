@@ -0,0 +1,37 @@
+import pytest
+
+from conftest import add_client, note
+from py_midiplexer import exceptions
+
+@pytest.fixture
+def mux(mux):
+    add_client(mux, 'synth', {'t1': note(1), 't2': note(2)})
+    mux.add_controller('pads')
+    mux.assign_track('pads', 'a', 'synth', 't1')
+    mux.assign_track('pads', 'a', 'synth', 't2')
+    mux.add_scene('intro')
+    mux.set_scene('intro', {'synth': ['t1']})
+    mux.add_scene('outro')
+    mux.set_scene('outro', {'synth': ['t2']})
+    mux.assign_scene('pads', 'b', 'intro')
+    return mux
+
+def test_delete_trigger_of_an_unmapped_client_or_track(mux):
+    with pytest.raises(exceptions.NoSuchSignal):
+        mux.delete_trigger('pads', 'nope')
+    with pytest.raises(exceptions.NoSuchClient):
+        mux.delete_trigger('pads', 'a', 'drums')
+    with pytest.raises(exceptions.NoSuchTrack):
+        mux.delete_trigger('pads', 'a', 'synth', 't3')
+    assert mux.controller_signal_trigger_map == {'pads': {'a': {'synth': ['t1', 't2']}}}
+    mux.delete_trigger('pads', 'a', 'synth', 't1')
+    assert mux.controller_signal_trigger_map == {'pads': {'a': {'synth': ['t2']}}}
+    assert mux.where_used('synth', 't1')['signals'] == []
+
+def test_rename_scene_onto_an_existing_one(mux):
+    mux.rename_scene('intro', 'outro')
+    assert mux.scenes == {'intro': {'synth': ['t1']}, 'outro': {'synth': ['t2']}}
+    assert mux.controller_signal_scene_map == {'pads': {'b': 'intro'}}
+    mux.rename_scene('intro', 'verse')
+    assert mux.scenes == {'verse': {'synth': ['t1']}, 'outro': {'synth': ['t2']}}
+    assert mux.controller_signal_scene_map == {'pads': {'b': 'verse'}}
@@ -0,0 +1,80 @@
+import socket
+import time
+
+import mido
+import pytest
+
+from py_midiplexer.node import (SEQ_MASK, Node, NodeInputPort, NodeLink, NodeOutputPort, Sequence)
+
+# (sequence numbers in arrival order, accepted?, lost, late)
+SEQUENCES = {
+    'in order': ([0, 1, 2, 3], [True] * 4, 0, 0),
+    'gap': ([0, 1, 4, 5], [True] * 4, 2, 0),
+    # 2 was counted lost when 3 turned up. it's too late to apply now.
+    'late': ([0, 1, 3, 2, 4], [True, True, True, False, True], 1, 1),
+    'wraparound': ([SEQ_MASK - 1, SEQ_MASK, 0, 1], [True] * 4, 0, 0),
+    'gap across wraparound': ([SEQ_MASK - 1, 1], [True] * 2, 2, 0),
+    'late across wraparound': ([SEQ_MASK, 1, 0, 2], [True, True, False, True], 1, 1),
+    # the other end restarted. start over from it without counting anything.
+    'resync': ([5000, 5001, 0, 1], [True] * 4, 0, 0),
+    # expecting 5001, so RESYNC back from that is still late, and one more is a restart.
+    'latest late': ([5000, 5001 - Sequence.RESYNC], [True, False], 0, 1),
+    'earliest resync': ([5000, 5000 - Sequence.RESYNC, 5001 - Sequence.RESYNC], [True] * 3, 0, 0),
+}
+
+@pytest.mark.parametrize('seqs, accepted, lost, late', SEQUENCES.values(), ids=SEQUENCES.keys())
+def test_sequence(seqs, accepted, lost, late):
+    sequence = Sequence()
+    assert [sequence.accept(seq) for seq in seqs] == accepted
+    assert (sequence.lost, sequence.late) == (lost, late)
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def poll_until(port, count, timeout=5):
+    received = []
+    deadline = time.monotonic() + timeout
+    while len(received) < count and time.monotonic() < deadline:
+        msg = port.poll()
+        if msg is None:
+            time.sleep(0.001)
+        else:
+            received.append(msg)
+    return received
+
+def test_echo_node_round_trip():
+    udp_port = free_udp_port()
+    node = Node(outputs={'echo': udp_port}, host='127.0.0.1', echo=True)
+    node.start()
+    link = NodeLink('127.0.0.1', udp_port)
+    output = NodeOutputPort(link)
+    inp = NodeInputPort(link)
+    try:
+        # ping until the node is up and has answered.
+        deadline = time.monotonic() + 5
+        while link.clock.offset is None and time.monotonic() < deadline:
+            link.next_ping = 0
+            output.service()
+            time.sleep(0.01)
+        assert link.clock.offset is not None
+        # both ends read the same monotonic clock.
+        assert abs(link.clock.offset) < link.clock.rtt + 1000000
+        sent = [mido.Message('note_on', note=n, velocity=100) for n in range(3)]
+        output.begin_bundle()
+        for msg in sent:
+            output.send(msg)
+        output.end_bundle()
+        sent.append(mido.Message('control_change', control=7, value=64))
+        output.send(sent[-1])
+        assert poll_until(inp, len(sent)) == sent
+        stats = link.stats.get_dict()
+        assert stats['node_up'] == 1
+        assert stats['node_records_lost'] == 0
+        assert stats['node_remote_records_lost'] == 0
+        # one latency sample per echoed record: the bundle and the single send.
+        assert stats['node_latency_ticks'] == 2
+    finally:
+        node.stop()
+        inp.close()
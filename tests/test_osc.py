@@ -0,0 +1,56 @@
+import socket
+
+from py_midiplexer import metrics, osc
+
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(1)
+    return sock
+
+def test_codec():
+    msg = osc.Message('/luppp/track/0/clip/play', [0, 1.5, 'x', True])
+    assert osc.decode(msg.packet) == [('/luppp/track/0/clip/play', [0, 1.5, 'x', True])]
+    bundle = osc.encode_bundle([msg.packet, osc.Message('/stop').packet])
+    assert [address for address, args in osc.decode(bundle)] == ['/luppp/track/0/clip/play', '/stop']
+
+def test_bundle():
+    sock = receiver()
+    port = osc.OscPort(*sock.getsockname())
+    port.begin_bundle()
+    for i in range(4):
+        port.send(osc.Message('/track', [i]))
+    port.end_bundle()
+    assert osc.decode(sock.recv(65536)) == [('/track', [i]) for i in range(4)]
+
+def test_oversized_bundle_is_split():
+    sock = receiver()
+    counters = metrics.Counters()
+    port = osc.OscPort(*sock.getsockname(), counters=counters)
+    # about 100 KB, over the 64 KB a datagram can hold.
+    msgs = [osc.Message('/clip', [i, b'x' * 1000]) for i in range(100)]
+    port.begin_bundle()
+    for msg in msgs:
+        port.send(msg)
+    port.end_bundle()
+    got = []
+    while len(got) < len(msgs):
+        got += osc.decode(sock.recv(65536))
+    assert [args[0] for address, args in got] == list(range(100))
+    assert counters.values[metrics.SENDS_FAILED] == 0
+
+def test_send_with_nothing_listening():
+    sock = receiver()
+    address = sock.getsockname()
+    sock.close()
+    counters = metrics.Counters()
+    port = osc.OscPort(*address, counters=counters)
+    # the refusal comes back on the send after the one that was refused.
+    for i in range(3):
+        port.send(osc.Message('/track', [i]))
+        port.begin_bundle()
+        port.send(osc.Message('/track', [i]))
+        port.send(osc.Message('/track', [i]))
+        port.end_bundle()
+    assert counters.values[metrics.SENDS_FAILED] > 0
@@ -0,0 +1,16 @@
+import os
+
+from py_midiplexer.profiling import Profiler, merge_profiles
+
+def test_merge_profiles_by_kind(tmp_path):
+    outdir = str(tmp_path)
+    # say synth is a MidiClient and lights an OscClient. both profile as 'client'.
+    for kind, name in (('mux', 'mux'), ('controller', 'pads'), ('client', 'synth'), ('client', 'lights')):
+        profiler = Profiler(kind, name)
+        profiler.start(0, outdir)
+        sum(range(1000))
+        assert profiler.stop() is not None
+    reports = merge_profiles(outdir)
+    assert [os.path.basename(r) for r in reports] == ['mux.txt', 'controller.txt', 'client.txt']
+    with open(os.path.join(outdir, 'client.txt')) as f:
+        assert f.readline() == 'client: merged 2 process(es)\n'
@@ -0,0 +1,14 @@
+import logging
+
+from py_midiplexer import metrics, realtime
+
+logger = logging.getLogger('test_realtime')
+
+def test_apply_nothing():
+    applied = realtime.apply({}, logger)
+    assert applied['mlock'] is False
+    assert applied['cpus']
+
+def test_apply_without_proc(monkeypatch):
+    monkeypatch.setattr(metrics, 'read_sched', lambda pid: None)
+    assert realtime.apply({}, logger)['mlock'] is None
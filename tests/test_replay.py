@@ -0,0 +1,88 @@
+import queue
+
+from conftest import note
+from py_midiplexer import osc
+from py_midiplexer.py_midiplexer import MidiPlexer
+from py_midiplexer.recording import MemoryPort, RecordWriter, read_recording, replay
+
+def write_config(tmp_path, clients):
+    """
+    save a config with controller pads, where signal a triggers track run of each client in clients:
+    {name: (type, tracks, options)}.
+    """
+    path = str(tmp_path / 'config.json')
+    m = MidiPlexer(f=path, daemon_mode=False, metrics_path=str(tmp_path / 'metrics.prom'))
+    m.add_controller('pads')
+    for name, (typ, tracks, options) in clients.items():
+        m.add_client(name, type=typ, tracks=tracks, **options)
+        m.assign_track('pads', 'a', name, 'run')
+    m.save(path)
+    return path
+
+def write_recording(tmp_path, sends):
+    """
+    signal a twice, each followed by sends: [[(client, bytes)], [(client, bytes)]].
+    """
+    path = str(tmp_path / 'recording.pmxr')
+    with open(path, 'wb') as f:
+        writer = RecordWriter(f)
+        writer.write_header({'mode': 'TRIGGER'})
+        t = 0
+        for after in sends:
+            t += 1000000
+            writer.write_signal(t, 'pads', 'a')
+            for client, data in after:
+                writer.write_send(t, client, data)
+    return path
+
+def test_replay_clock(tmp_path):
+    config = write_config(tmp_path, {'clock': ('clock', {'run': {'type': 'run'}}, {})})
+    recording = write_recording(tmp_path, [[('clock', b'\xfa')], [('clock', b'\xfc')]])
+    results = replay(recording, config, speed=0)
+    assert results['match'], results
+    assert results['sends'] == 2
+
+def test_replay_osc_and_node(tmp_path):
+    config = write_config(tmp_path, {
+        'looper': ('osc', {'run': {'data': {'address': '/play', 'args': [0]}}}, {'osc': {'port': 9}}),
+        'remote': ('node', {'run': {'type': 'note_on', 'data': {'channel': 0, 'note': 1, 'velocity': 127}}},
+                   {'node': {'host': '127.0.0.1', 'port': 9}})})
+    play = osc.encode_message('/play', [0])
+    sends = [('looper', play), ('remote', b'\x90\x01\x7f')]
+    recording = write_recording(tmp_path, [sends, sends])
+    results = replay(recording, config, speed=0)
+    assert results['match'], results
+    assert results['sends'] == 4
+
+def test_clock_records_start_and_stop_but_not_ticks(mux):
+    mux.add_client('clock', type='clock', tracks={'run': {'type': 'run'}}, output={'burst': 4})
+    clock = mux.clients[0]
+    assert clock.output_options is None
+    clock.port = MemoryPort()
+    clock.record_queue = queue.SimpleQueue()
+    clock.recording = True
+    clock.update_port()
+    clock.start_clock()
+    clock.tick()
+    clock.tick()
+    clock.stop_clock()
+    assert clock.port.sent == [b'\xfa', b'\xf8', b'\xf8', b'\xfc']
+    recorded = []
+    while not clock.record_queue.empty():
+        recorded.append(clock.record_queue.get()[3])
+    assert recorded == [b'\xfa', b'\xfc']
+
+def test_recording_header_reads_trackstate_board(mux, tmp_path):
+    mux.add_client('synth', tracks={'a': note(60), 'b': note(61), 'c': note(62)})
+    # as the client process would publish them: a playing, b stopped, c never published. No client process is
+    # running, so asking one would never get an answer.
+    board = mux.clients[0].trackstate
+    board[0] = 1 | 2
+    board[1] = 1
+    path = str(tmp_path / 'recording.pmxr')
+    mux.start_recording(path)
+    mux.stop_recording()
+    header, signals, sends = read_recording(path)
+    assert header['trackstate'] == {'synth': ['a']}
+    mux.create_scene_from_current('now')
+    assert mux.scenes['now'] == {'synth': ['a']}
@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import add_client, note
+from py_midiplexer.mode import Mode
+
+@pytest.fixture
+def mux(mux):
+    client = add_client(mux, 'synth', {label: note(i) for i, label in enumerate(('t1', 't2', 't3'))})
+    client.tracks['t1'].playing = True
+    return mux
+
+def playing(mux):
+    return {label for label, track in mux.clients[0].tracks.items() if track.playing}
+
+@pytest.mark.parametrize('mode', [Mode.TRIGGER, Mode.SCENE])
+def test_script_trigger_sets_one_track(mux, mode):
+    mux.mode = mode
+    client = mux.clients[0]
+    mux.apply_script_action(('trigger', 'synth', 't2', True))
+    client.process_events()
+    assert playing(mux) == {'t1', 't2'}
+    mux.apply_script_action(('trigger', 'synth', 't2', True))
+    client.process_events()
+    assert playing(mux) == {'t1', 't2'}
+    mux.apply_script_action(('trigger', 'synth', 't1', False))
+    client.process_events()
+    assert playing(mux) == {'t2'}
+    mux.apply_script_action(('trigger', 'synth', 't3', None))
+    client.process_events()
+    assert playing(mux) == {'t2', 't3'}
+    mux.apply_script_action(('trigger', 'synth', 't3', None))
+    client.process_events()
+    assert playing(mux) == {'t2'}
+    # one message per change, none for the track that was already on.
+    assert len(client.active_port.sent) == 4
@@ -0,0 +1,92 @@
+import multiprocessing
+import multiprocessing.connection
+import signal
+import time
+
+from py_midiplexer.supervisor import Supervisor, join_all
+
+class Child(multiprocessing.Process):
+    """
+    stands in for a controller or client: lives for seconds, with a heartbeat the test sets itself.
+    """
+    def __init__(self, name, seconds=0.0):
+        super().__init__()
+        self.name = name
+        self.seconds = seconds
+        self.heartbeat = multiprocessing.RawValue('d', 0)
+
+    def run(self):
+        time.sleep(self.seconds)
+
+def died(child):
+    child.start()
+    multiprocessing.connection.wait([child.sentinel], 5)
+    return child
+
+def test_restarts_until_max_restarts():
+    supervisor = Supervisor(hang_timeout=0, max_restarts=2, restart_window=60)
+    for _ in range(2):
+        child = died(Child('synth'))
+        assert supervisor.check([child]) == [child]
+    child = died(Child('synth'))
+    assert supervisor.check([child]) == []
+    assert ('Child', 'synth') in supervisor.abandoned
+    # given up on for good, whatever its replacement does.
+    assert supervisor.check([died(Child('synth'))]) == []
+    # other children are still watched.
+    other = died(Child('drums'))
+    assert supervisor.check([other]) == [other]
+
+def test_restart_window():
+    supervisor = Supervisor(hang_timeout=0, max_restarts=1, restart_window=0.2)
+    child = died(Child('synth'))
+    assert supervisor.check([child]) == [child]
+    # the last restart has left the window, so this one doesn't count against it.
+    time.sleep(0.3)
+    child = died(Child('synth'))
+    assert supervisor.check([child]) == [child]
+    child = died(Child('synth'))
+    assert supervisor.check([child]) == []
+    assert len(supervisor.restarts[('Child', 'synth')]) == 1
+
+def test_kills_a_child_with_a_stale_heartbeat():
+    supervisor = Supervisor(hang_timeout=1, max_restarts=5)
+    hung = Child('synth', seconds=30)
+    waiting = Child('drums', seconds=30)
+    hung.start()
+    waiting.start()
+    try:
+        hung.heartbeat.value = time.monotonic() - 2
+        # 0 means blocking on purpose, and never counts as hung.
+        waiting.heartbeat.value = 0
+        dead = supervisor.check([hung, waiting])
+        deadline = time.monotonic() + 5
+        while not dead and time.monotonic() < deadline:
+            time.sleep(0.01)
+            dead = supervisor.check([hung, waiting])
+        assert dead == [hung]
+        assert hung.exitcode == -signal.SIGKILL
+        assert waiting.is_alive()
+    finally:
+        for c in (hung, waiting):
+            c.kill()
+            c.join()
+
+def test_join_all_stops_at_the_deadline():
+    quick = Child('quick', seconds=0.05)
+    stuck = Child('stuck', seconds=30)
+    quick.start()
+    stuck.start()
+    try:
+        t0 = time.monotonic()
+        assert join_all([quick, stuck], 0.3) == [stuck]
+        assert 0.3 <= time.monotonic() - t0 < 2
+        assert quick.exitcode == 0
+        assert stuck.is_alive()
+    finally:
+        stuck.kill()
+        stuck.join()
+    # nothing left running, so no wait at all.
+    t0 = time.monotonic()
+    assert join_all([quick, stuck], 5) == []
+    assert time.monotonic() - t0 < 1
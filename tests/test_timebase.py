@@ -0,0 +1,62 @@
+import time
+
+from conftest import add_client, note
+from py_midiplexer.timebase import Timebase
+
+def test_next_boundary():
+    timebase = Timebase()
+    assert timebase.next_boundary(1000, 1) is None
+    # 120 bpm from beat 0 at t=0.
+    timebase.update(0, 0, 500000000)
+    assert timebase.next_boundary(100000000, 1) == 500000000
+    assert timebase.next_boundary(100000000, 4) == 2000000000
+
+def test_read_gives_up_on_a_stuck_writer():
+    timebase = Timebase()
+    timebase.RETRIES = 10
+    timebase.update(0, 0, 500000000)
+    assert timebase.read() == (0, 0, 500000000)
+    # a writer that died half way through the next update.
+    timebase.values[Timebase.SEQ] += 1
+    timebase.values[Timebase.NS_PER_BEAT] = 250000000
+    assert timebase.read() == (0, 0, 500000000)
+
+class TimedPort(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append((time.monotonic_ns(), msg.note))
+
+def test_quantised_triggers_land_on_the_grid(mux):
+    client = add_client(mux, 'synth', {f"t{i}": note(i) for i in range(8)}, port=TimedPort())
+    # a fast clock so the test doesn't wait long: 20 ms beats from a beat 0 that's just gone.
+    ns_per_beat = 20000000
+    anchor_ns = time.monotonic_ns()
+    mux.timebase.update(anchor_ns, 0, ns_per_beat)
+    quantize = {i: 1 if i % 2 else 4 for i in range(8)}
+    release = {}
+
+    def poll(seconds):
+        # the client loop: release whatever is due, every half a millisecond.
+        until = time.monotonic() + seconds
+        while time.monotonic() < until:
+            client.release_due()
+            time.sleep(0.0005)
+
+    for i in range(8):
+        client.event_queue.put(([f"t{i}"], None, quantize[i]))
+        client.process_events()
+        release.update({int(tracklist[0][1:]): release_ns for release_ns, _, tracklist, _ in client.schedule})
+        poll(0.007)
+    poll(0.1)
+    assert not client.schedule
+    sent = client.active_port.sent
+    assert sorted(i for _, i in sent) == list(range(8))
+    for sent_ns, i in sent:
+        # held for the next beat, or the next bar for quantize 4...
+        assert (release[i] - anchor_ns) % (quantize[i] * ns_per_beat) == 0
+        # ...and sent never before it, and no more than a few loops after.
+        late = sent_ns - release[i]
+        assert 0 <= late < 5000000, (i, late)
+    assert client.release_jitter.get_dict()['release_ticks'] == 8